@@ -0,0 +1,117 @@
+"""
+Measures how fast games run as the teams get bigger.
+
+Plays ctftemplate.py headless with 10, 100 and 1000 players a team and
+reports ticks per second for each. By default the field grows with the
+teams so players are about as crowded as in the default game.
+
+    python benchmarks/scaling.py
+    python benchmarks/scaling.py --ticks 50 --sizes 10,100 --batched
+"""
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import headless
+headless.install()
+
+import ctf
+
+TEMPLATE = os.path.join(ROOT, 'ctftemplate.py')
+
+# Players per team to try.
+SIZES = [10, 100, 1000]
+
+def scaledWorldSize(team_size):
+    """
+    Returns the field width that keeps team_size players a team
+    as crowded as the default game, to the nearest whole unit like
+    every other world size.
+    """
+    width = ctf.WORLD_SIZE * math.sqrt(float(team_size) / ctf.TEAM_SIZE)
+    return int(round(width))
+
+def measure(job):
+    """
+    Builds one game and steps it.
+    job is a (bot file, team size, field width, ticks, batched, seed) tuple.
+    Returns (setup seconds, ticks per second).
+    """
+    path, team_size, world_size, ticks, batched, seed = job
+    config = ctf.CTFConfig(team_size=team_size, world_size=world_size,
+                           batched_movement=batched)
+
+    start = time.time()
+    controller = headless.run(path, max_time=0, seed=seed, config=config)
+    setup = time.time() - start
+
+    world = controller._world
+    start = time.time()
+    for i in range(ticks):
+        world.step()
+    elapsed = time.time() - start
+
+    return setup, ticks / elapsed
+
+def runScaling(path=TEMPLATE, sizes=SIZES, ticks=100, world_size=None,
+        batched=False, seed=1, out=sys.stdout):
+    """
+    Measures every team size in sizes and prints a table.
+    world_size fixes the field width, by default it grows with the teams.
+    Returns a list of (team size, field width, setup seconds, ticks/sec).
+    """
+    results = []
+    out.write('%10s %8s %8s %10s %10s\n' %
+              ('team size', 'players', 'field', 'setup (s)', 'ticks/sec'))
+
+    for team_size in sizes:
+        width = world_size
+        if width is None:
+            width = scaledWorldSize(team_size)
+
+        # Fresh process for every size, so one size's garbage
+        # doesn't get timed with the next.
+        pool = multiprocessing.Pool(1)
+        try:
+            setup, rate = pool.apply(measure,
+                    ((path, team_size, width, ticks, batched, seed),))
+        finally:
+            pool.close()
+            pool.join()
+
+        out.write('%10d %8d %8d %10.2f %10.2f\n' %
+                  (team_size, 2 * team_size, width, setup, rate))
+        out.flush()
+        results.append((team_size, width, setup, rate))
+
+    return results
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [options] [BOT_FILE]')
+    parser.add_option('--sizes', default=','.join(map(str, SIZES)),
+            help='comma separated players per team to try')
+    parser.add_option('--ticks', type='int', default=100,
+            help='steps to time at each size')
+    parser.add_option('--world-size', type='int', default=None,
+            help='fixed field width, by default it grows with the teams')
+    parser.add_option('--batched', action='store_true', default=False,
+            help='move every player in one vectorized pass')
+    parser.add_option('--seed', type='int', default=1,
+            help='seed for every game')
+    options, args = parser.parse_args()
+
+    if len(args) > 1:
+        parser.error('expected at most one bot file')
+
+    path = args and args[0] or TEMPLATE
+    sizes = [int(size) for size in options.sizes.split(',')]
+    runScaling(path, sizes, options.ticks, options.world_size,
+               options.batched, options.seed)
@@ -0,0 +1,160 @@
+"""
+Checks that games played at bigger integration steps with swept
+contacts (ctf.SWEPT_CONTACTS) come out like games at the reference step.
+
+Plays the same seeds once at ctf.REFERENCE_STEP the ordinary way, then
+at each bigger step with swept contacts, and without them for
+comparison, one match per seed. Reports how often each match had the
+same winner as at the reference step, the blue win rate, the average
+match length and how much faster the matches ran.
+
+Individual matches are chaotic, any change to the physics changes
+who wins some of them, so a step is within tolerance when its blue
+win rate is no more than WIN_RATE_TOLERANCE from the reference's and
+its average match length no more than LENGTH_TOLERANCE of it off.
+Over 40 template games swept contacts stay within both only up to 3
+times the reference step, 0.6, which runs about 2.7 times faster. At
+5 times, 1.0, matches run nearly 6 times faster but come out about 16%
+shorter, outside LENGTH_TOLERANCE: the matches that are won take as
+long as at the reference step, but 4 stalemates that time out at 0.2
+are won at 1.0, where the bots decide 5 times less often. Without
+swept contacts (and the turns they scale) matches at 0.6 already run
+too long, and at 1.0 a lot longer.
+
+    python benchmarks/steps.py
+    python benchmarks/steps.py --games 100 --steps 0.4,1.0 bots/runner.py
+"""
+import multiprocessing
+import os
+import sys
+import time
+from StringIO import StringIO
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import headless
+headless.install()
+
+import ctf
+from tournament import gamePlayed
+
+TEMPLATE = os.path.join(ROOT, 'ctftemplate.py')
+
+# Steps to try, as multiples of ctf.REFERENCE_STEP.
+SCALES = [2, 3, 5]
+
+# Most the blue win rate at a bigger step may differ from the
+# reference, and the most the average match length may, as a fraction.
+# 40 matches can't pin a win rate down much closer than this.
+WIN_RATE_TOLERANCE = 0.15
+LENGTH_TOLERANCE = 0.15
+
+def playMatch(job):
+    """
+    Plays one match in a fresh world.
+    job is a (bot file, seed, step, swept) tuple.
+    Returns ('blue', 'red' or 'tie', match length, seconds it took).
+    """
+    path, seed, step, swept = job
+    config = ctf.CTFConfig(integration_step=step, swept_contacts=swept)
+
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    start = time.time()
+    try:
+        controller = headless.run(path, until=gamePlayed, seed=seed,
+                                  config=config)
+    finally:
+        sys.stdout = stdout
+    elapsed = time.time() - start
+
+    result = 'tie'
+    if controller.getBlueWins():
+        result = 'blue'
+    elif controller.getRedWins():
+        result = 'red'
+    length = controller.end_time - controller.start_time
+    headless.unload()
+    return result, length, elapsed
+
+def playAll(path, seeds, step, swept, pool):
+    return pool.map(playMatch, [(path, seed, step, swept) for seed in seeds])
+
+def summarize(matches, reference):
+    """
+    Returns (same winner as reference, blue win rate, average match
+    length, seconds) for a list of playMatch results.
+    """
+    count = float(len(matches))
+    same = sum([1 for match, other in zip(matches, reference)
+                if match[0] == other[0]])
+    blue = sum([1 for match in matches if match[0] == 'blue'])
+    length = sum([match[1] for match in matches])
+    seconds = sum([match[2] for match in matches])
+    return same / count, blue / count, length / count, seconds
+
+def runSteps(path=TEMPLATE, seeds=range(1, 41), steps=None, processes=None,
+        out=sys.stdout):
+    """
+    Plays every seed at the reference step and at each of steps, and
+    prints a table. Returns a list of (step, swept, same winner, blue
+    win rate, average length, speedup, within tolerance).
+    """
+    if steps is None:
+        steps = [ctf.REFERENCE_STEP * scale for scale in SCALES]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        reference = playAll(path, seeds, ctf.REFERENCE_STEP, False, pool)
+        base = summarize(reference, reference)
+
+        out.write('%6s %6s %6s %6s %8s %8s %4s\n' %
+                  ('step', 'swept', 'same', 'blue', 'length', 'speedup', 'ok'))
+        rows = [(ctf.REFERENCE_STEP, False) + base[:3] + (1.0, True)]
+        out.write('%6.2f %6s %6.2f %6.2f %8.1f %8.2f %4s\n' %
+                  (ctf.REFERENCE_STEP, 'no', base[0], base[1], base[2],
+                   1.0, '-'))
+        for step in steps:
+            for swept in (True, False):
+                same, blue, length, seconds = \
+                        summarize(playAll(path, seeds, step, swept, pool),
+                                  reference)
+                ok = abs(blue - base[1]) <= WIN_RATE_TOLERANCE and \
+                     abs(length - base[2]) <= LENGTH_TOLERANCE * base[2]
+                rows.append((step, swept, same, blue, length,
+                             base[3] / seconds, ok))
+                out.write('%6.2f %6s %6.2f %6.2f %8.1f %8.2f %4s\n' %
+                          (step, swept and 'yes' or 'no', same, blue, length,
+                           base[3] / seconds, ok and 'yes' or 'NO'))
+                out.flush()
+    finally:
+        pool.close()
+        pool.join()
+    return rows
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [options] [BOT_FILE]')
+    parser.add_option('--games', type='int', default=40,
+            help='matches at each step')
+    parser.add_option('--seed', type='int', default=1,
+            help='seed of the first match')
+    parser.add_option('--steps', default=None,
+            help='comma separated steps to try, default %s times the '
+                 'reference step' % (','.join(map(str, SCALES))))
+    parser.add_option('--processes', type='int', default=None,
+            help='number of worker processes, defaults to one per CPU')
+    options, args = parser.parse_args()
+
+    if len(args) > 1:
+        parser.error('expected at most one bot file')
+
+    path = args and args[0] or TEMPLATE
+    steps = None
+    if options.steps:
+        steps = [float(step) for step in options.steps.split(',')]
+    runSteps(path, range(options.seed, options.seed + options.games), steps,
+             options.processes)
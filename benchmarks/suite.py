@@ -0,0 +1,310 @@
+"""
+Benchmarks for the hot paths of the simulation, with a stored baseline.
+
+Runs fixed seed headless games with the ctftemplate.py bots and the
+synthetic mix in benchmarks/synthetic.py, then times single calls of
+every sense method, observe, getAngle, tag resolution and resetWorld
+in a game that has been running for a while. Results go to a JSON file
+and are compared with benchmarks/baseline.json. Anything slower than the
+baseline by more than its threshold is flagged and the exit status is 1.
+Single calls take microseconds and are noisier than whole games, so
+they get a looser threshold.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --out results.json --threshold 0.3
+    python benchmarks/suite.py --update-baseline
+
+Timings depend on the machine, so only compare against a baseline made
+on the same one. Rerun with --update-baseline after a change that is
+meant to be slower, or on a new machine.
+"""
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import headless
+headless.install()
+
+import ctf
+
+TEMPLATE = os.path.join(ROOT, 'ctftemplate.py')
+SYNTHETIC = os.path.join(HERE, 'synthetic.py')
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+FORMAT_VERSION = 1
+
+# How much worse than the baseline a result may be before it's flagged,
+# for games and memory and for single calls.
+THRESHOLD = 0.25
+CALL_THRESHOLD = 0.5
+
+# Per call timings, in microseconds.
+CALLS = ('senseMyJail', 'senseOtherJail', 'senseMyFlag', 'senseOtherFlag',
+         'senseMyTeam', 'senseOtherTeam', 'observe', 'getAngle')
+
+# Timed runs of each measurement, the best one counts.
+RUNS = 5
+
+# Fresh processes each case is run in, the median result counts.
+# Small calls can come out twice as slow in one process as in another.
+SAMPLES = 5
+
+def buildGame(path, team_size, warmup, seed):
+    """
+    Loads a bot file and plays warmup ticks.
+    Returns the controller.
+    """
+    config = ctf.CTFConfig(team_size=team_size)
+    controller = headless.run(path, max_time=0, seed=seed, config=config)
+    world = controller._world
+    for i in range(warmup):
+        world.step()
+    return controller
+
+def peakMemory():
+    """
+    Returns this process's peak memory use in kilobytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+def gameCase(job):
+    """
+    Times whole ticks of a game.
+    job is a (bot file, team size, ticks, seed) tuple.
+    """
+    path, team_size, ticks, seed = job
+    controller = buildGame(path, team_size, 0, seed)
+    world = controller._world
+
+    start = time.time()
+    for i in range(ticks):
+        world.step()
+    elapsed = time.time() - start
+
+    return {'ticks_per_sec': ticks / elapsed, 'peak_kb': peakMemory()}
+
+def bestTime(function, calls):
+    """
+    Returns the best time per call, in microseconds, of RUNS runs
+    of function, which makes calls calls.
+    """
+    best = None
+    for run in range(RUNS):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / calls * 1e6
+
+def callsCase(job):
+    """
+    Times single calls of the hot paths in a game that is under way.
+    job is a (bot file, team size, warmup ticks, calls, seed) tuple.
+    Every player method is called about calls times a run, tag
+    resolution a tenth and resetWorld a hundredth of that.
+    """
+    path, team_size, warmup, calls, seed = job
+    controller = buildGame(path, team_size, warmup, seed)
+    players = list(controller.world_state.players)
+    repeat = max(1, calls // len(players))
+    calls = repeat * len(players)
+    results = {}
+
+    for name in CALLS[:-1]:
+        def senseAll(name=name):
+            for i in range(repeat):
+                for player in players:
+                    getattr(player, name)()
+        results[name + '_us'] = bestTime(senseAll, calls)
+
+    target = controller.red_flag.getLocation()
+    def angleAll():
+        for i in range(repeat):
+            for player in players:
+                player.getAngle(target)
+    results['getAngle_us'] = bestTime(angleAll, calls)
+
+    # Tags send people to jail, after the first call
+    # this times finding the touching pairs.
+    repeat = max(1, calls // 10)
+    def tagAll():
+        for i in range(repeat):
+            controller.resolveTags()
+    results['resolveTags_us'] = bestTime(tagAll, repeat)
+
+    repeat = max(1, calls // 100)
+    def resetAll():
+        for i in range(repeat):
+            controller.resetWorld()
+    results['resetWorld_us'] = bestTime(resetAll, repeat)
+
+    results['peak_kb'] = peakMemory()
+    return results
+
+def cases(quick=False):
+    """
+    Returns the list of (name, function, job) benchmarks to run.
+    """
+    ticks = quick and 100 or 500
+    calls = quick and 1000 or 4000
+    return [
+        ('template', gameCase, (TEMPLATE, 10, ticks, 1)),
+        ('synthetic', gameCase, (SYNTHETIC, 10, ticks, 1)),
+        ('synthetic_100', gameCase, (SYNTHETIC, 100, ticks / 5, 1)),
+        ('calls', callsCase, (SYNTHETIC, 10, 200, calls, 1)),
+        ('calls_100', callsCase, (SYNTHETIC, 100, 50, calls, 1)),
+    ]
+
+def runSuite(quick=False, samples=SAMPLES, out=sys.stdout):
+    """
+    Runs every benchmark samples times, each in a fresh process,
+    and keeps the median of each measurement.
+    Returns a dictionary of results, keyed 'case.measure'.
+    """
+    results = {}
+    for name, function, job in cases(quick):
+        # Every run in a fresh process, so one run's garbage
+        # doesn't get timed with the next.
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            runs = [pool.apply(function, (job,)) for i in range(samples)]
+        finally:
+            pool.close()
+            pool.join()
+
+        for key in sorted(runs[0]):
+            values = sorted([measured[key] for measured in runs])
+            value = values[len(values) // 2]
+            results['%s.%s' % (name, key)] = value
+            out.write('%-32s %12.2f\n' % ('%s.%s' % (name, key), value))
+        out.flush()
+    return results
+
+def higherIsBetter(key):
+    return key.endswith('ticks_per_sec')
+
+def isCall(key):
+    return key.endswith('_us')
+
+def compare(results, baseline, threshold, call_threshold, out=sys.stdout):
+    """
+    Compares results with a baseline.
+    Returns the keys that got worse by more than threshold,
+    or call_threshold for single call timings.
+    """
+    regressions = []
+    out.write('%-32s %12s %12s %8s\n' % ('benchmark', 'baseline', 'now', 'change'))
+    for key in sorted(baseline):
+        if key not in results:
+            continue
+        old = baseline[key]
+        new = results[key]
+        if old == 0:
+            continue
+
+        change = (new - old) / float(old)
+        allowed = threshold
+        if isCall(key):
+            allowed = call_threshold
+        if higherIsBetter(key):
+            worse = change < -allowed
+        else:
+            worse = change > allowed
+
+        out.write('%-32s %12.2f %12.2f %+7.1f%%%s\n' % (key, old, new,
+                  change * 100, worse and '  SLOWER' or ''))
+        if worse:
+            regressions.append(key)
+    return regressions
+
+def saveResults(path, results, threshold=THRESHOLD,
+        call_threshold=CALL_THRESHOLD):
+    data = {
+        'version': FORMAT_VERSION,
+        'threshold': threshold,
+        'call_threshold': call_threshold,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    output = open(path, 'w')
+    json.dump(data, output, indent=2, sort_keys=True)
+    output.write('\n')
+    output.close()
+
+def loadResults(path):
+    data = json.load(open(path))
+    if data.get('version') != FORMAT_VERSION:
+        raise ValueError('%s is benchmark format %s, expected %d' %
+                         (path, data.get('version'), FORMAT_VERSION))
+    return data
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--out', default=None,
+            help='write the results to this JSON file')
+    parser.add_option('--baseline', default=BASELINE,
+            help='baseline to compare against')
+    parser.add_option('--threshold', type='float', default=None,
+            help="allowed slowdown of games, 0.25 is 25%, "
+                 "defaults to the baseline's")
+    parser.add_option('--call-threshold', type='float', default=None,
+            help="allowed slowdown of single calls, defaults to the baseline's")
+    parser.add_option('--update-baseline', action='store_true', default=False,
+            help='save the results as the new baseline')
+    parser.add_option('--quick', action='store_true', default=False,
+            help='shorter runs, noisier numbers')
+    parser.add_option('--samples', type='int', default=SAMPLES,
+            help='processes to run each case in, the median result counts')
+    options, args = parser.parse_args()
+
+    if args:
+        parser.error('no arguments expected')
+
+    results = runSuite(options.quick, options.samples)
+
+    thresholds = (options.threshold or THRESHOLD,
+                  options.call_threshold or CALL_THRESHOLD)
+    if options.out:
+        saveResults(options.out, results, *thresholds)
+
+    if options.update_baseline:
+        saveResults(options.baseline, results, *thresholds)
+        print 'Saved baseline to %s' % (options.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(options.baseline):
+        print 'No baseline at %s, run with --update-baseline' % (options.baseline)
+        sys.exit(0)
+
+    baseline = loadResults(options.baseline)
+    threshold = options.threshold
+    if threshold is None:
+        threshold = baseline.get('threshold', THRESHOLD)
+    call_threshold = options.call_threshold
+    if call_threshold is None:
+        call_threshold = baseline.get('call_threshold', CALL_THRESHOLD)
+
+    print
+    regressions = compare(results, baseline['results'], threshold,
+                          call_threshold)
+    if regressions:
+        print '%d benchmarks slower than the baseline by more than %d%% ' \
+              '(%d%% for single calls)' % (len(regressions), threshold * 100,
+                                           call_threshold * 100)
+        sys.exit(1)
+    print 'No regressions.'
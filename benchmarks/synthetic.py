@@ -0,0 +1,89 @@
+"""
+A synthetic mix of bots for benchmarking.
+
+Every team is an even mix of three kinds of player:
+- Sensors call every sense method every tick,
+- Chasers go after the closest opponent,
+- Wanderers turn at random.
+So a game exercises every sensor and plenty of tagging.
+"""
+import breve
+from ctf import *
+
+class SyntheticController(CTFController):
+    def __init__(self):
+        CTFController.__init__(self)
+
+        kinds = [Sensor, Chaser, Wanderer]
+        self.teams = [[], []]
+        for team in [BLUE_TEAM, RED_TEAM]:
+            for i in range(self.config.team_size):
+                member = kinds[i % len(kinds)]()
+                member.setTeam(team)
+                self.teams[team].append(member)
+
+class Sensor(CTFPlayer):
+    def __init__(self):
+        CTFPlayer.__init__(self)
+
+    def iterate(self):
+        self.setSpeed(1)
+        self.senseMyJail()
+        self.senseOtherJail()
+        self.senseMyFlag()
+        self.senseMyTeam()
+        self.senseOtherTeam()
+
+        flag = self.senseOtherFlag()
+        if self.hasFlag():
+            target = self.getMyHomeLocation()
+        elif flag != None:
+            target = flag.getLocation()
+        else:
+            target = self.getOtherHomeLocation()
+
+        if target != self.getLocation():
+            if self.getAngle(target) > 0:
+                self.turnRight()
+            else:
+                self.turnLeft()
+
+        CTFPlayer.iterate(self)
+
+class Chaser(CTFPlayer):
+    def __init__(self):
+        CTFPlayer.__init__(self)
+
+    def iterate(self):
+        self.setSpeed(1)
+
+        angle = 0
+        opponent = self.getClosestOpponent()
+        if opponent != None:
+            angle = self.getObjectAngle(opponent)
+        elif self.getOtherHomeLocation() != self.getLocation():
+            angle = self.getAngle(self.getOtherHomeLocation())
+
+        if angle > 0:
+            self.turnRight()
+        elif angle < 0:
+            self.turnLeft()
+
+        CTFPlayer.iterate(self)
+
+class Wanderer(CTFPlayer):
+    def __init__(self):
+        CTFPlayer.__init__(self)
+
+    def iterate(self):
+        self.setSpeed(.5)
+
+        turn = self.controller.randomExpression(2)
+        if turn == 0:
+            self.turnLeft()
+        elif turn == 2:
+            self.turnRight()
+
+        CTFPlayer.iterate(self)
+
+SyntheticController()
@@ -0,0 +1,26 @@
+import breve
+from ctf import *
+
+class Chaser(CTFPlayer):
+    """
+    Goes after the closest opponent it can see, or the other side.
+    """
+    def __init__(self):
+        CTFPlayer.__init__(self)
+
+    def iterate(self):
+        self.setSpeed(1)
+
+        angle = 0
+        opponent = self.getClosestOpponent()
+        if opponent != None:
+            angle = self.getObjectAngle(opponent)
+        elif self.getLocation() != self.getOtherHomeLocation():
+            angle = self.getAngle(self.getOtherHomeLocation())
+
+        if angle > 0:
+            self.turnRight()
+        elif angle < 0:
+            self.turnLeft()
+
+        CTFPlayer.iterate(self)
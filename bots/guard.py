@@ -0,0 +1,26 @@
+import breve
+from ctf import *
+
+class Guard(CTFPlayer):
+    """
+    Runs around until it sees its own flag, then circles it slowly.
+    Plays like the red team in ctftemplate.py.
+    """
+    def __init__(self):
+        CTFPlayer.__init__(self)
+
+    def iterate(self):
+        flag = self.senseMyFlag()
+
+        if flag != None:
+            angle = self.getAngle(flag.getLocation())
+
+            if angle > 0:
+                self.turnRight()
+            elif angle < 0:
+                self.turnLeft()
+            self.setSpeed(.3)
+        else:
+            self.setSpeed(1)
+
+        CTFPlayer.iterate(self)
@@ -0,0 +1,31 @@
+import breve
+from ctf import *
+
+class Runner(CTFPlayer):
+    """
+    Heads for the other flag and brings it home.
+    Plays like the blue team in ctftemplate.py.
+    """
+    def __init__(self):
+        CTFPlayer.__init__(self)
+
+    def iterate(self):
+        self.setSpeed(1)
+
+        if self.hasFlag():
+            target = self.getMyHomeLocation()
+        else:
+            flag = self.senseOtherFlag()
+            if flag != None:
+                target = flag.getLocation()
+            else:
+                target = self.getOtherHomeLocation()
+
+        if self.getLocation() != target:
+            angle = self.getAngle(target)
+            if angle > 0:
+                self.turnRight()
+            elif angle < 0:
+                self.turnLeft()
+
+        CTFPlayer.iterate(self)
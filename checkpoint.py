@@ -0,0 +1,392 @@
+"""
+Saving a running world to disk and picking it up again later.
+
+A checkpoint holds everything a game needs to carry on where it left
+off: the tournament score, the match clock, the world state arrays,
+where every flag, jail and no tag zone is, the random number
+generators, and each bot's own attributes, where they can be pickled.
+Attributes that can't be (open files, engine shapes and so on) keep
+whatever value the rebuilt bot gave them.
+
+Resuming rebuilds the world by running the bot file as usual, then
+overwrites its state from the checkpoint, so the bot file has to make
+the same world it did before. headless.run does this for you:
+
+    headless.run('bots/mybot.py', checkpoint='game.ckpt')
+
+or --checkpoint on headless.py, tournament.py and league.py. A game
+that finishes removes its checkpoint.
+
+Checkpoint files are append only. The first record is the whole world,
+after that each record only has the parts that changed since the last
+one, and every so often the file is rewritten from scratch to keep it
+short. Records carry a checksum, so if the process dies halfway through
+writing one the file still loads, from the record before.
+
+Profiles and overrun counts aren't saved, after a resume they only
+cover what was played since. Replays can't be picked up halfway, so
+recorded games always start over.
+"""
+import cPickle
+from cStringIO import StringIO
+import os
+import struct
+import types
+import zlib
+
+import breve
+
+from ctf import RULES_VERSION, CTFPlayer, Flag, Jail
+
+# Checkpoint every this many ticks by default.
+INTERVAL = 1000
+
+# Rewrite the whole file after this many records.
+COMPACT_EVERY = 50
+
+FORMAT_VERSION = 1
+
+# Length and crc32 of each record.
+RECORD = struct.Struct('<II')
+
+# Controller attributes that aren't game state, or are saved separately.
+CONTROLLER_SKIP = frozenset(['config', 'recorder', 'events', 'random',
+        'decisions', 'profiler', 'watchdog', 'world_state', 'team_index',
+        'player_grid', 'distances', 'object_table', 'registry', 'left',
+        'right', 'controller'])
+
+# Mobile attributes that belong to the engine or the world state.
+MOBILE_SKIP = frozenset(['controller', 'shape', 'image', 'my_no_tag_zone',
+        'world_state', 'state_index', 'observation'])
+
+class Unpicklable(Exception):
+    pass
+
+def objectId(controller):
+    """
+    Returns a function naming the objects in controller's world that
+    pickles refer to rather than copy.
+    """
+    def persistentId(obj):
+        if not isinstance(obj, breve.Object):
+            return None
+        if obj is controller:
+            return 'controller'
+        if isinstance(obj, CTFPlayer):
+            return 'player %d' % (obj.state_index)
+        if isinstance(obj, Flag):
+            return 'flag %d' % (obj.state_index)
+        if isinstance(obj, Jail):
+            return 'jail %d' % (controller.registry.jails.index(obj))
+        raise Unpicklable(obj)
+    return persistentId
+
+def findObject(controller):
+    """
+    The other way round from objectId.
+    """
+    def persistentLoad(name):
+        if name == 'controller':
+            return controller
+        kind, index = name.split()
+        index = int(index)
+        if kind == 'player':
+            return controller.world_state.players[index]
+        if kind == 'flag':
+            return controller.world_state.flags[index]
+        return controller.registry.jails[index]
+    return persistentLoad
+
+def dumps(controller, value):
+    output = StringIO()
+    pickler = cPickle.Pickler(output, 2)
+    pickler.persistent_id = objectId(controller)
+    pickler.dump(value)
+    return output.getvalue()
+
+def loads(controller, text):
+    unpickler = cPickle.Unpickler(StringIO(text))
+    unpickler.persistent_load = findObject(controller)
+    return unpickler.load()
+
+def attributesOf(obj):
+    """
+    Returns obj's attributes by name, from its slots and its __dict__.
+    """
+    attributes = {}
+    for cls in reversed(type(obj).__mro__):
+        for name in cls.__dict__.get('__slots__', ()):
+            if name == '__dict__':
+                continue
+            # Straight from the slot, in case a property hides it.
+            try:
+                attributes[name] = cls.__dict__[name].__get__(obj, cls)
+            except AttributeError:
+                pass
+    attributes.update(getattr(obj, '__dict__', {}))
+    return attributes
+
+def saveAttributes(controller, obj, skip):
+    """
+    Returns obj's picklable attributes, pickled.
+    Wrapped methods, engine internals and anything in skip are left out.
+    """
+    attributes = {}
+    for name, value in attributesOf(obj).items():
+        if name in skip or name.startswith('_'):
+            continue
+        if isinstance(value, (types.FunctionType, types.MethodType)):
+            continue
+        attributes[name] = value
+
+    try:
+        return dumps(controller, attributes)
+    except Exception:
+        pass
+
+    # Something in there won't pickle, find out what.
+    for name, value in attributes.items():
+        try:
+            dumps(controller, value)
+        except Exception:
+            del attributes[name]
+    return dumps(controller, attributes)
+
+def restoreAttributes(controller, obj, text):
+    for name, value in loads(controller, text).items():
+        setattr(obj, name, value)
+
+def engineState(mobile):
+    """
+    Returns where mobile is and how the engine is moving it.
+    """
+    location = breve.Mobile.getLocation(mobile)
+    velocity = mobile.getVelocity()
+    return ((location.x, location.y, location.z),
+            (velocity.x, velocity.y, velocity.z))
+
+def setEngineState(mobile, state):
+    location, velocity = state
+    breve.Mobile.move(mobile, breve.vector(*location))
+    mobile.setVelocity(breve.vector(*velocity))
+
+def describe(controller):
+    """
+    Returns what a checkpoint has to match to be restored into
+    controller's world.
+    """
+    state = controller.world_state
+    return {'version': FORMAT_VERSION, 'rules': RULES_VERSION,
+            'config': repr(controller.config), 'players': state.count,
+            'flags': len(state.flags), 'jails': len(controller.registry.jails)}
+
+def saveWorld(controller):
+    """
+    Returns the state of controller's world as a dictionary of parts,
+    each one pickled separately so unchanged parts can be left out of
+    the next checkpoint.
+    """
+    world = controller._world
+    state = controller.world_state
+
+    parts = {}
+    parts['meta'] = cPickle.dumps(describe(controller), 2)
+
+    events_shards = events_name = None
+    if controller.events is not None:
+        events_shards = controller.events.shards
+        events_name = controller.events.name
+    parts['world'] = cPickle.dumps({'time': world.time,
+            'step_size': world.step_size,
+            'display_text': controller._display_text,
+            'events_shards': events_shards,
+            'events_name': events_name}, 2)
+
+    # Generators are big and often don't change, they get parts of their own.
+    parts['random'] = cPickle.dumps(controller.random.getstate(), 2)
+    parts['breve random'] = cPickle.dumps(breve._random.getstate(), 2)
+
+    parts['controller'] = saveAttributes(controller, controller, CONTROLLER_SKIP)
+
+    arrays = {}
+    for name, kind, shape, empty in state.FIELDS:
+        arrays[name] = state.view(name).copy()
+    parts['arrays'] = cPickle.dumps(arrays, 2)
+
+    decisions = controller.decisions
+    for player in state.players:
+        name = 'player %d' % (player.state_index)
+        parts[name] = cPickle.dumps(
+                (saveAttributes(controller, player, MOBILE_SKIP),
+                 engineState(player)), 2)
+        if decisions is not None and player in decisions.randoms:
+            parts[name + ' random'] = cPickle.dumps(
+                    decisions.randoms[player].getstate(), 2)
+
+    for flag in state.flags:
+        zone = None
+        if flag.my_no_tag_zone:
+            location = flag.my_no_tag_zone.getLocation()
+            zone = (location.x, location.y, location.z)
+        parts['flag %d' % (flag.state_index)] = cPickle.dumps(
+                (saveAttributes(controller, flag, MOBILE_SKIP),
+                 engineState(flag), zone), 2)
+
+    for i, jail in enumerate(controller.registry.jails):
+        parts['jail %d' % (i)] = cPickle.dumps(
+                (saveAttributes(controller, jail, MOBILE_SKIP),
+                 engineState(jail)), 2)
+
+    return parts
+
+def restoreWorld(controller, parts):
+    """
+    Puts controller's freshly built world back the way saveWorld found it.
+    """
+    state = controller.world_state
+    meta = cPickle.loads(parts['meta'])
+    here = describe(controller)
+    if meta != here:
+        raise ValueError('checkpoint is for a different game: %r, this is %r' %
+                         (meta, here))
+
+    world = cPickle.loads(parts['world'])
+    controller._world.time = world['time']
+    controller._world.step_size = world['step_size']
+    controller._display_text = world['display_text']
+    controller.random.setstate(cPickle.loads(parts['random']))
+    breve._random.setstate(cPickle.loads(parts['breve random']))
+    if controller.events is not None and world['events_shards'] is not None:
+        controller.events.shards = world['events_shards']
+        # Carry on writing the shards under the name they were started with.
+        if controller.events.name is None:
+            controller.events.name = world.get('events_name')
+
+    restoreAttributes(controller, controller, parts['controller'])
+
+    arrays = cPickle.loads(parts['arrays'])
+    for name, kind, shape, empty in state.FIELDS:
+        state.view(name)[:] = arrays[name]
+
+    decisions = controller.decisions
+    for player in state.players:
+        name = 'player %d' % (player.state_index)
+        attributes, engine = cPickle.loads(parts[name])
+        restoreAttributes(controller, player, attributes)
+        setEngineState(player, engine)
+        # The rotation only ever comes from the angle.
+        player.setAngle(player.angle)
+        if name + ' random' in parts:
+            decisions.randoms[player].setstate(
+                    cPickle.loads(parts[name + ' random']))
+        controller.team_index.update(player, player.team, player.in_jail)
+
+    for flag in state.flags:
+        attributes, engine, zone = \
+                cPickle.loads(parts['flag %d' % (flag.state_index)])
+        restoreAttributes(controller, flag, attributes)
+        setEngineState(flag, engine)
+        if zone is None and flag.my_no_tag_zone:
+            controller.putAwayNoTagZone(flag.my_no_tag_zone)
+            flag.my_no_tag_zone = None
+        elif zone is not None:
+            if not flag.my_no_tag_zone:
+                flag.makeNoTagZone()
+            flag.my_no_tag_zone.move(breve.vector(*zone))
+
+    for i, jail in enumerate(controller.registry.jails):
+        attributes, engine = cPickle.loads(parts['jail %d' % (i)])
+        restoreAttributes(controller, jail, attributes)
+        setEngineState(jail, engine)
+
+def writeRecord(output, parts):
+    text = cPickle.dumps(parts, 2)
+    output.write(RECORD.pack(len(text), zlib.crc32(text) & 0xffffffff))
+    output.write(text)
+
+def readCheckpoint(path):
+    """
+    Returns the latest parts saved in a checkpoint file. A record that
+    was cut short or doesn't match its checksum ends the file.
+    """
+    data = open(path, 'rb').read()
+    parts = {}
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        length, crc = RECORD.unpack_from(data, offset)
+        text = data[offset + RECORD.size:offset + RECORD.size + length]
+        if len(text) != length or zlib.crc32(text) & 0xffffffff != crc:
+            break
+        parts.update(cPickle.loads(text))
+        offset += RECORD.size + length
+
+    if 'meta' not in parts:
+        raise ValueError('%s has no complete checkpoint' % (path))
+    return parts
+
+class Checkpointer(object):
+    """
+    Saves a controller's world to path every interval ticks.
+    """
+
+    def __init__(self, path, interval=None):
+        if interval is None:
+            interval = INTERVAL
+        self.path = path
+        self.interval = interval
+        self.ticks = 0
+        self.records = 0
+        self.saved = {}     # part name -> what was last written for it
+
+    def resume(self, controller):
+        """
+        Restores controller from the checkpoint file, if there is one.
+        Returns true if it did.
+        """
+        if not os.path.exists(self.path):
+            return False
+        restoreWorld(controller, readCheckpoint(self.path))
+        return True
+
+    def tick(self, controller):
+        """
+        Called once a tick, between steps. Saves when it's time to.
+        """
+        self.ticks += 1
+        if self.ticks % self.interval == 0:
+            self.save(controller)
+
+    def save(self, controller):
+        """
+        Writes a checkpoint now.
+        """
+        # Events up to here have to be on disk before the checkpoint
+        # says they are.
+        if controller.events is not None:
+            controller.events.sync()
+
+        parts = saveWorld(controller)
+        if not self.saved or self.records >= COMPACT_EVERY:
+            # Start a new file, under a temporary name so there's
+            # always a whole one.
+            output = open(self.path + '.tmp', 'wb')
+            writeRecord(output, parts)
+            output.close()
+            os.rename(self.path + '.tmp', self.path)
+            self.records = 1
+        else:
+            changed = dict([(name, text) for name, text in parts.items()
+                            if self.saved.get(name) != text])
+            if changed:
+                output = open(self.path, 'ab')
+                writeRecord(output, changed)
+                output.close()
+                self.records += 1
+        self.saved = parts
+
+    def remove(self):
+        """
+        Deletes the checkpoint, once the game is over.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
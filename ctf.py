@@ -1,7 +1,21 @@
+import random
+
 import breve
+import numpy
+
+from decisions import DecisionPool
+from observation import Observation, ObjectTable
+from profiler import NullProfiler, Profiler
+from rating import decided
+from spatial import DistanceMatrix, SpatialHash, boxDistances, \
+        pointDistances, sweptBoxDistances, sweptDistances, sweptPairs, \
+        touchingPairs
+from state import Registry, TeamIndex, WorldState, integrate, \
+        signedAngle, signedAngles, stateProperty
+from watchdog import Watchdog
 
 # Globals defines as follows
-# Too lazy to write a config file. Bad form on my part.
+# These are the defaults, CTFConfig lets each run pick its own.
 
 # Dimensions of the world. World is WORLD_SIZExWORLD_SIZE units.
 WORLD_SIZE = 50
@@ -9,10 +23,30 @@ WORLD_SIZE = 50
 # The maximum range a sensor can read
 SENSOR_DISTANCE = 20
 
+# Collision sizes: the radius of the sphere around an agent (as near as
+# headless.py works out the bounding sphere of AgentShape), the flag's
+# sphere and a jail's box. Tags, pickups and jail breaks, swept or not,
+# all go by these.
+AGENT_RADIUS = 0.785
+FLAG_RADIUS = 1.5
+JAIL_SIZE = (3, 1, 3)
+
+# Players closer together than this are touching and can tag each other:
+# where their collision spheres meet, the same reach tags had back when
+# the engine's collision handler made them.
+TAG_DISTANCE = 2 * AGENT_RADIUS
+
+# Players this close to their own flag can't tag, until the flag has
+# moved this far from where it started. Also the no tag zone's radius.
+NO_TAG_DISTANCE = 5
+
 # Constants for identifying teams
 BLUE_TEAM = 0
 RED_TEAM = 1
 
+# Players per team. Controllers use this to build their teams.
+TEAM_SIZE = 10
+
 # Length of a single match in simulation time units.
 GAME_LENGTH = 500
 
@@ -22,30 +56,161 @@ TOURNAMENT_LENGTH = 5
 # Amount of time to pause before starting a new match.
 PAUSE_TIME = 75
 
+# Seed for the simulation's random numbers. The same seed plays the
+# same game every time. None picks a different seed every run.
+SEED = None
+
+# Move every player in one vectorized pass at the end of each step
+# instead of one at a time in CTFPlayer.iterate. Player iterate methods
+# then only set speed and angle. Same movement, less python.
+BATCHED_MOVEMENT = False
+
+# Simulation time per step.
+INTEGRATION_STEP = .2
+
+# Catch tags, flag pickups and jail breaks anywhere along the way a
+# player moved during a step, not just where it ended up, so bigger
+# integration steps don't let players run through each other or through
+# flags. Turns and the pause between matches are scaled so they take as
+# long as they do at REFERENCE_STEP.
+SWEPT_CONTACTS = False
+
+# The step the game was made for.
+REFERENCE_STEP = .2
+
+# Radians turnLeft and turnRight turn by each step, at REFERENCE_STEP.
+TURN_ANGLE = 0.03
+
+# Where no tag zones wait to be reused, well out of sight under the field.
+SPARE_ZONE_LOCATION = (0, -1000, 0)
+
+# Time every player's iterate and sense calls and the controller's
+# phases, and add it to the reports. See profiler.py.
+PROFILE = False
+
+# Most time, in seconds, a player's iterate may take each tick, and most
+# a whole team may take between them. None for no limit. What happens
+# to players that go over is up to OVERRUN_POLICY, one of 'keep'
+# (carry on as before), 'skip' (stop for the tick) or 'forfeit' (the
+# team loses the match). See watchdog.py.
+ITERATE_BUDGET = None
+TEAM_BUDGET = None
+OVERRUN_POLICY = 'keep'
+
+# Split each tick in two: every player decides from the same snapshot
+# of the world, then everybody moves at once (with batched movement).
+# Order independent, and decisions can run on DECISION_THREADS threads.
+# See decisions.py.
+SIMULTANEOUS_TICK = False
+DECISION_THREADS = 1
+
+# End the tournament as soon as its winner is decided: once the side
+# ahead can't be caught, or a sequential test is sure which side is
+# better. See rating.py.
+EARLY_STOP = False
+
+# Bump this whenever a change to the rules changes how games play out.
+# league.py replays cached results from older versions.
+RULES_VERSION = 1
+
+# Set to a CTFConfig to use it for the next controller made.
+# None builds one from the globals above.
+CONFIG = None
+
+class CTFConfig(object):
+    """
+    The settings of one run: arena, teams and timings.
+    Anything not given comes from the globals above, so
+
+        CTFConfig(team_size=100, world_size=160)
+
+    is the default game with bigger teams on a bigger field.
+    """
+
+    SETTINGS = ('world_size', 'sensor_distance', 'tag_distance', 'team_size',
+                'game_length', 'tournament_length', 'pause_time', 'seed',
+                'batched_movement', 'integration_step', 'swept_contacts',
+                'profile', 'iterate_budget', 'team_budget', 'overrun_policy',
+                'simultaneous', 'decision_threads', 'early_stop')
+
+    def __init__(self, **settings):
+        self.world_size = WORLD_SIZE
+        self.sensor_distance = SENSOR_DISTANCE
+        self.tag_distance = TAG_DISTANCE
+        self.team_size = TEAM_SIZE
+        self.game_length = GAME_LENGTH
+        self.tournament_length = TOURNAMENT_LENGTH
+        self.pause_time = PAUSE_TIME
+        self.seed = SEED
+        self.batched_movement = BATCHED_MOVEMENT
+        self.integration_step = INTEGRATION_STEP
+        self.swept_contacts = SWEPT_CONTACTS
+        self.profile = PROFILE
+        self.iterate_budget = ITERATE_BUDGET
+        self.team_budget = TEAM_BUDGET
+        self.overrun_policy = OVERRUN_POLICY
+        self.simultaneous = SIMULTANEOUS_TICK
+        self.decision_threads = DECISION_THREADS
+        self.early_stop = EARLY_STOP
+
+        for name, value in settings.items():
+            if name not in self.SETTINGS:
+                raise TypeError('unknown setting %r' % (name))
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return 'CTFConfig(%s)' % ', '.join(['%s=%r' % (name, getattr(self, name))
+                                             for name in self.SETTINGS])
+
+class CTFRandom(random.Random):
+    """
+    The random number generator for a simulation.
+    Everything random in the game is drawn from the controller's
+    instance of this, so seeding it makes a run repeatable.
+    """
+
+    def expression(self, value):
+        """
+        Returns a random value between 0 and value, inclusive.
+        Works on ints, floats and vectors, like breve.randomExpression.
+        """
+        if isinstance(value, int):
+            return self.randint(0, value)
+        if isinstance(value, float):
+            return self.uniform(0, value)
+        return breve.vector(self.uniform(0, value.x),
+                            self.uniform(0, value.y),
+                            self.uniform(0, value.z))
+
 class CTFController(breve.Control):
     """
     Controls the state of the capture the flag game.
     All actions are routed through the controller so each player
-    moves seemingly simultaniously. 
+    moves seemingly simultaniously. With SIMULTANEOUS_TICK they
+    really do.
     """
 
-    def __init__(self):
+    def __init__(self, config=None):
         """
         Traditionally __init__ in breve python simulations is used 
         for variable declarations. I follow that convention here.
         init is called to actually initialize the instance variables.
+        config is a CTFConfig, by default CONFIG or the globals.
 
         NOTE: Calling the super classes __init__ method is manditory.
         """
         breve.Control.__init__(self)
+
+        if config is None:
+            config = CONFIG or CTFConfig()
+        self.config = config
+
         self.left = None
         self.right = None
         self.red_flag = None
         self.blue_flag = None
         self.red_jail = None
         self.blue_jail = None
-        self.red_players_captured = 0
-        self.blue_players_captured = 0
         self.total_red_flag_time = 0.0
         self.total_blue_flag_time = 0.0
         self.iterations = 1
@@ -61,19 +226,76 @@ class CTFController(breve.Control):
         self.end_time = 0.0
         self.winners_str = 'Red: %d  Blue: %d   Ties: %d'
 
+        # Set to a replay.ReplayRecorder to record every tick.
+        self.recorder = None
+
+        # Set to an events.EventLog to log pickups, tags and so on.
+        self.events = None
+
+        # All of the randomness in the game comes from here.
+        self.seed = config.seed
+        self.random = CTFRandom(config.seed)
+
+        # See BATCHED_MOVEMENT. Simultaneous ticks always move everyone at once.
+        self.batched_movement = config.batched_movement or config.simultaneous
+
+        # See SWEPT_CONTACTS. How many reference steps one step is worth.
+        self.time_scale = 1.0
+        if config.swept_contacts:
+            self.time_scale = float(config.integration_step) / REFERENCE_STEP
+
+        # See SIMULTANEOUS_TICK.
+        self.decisions = None
+        if config.simultaneous:
+            self.decisions = DecisionPool(self, config.decision_threads,
+                                          CTFRandom)
+
+        # See PROFILE.
+        if config.profile:
+            self.profiler = Profiler()
+        else:
+            self.profiler = NullProfiler()
+
+        # See ITERATE_BUDGET. The team that forfeits the match, if any.
+        self.watchdog = None
+        if config.iterate_budget is not None or config.team_budget is not None:
+            self.watchdog = Watchdog(self, config.iterate_budget,
+                    config.team_budget, config.overrun_policy)
+        self.forfeited = None
+
+        # Every player, flag, jail and no tag zone in this world.
+        self.registry = Registry()
+
+        # Positions, headings, speeds and so on of every player.
+        self.world_state = WorldState()
+
+        # Who is in jail and who isn't, by team.
+        self.team_index = TeamIndex()
+
+        # Spatial index and distance matrix for the sensors.
+        # Rebuilt once a tick and kept up to date as things get moved around.
+        self.player_grid = SpatialHash(config.sensor_distance)
+        self.distances = DistanceMatrix()
+
+        # Teams, jail and carrying for CTFPlayer.observe, built on demand.
+        self.object_table = ObjectTable()
+
         self.init()
 
     def init(self):
         """
         Set up the simulation.
         """
+        config = self.config
+        world_size = config.world_size
+
         # Simulation settings
         self.disableReflections()
         self.enableLighting()
         self.moveLight(breve.vector(0, 10, 0))
         self.disableShadows()
         self.pointCamera(breve.vector(0, 0, 0), breve.vector(0, 60, 60))
-        self.setIntegrationStep(.2)
+        self.setIntegrationStep(config.integration_step)
         self.interations = 0
 
         # Set up some text for the screen
@@ -84,33 +306,33 @@ class CTFController(breve.Control):
 
         # Set up timers and the number of matches to play
         self.pause_track = 0.0
-        self.tournament_length = TOURNAMENT_LENGTH
+        self.tournament_length = config.tournament_length
 
         # Set up playing field
         # First initialize the shape and set its size
         field_shape = breve.createInstances(breve.Cube, 1)
-        field_shape.initWith(breve.vector(WORLD_SIZE/2, .2, WORLD_SIZE))
+        field_shape.initWith(breve.vector(world_size/2, .2, world_size))
 
         # Generate two halves of the playing field. 
         # Set their shape the the shape we just created
         # Change its color
         self.left = breve.createInstances(breve.Stationary, 1)
-        self.left.register(field_shape, breve.vector(-1 * WORLD_SIZE / 4, 0, 0))
+        self.left.register(field_shape, breve.vector(-1 * world_size / 4, 0, 0))
         self.left.setColor(breve.vector(.7, .7, 1.0))
 
         self.right = breve.createInstances(breve.Stationary, 1)
-        self.right.register(field_shape, breve.vector(WORLD_SIZE / 4, 0, 0))
+        self.right.register(field_shape, breve.vector(world_size / 4, 0, 0))
         self.right.setColor(breve.vector(1.0, .7, .7))
 
         # Set up the jails
         # NOTE: Jail is a subclass of a breve class. We can use common
         #       python syntax for pure python subclasses.
         self.blue_jail = Jail()
-        self.blue_jail.move(breve.vector(WORLD_SIZE / 2 - 5, 0, WORLD_SIZE / 2 - 5))
+        self.blue_jail.move(breve.vector(world_size / 2 - 5, 0, world_size / 2 - 5))
         self.blue_jail.setTeam(BLUE_TEAM)
         
         self.red_jail = Jail()
-        self.red_jail.move(breve.vector(-1 * WORLD_SIZE / 2 + 5, 0, -1 * WORLD_SIZE / 2 + 5))
+        self.red_jail.move(breve.vector(-1 * world_size / 2 + 5, 0, -1 * world_size / 2 + 5))
         self.red_jail.setTeam(RED_TEAM)
 
         # Set up the flags
@@ -118,19 +340,18 @@ class CTFController(breve.Control):
         # The most common way to generate random vector is:
         # breve.randomExpression(breve.vector(1, 1, 1)) - breve.vector(1, 1, 1)
         # This ensures the random vector will be within (0, 0, 0) and (1, 1, 1)
-        # randomExpression knows how to generate random floats, ints, vectors and matrixs
-        # but python's random is always an option.
-        randomness = breve.randomExpression(breve.vector(0, 0, WORLD_SIZE/2)) - breve.vector(0, 0, WORLD_SIZE/2)
+        # We use our own randomExpression so the game can be seeded.
+        randomness = self.randomExpression(breve.vector(0, 0, world_size/2)) - breve.vector(0, 0, world_size/2)
 
         self.blue_flag = Flag()
         self.blue_flag.setTeam(BLUE_TEAM)
-        self.blue_flag.move(breve.vector((-1 * WORLD_SIZE / 2) + 5, 1, 0) + randomness)
+        self.blue_flag.move(breve.vector((-1 * world_size / 2) + 5, 1, 0) + randomness)
         self.blue_flag.makeNoTagZone()
         self.blue_flag.setStartPosition(self.blue_flag.getLocation())
 
         self.red_flag = Flag()
         self.red_flag.setTeam(RED_TEAM)
-        self.red_flag.move(breve.vector((WORLD_SIZE / 2) - 5, 1, 0) + randomness)
+        self.red_flag.move(breve.vector((world_size / 2) - 5, 1, 0) + randomness)
         self.red_flag.makeNoTagZone()
         self.red_flag.setStartPosition(self.red_flag.getLocation())
  
@@ -146,6 +367,24 @@ class CTFController(breve.Control):
         """
         return self.red_jail.getLocation()
 
+    def randomExpression(self, value):
+        """
+        Seeded replacement for breve.randomExpression.
+        Use this for anything random so runs can be repeated.
+        """
+        return self.getRandom().expression(value)
+
+    def getRandom(self):
+        """
+        Returns the generator to draw from right now. Players deciding
+        simultaneously each draw from their own.
+        """
+        if self.decisions is not None:
+            random = self.decisions.getRandom()
+            if random is not None:
+                return random
+        return self.random
+
     def getGameTime(self):
         """
         Returns the remaining game time, in simulation units.
@@ -174,15 +413,21 @@ class CTFController(breve.Control):
         """
         Resets the state of the world for a new match.
         """
+        world_size = self.config.world_size
+
+        # Flags and players going home isn't part of either match.
+        events = self.events
+        self.events = None
+
         # Generate the randomness for the flag position
-        location_randomizer = breve.randomExpression(breve.vector(0, 0, WORLD_SIZE/2))
-        location_randomizer -= breve.vector(0, 0, WORLD_SIZE/4)
+        location_randomizer = self.randomExpression(breve.vector(0, 0, world_size/2))
+        location_randomizer -= breve.vector(0, 0, world_size/4)
 
         # Reset flag locations
-        self.blue_flag.move(breve.vector(-1*WORLD_SIZE/2+5, 1, 0) + location_randomizer)
+        self.blue_flag.move(breve.vector(-1*world_size/2+5, 1, 0) + location_randomizer)
         self.blue_flag.resetFlag()
 
-        self.red_flag.move(breve.vector(WORLD_SIZE/2-5, 1, 0) + location_randomizer)
+        self.red_flag.move(breve.vector(world_size/2-5, 1, 0) + location_randomizer)
         self.red_flag.resetFlag()
 
         # Reset all of the player locations
@@ -190,26 +435,34 @@ class CTFController(breve.Control):
         # objects of a certian class the call is usually:
         # for item in breve.allInstances(CTFPlayer)
         # But since CTFPlayer is a pure python subclass it is not added to the 
-        # breve object counter properly. We have to handle our own player count.
-        for item in CTFPlayer.players:
+        # breve object counter properly. The registry keeps our own list.
+        for item in self.registry.players:
             item.resetPlayer()
 
         # set the pause timer, reset the iteration count
         # reset the red and blue caputer count
         # Display the winners of the match properly.
-        self.pause_track = PAUSE_TIME
+        self.pause_track = int(round(self.config.pause_time / self.time_scale))
         self.iterations = 1
-        self.red_players_captured = 0
-        self.blue_players_captured = 0
+        self.forfeited = None
         self.total_red_flag_time = 0.0
         self.total_blue_flag_time = 0.0
         self.setDisplayText(self.winners_str % \
                 (self.red_wins, self.blue_wins, self.ties), -.3, .8, 3)
+        self.events = events
 
     def winner(self, team):
         """
         Handles a game win!
         """
+        # Log the result and how long each team held the other's flag,
+        # as ticks, before report() turns them into percentages.
+        self.logEvent('end', team=team, value=self.end_time - self.start_time)
+        self.logEvent('possession', team=BLUE_TEAM,
+                      value=self.total_blue_flag_time)
+        self.logEvent('possession', team=RED_TEAM,
+                      value=self.total_red_flag_time)
+
         # Print the winner to the log.
         # Report some (very limited) stats.
         # Add 1 to the win count for the appropriate team.
@@ -227,7 +480,7 @@ class CTFController(breve.Control):
 
         # If the tournament isn't over yet
         # Report the winner otherwise reset the world.
-        if (self.red_wins + self.blue_wins + self.ties >= self.tournament_length):
+        if self.tournamentOver():
             self.reportTournamentWinner()
         else:
             self.resetWorld()
@@ -249,9 +502,9 @@ class CTFController(breve.Control):
         print "Game ended at: ", self.end_time
 
         # Mention if all of one team was captured.
-        if self.blue_players_captured == 10:
+        if self.allCaptured(BLUE_TEAM):
             print "All of the Blue players were captured."
-        if self.red_players_captured == 10:
+        if self.allCaptured(RED_TEAM):
             print "All of the Red players were captured."
 
         # Also mention who captured the flag
@@ -267,50 +520,255 @@ class CTFController(breve.Control):
                 (self.total_blue_flag_time)
         print "Red had posession for %f percent of the game." % \
                 (self.total_red_flag_time)
+
+        # Who used the CPU, if we're keeping track.
+        self.profiler.endMatch()
+        if self.watchdog is not None:
+            self.watchdog.endMatch()
         print "*********************************************************" 
 
     def reportTournamentWinner(self):
         """
         Reports the winner of the tournament.
         """
-        # Print the win count to the console.
-        print "The Blue team won %d games!" % (self.blue_wins)
-        print "The Red team won %d games!" % (self.red_wins)
-        print "There were %d tie games!" % (self.ties)
-
-        # Print the tournament winner to the console.
-        if self.blue_wins > self.red_wins:
-            print "The Blue team wins the tournament!"
-            self.setDisplayText("Blue wins the Tournament!", -.3, .8, 3)
-        elif self.red_wins > self.blue_wins:
-            print "The Red team wins the tournament!"
-            self.setDisplayText("Red wins the Tournament!", -.3, .8, 3)
-        else:
-            print "Red and Blue tied!"
-            self.setDisplayText("The Tournament was a Tie!", -.3, .8, 3)
+        text = reportTournament(self.red_wins, self.blue_wins, self.ties)
+        played = self.red_wins + self.blue_wins + self.ties
+        if played < self.tournament_length:
+            print "Decided after %d of %d matches." % (played, self.tournament_length)
+        self.profiler.endTournament()
+        if self.watchdog is not None:
+            self.watchdog.endTournament()
+        self.setDisplayText(text, -.3, .8, 3)
+
+    def getNoTagZone(self):
+        """
+        Returns a no tag zone to put down, one put away earlier if there
+        is one.
+        """
+        spare = self.registry.spare_zones
+        if spare:
+            return spare.pop()
+        return breve.createInstances(NoTagZone, 1)
+
+    def putAwayNoTagZone(self, zone):
+        """
+        Takes a no tag zone off the field and keeps it for the next
+        getNoTagZone, which is cheaper than deleting it and making
+        another every match.
+        """
+        zone.move(breve.vector(*SPARE_ZONE_LOCATION))
+        self.registry.spare_zones.append(zone)
+
+    def destroy(self):
+        """
+        Called when the world is torn down. Stops the decision threads,
+        everything else goes with the registry.
+        """
+        if self.decisions is not None:
+            self.decisions.close()
+
+    def tournamentOver(self):
+        """
+        Returns true once every match of the tournament has been played,
+        or with early stopping, once the winner is decided.
+        Headless runs stop stepping the world when this is true.
+        """
+        played = self.red_wins + self.blue_wins + self.ties
+        if played >= self.tournament_length:
+            return True
+
+        # See EARLY_STOP.
+        return self.config.early_stop and \
+                decided(self.blue_wins, self.red_wins,
+                        self.tournament_length - played)
 
     def getJailedBlueCount(self):
         """
         Returns the number of blue players in jail.
-        Kept to make the API clearer.
         """
-        return self.blue_players_captured
+        return self.team_index.countJailed(BLUE_TEAM)
 
     def getJailedRedCount(self):
         """
         Returns the number of red players in jail.
-        Kept to make the API clearer.
         """
-        return self.red_players_captured
+        return self.team_index.countJailed(RED_TEAM)
 
-    def changePrisoners(self, team, n):
+    def logEvent(self, event, player=None, team=-1, other=-1, value=0.0,
+            location=None):
         """
-        Changes the number of captured players (on the specified team) by n.
+        Adds an event to the event log, if there is one.
+        See events.py for what the arguments mean.
         """
-        if team == RED_TEAM:
-            self.red_players_captured += n
+        if self.events is not None:
+            self.events.log(self, event, player, team, other, value, location)
+
+    def forfeit(self, team):
+        """
+        Makes team give up the match, at the next rules check.
+        Nothing to give up during the break between matches.
+        """
+        if self.pause_track <= 0 and self.forfeited is None:
+            self.forfeited = team
+
+    def getTeamSize(self, team):
+        """
+        Returns the number of players on team.
+        """
+        index = self.team_index
+        return index.countJailed(team) + index.countActive(team)
+
+    def allCaptured(self, team):
+        """
+        Returns true if every player on team is in jail.
+        """
+        index = self.team_index
+        return index.countJailed(team) > 0 and index.countActive(team) == 0
+
+    def updateSensors(self):
+        """
+        Catches the world state up with the engine and rebuilds the
+        sensor index and distance matrix from scratch.
+        Called once a tick, before anyone senses anything.
+        """
+        state = self.world_state
+
+        # With batched movement the state moved everybody itself.
+        if not self.batched_movement:
+            state.pullPositions()
+
+        positions = state.view('position')
+        self.player_grid.rebuild(state.players, positions)
+        registry = self.registry
+        self.distances.rebuild(state.players, (registry.flags, registry.jails),
+                               positions)
+        self.object_table.stale = True
+
+    def mobileMoved(self, mobile, location):
+        """
+        Keeps the sensors in step with a mobile that was just moved,
+        so anything that senses later this tick sees the new spot.
+        """
+        if isinstance(mobile, CTFPlayer):
+            self.player_grid.insert(mobile, location)
+        self.distances.moved(mobile, location)
+
+    def resolveTags(self):
+        """
+        Finds every pair of opponents that are touching and lets each
+        of them try to tag the other. Pairs are handled in player order
+        so tags always resolve the same way.
+        With swept contacts, pairs whose collision spheres met at any
+        point during the last step count too.
+        """
+        state = self.world_state
+        players = state.players
+        active = ~state.view('in_jail')
+
+        if self.config.swept_contacts:
+            pairs = sweptPairs(state.view('swept_from'), state.view('position'),
+                    state.view('team'), active, self.config.tag_distance)
         else:
-            self.blue_players_captured += n
+            pairs = touchingPairs(state.view('position'), state.view('team'),
+                    active, self.config.tag_distance)
+
+        for i, j in pairs:
+            players[i].tagAgent(players[j])
+            players[j].tagAgent(players[i])
+
+    def sweptContacts(self):
+        """
+        Picks up the flags and breaks the jails players ran right through
+        during the last step. The engine only checks where everybody
+        ended up, so it found the ones they stopped in, and last step's
+        check found the ones they started in.
+        Contacts are handled in player order, flags before jails, the
+        same order the engine uses.
+        """
+        state = self.world_state
+        start = state.view('swept_from')
+        end = state.view('position')
+        moving = numpy.flatnonzero((start != end).any(axis=1) &
+                                   ~state.view('in_jail'))
+        if not len(moving):
+            return
+        start = start[moving]
+        end = end[moving]
+
+        touched = []
+        for flag in self.registry.flags:
+            if flag.getCarrier() is not None:
+                continue
+            location = flag.getLocation()
+            center = (location.x, location.y, location.z)
+            reach = AGENT_RADIUS + FLAG_RADIUS
+            near = (sweptDistances(start, end, center) <= reach) & \
+                   (pointDistances(start, center) > reach) & \
+                   (pointDistances(end, center) > reach)
+            touched.extend([(i, 0, flag.state_index, flag)
+                            for i in moving[near].tolist()])
+
+        half = numpy.array(JAIL_SIZE) / 2.0
+        for number, jail in enumerate(self.registry.jails):
+            location = jail.getLocation()
+            center = numpy.array([location.x, location.y, location.z])
+            # Only players whose path passes near the box need a closer look.
+            reach = half + AGENT_RADIUS
+            near = ((numpy.minimum(start, end) <= center + reach) &
+                    (numpy.maximum(start, end) >= center - reach)).all(axis=1)
+            if not near.any():
+                continue
+            near[near] = (sweptBoxDistances(start[near], end[near],
+                    center, half) <= AGENT_RADIUS) & \
+                    (boxDistances(start[near], center, half) > AGENT_RADIUS) & \
+                    (boxDistances(end[near], center, half) > AGENT_RADIUS)
+            touched.extend([(i, 1, number, jail)
+                            for i in moving[near].tolist()])
+
+        players = state.players
+        for i, kind, number, item in sorted(touched, key=lambda t: t[:3]):
+            if kind == 0:
+                players[i].pickUp(item)
+            else:
+                players[i].jailBreak(item)
+
+    def moveEveryone(self):
+        """
+        Moves every player in one pass over the world state, once they
+        have all picked a speed and angle for this step.
+        Does what CTFPlayer.iterate does one player at a time otherwise.
+        """
+        state = self.world_state
+        players = state.players
+        active = ~state.view('in_jail')
+
+        # Carried flags were already moved along by their carriers, and
+        # jailed players put back in their spot, unless everybody decided
+        # at once and nothing could move.
+        if self.decisions is not None:
+            for player in players:
+                if player.in_jail:
+                    player.move(player.jailed_location)
+                elif player.carrying != None:
+                    player.carrying.move(player.getLocation())
+
+        # Players that are turning turn before they move.
+        for player in players:
+            if player.turning_left and not player.in_jail:
+                player.turnLeft()
+            if player.turning_right and not player.in_jail:
+                player.turnRight()
+
+        integrate(state.view('position'), state.view('heading'),
+                state.view('velocity'), state.view('angle'),
+                state.view('speed'), state.view('at_edge'), active,
+                self.config.integration_step, self.config.world_size / 2)
+
+        # Let the engine know where everybody ended up. Their engine
+        # velocity stays zero, the state has already moved them.
+        # No need to tell the sensors, they rebuild next tick.
+        for player, (x, y, z) in zip(players, state.view('position').tolist()):
+            breve.Mobile.move(player, breve.vector(x, y, z))
 
     def getNextIdNumber(self, agent):
         """
@@ -335,10 +793,31 @@ class CTFController(breve.Control):
         """
         Iterate method, runs the world another step.
         """
+        profiler = self.profiler
+        profiler.tick()
+        if self.watchdog is not None:
+            self.watchdog.tick()
+
+        # Everything has moved since the last tick.
+        profiler.phase('sensors')
+        self.updateSensors()
+
         # If the game is over let it rest.
-        if (self.red_wins + self.blue_wins + self.ties >= self.tournament_length):
+        if self.tournamentOver():
+            profiler.phase(None)
             return breve.Control.iterate(self)
-            
+
+        if self.recorder is not None:
+            profiler.phase('recording')
+            self.recorder.record(self)
+
+        # Players that bumped into each other last step.
+        profiler.phase('tags')
+        if self.config.swept_contacts:
+            self.sweptContacts()
+        self.resolveTags()
+
+        profiler.phase('rules')
 
         # If we are in a pause track, ignore the shit that
         # usually needs to happen
@@ -353,6 +832,17 @@ class CTFController(breve.Control):
             if self.iterations <= 2:
                 self.start_time = self.getTime()
 
+            # A team that went over its time budget gives up.
+            if self.forfeited is not None:
+                self.end_time = self.getTime()
+                if self.forfeited == RED_TEAM:
+                    print "*** The Red team forfeits ***"
+                    self.winner(BLUE_TEAM)
+                else:
+                    print "*** The Blue team forfeits ***"
+                    self.winner(RED_TEAM)
+                self.forfeited = None
+
             # If the blue flag has moved, kill the no tag zone.
             if self.blue_flag.hasMoved():
                 self.blue_flag.killNoTagZone()
@@ -363,13 +853,13 @@ class CTFController(breve.Control):
 
             # If all the red players were captured, report a win for blue.
             # Log end time.
-            if self.red_players_captured == 10:
+            if self.allCaptured(RED_TEAM):
                 self.end_time = self.getTime()
                 self.winner(BLUE_TEAM)
 
             # If all the blue players were captured, report a win for red.
             # Log end time.
-            if self.blue_players_captured == 10:
+            if self.allCaptured(BLUE_TEAM):
                 self.end_time = self.getTime()
                 self.winner(RED_TEAM)
 
@@ -398,21 +888,77 @@ class CTFController(breve.Control):
 
             # If time is up and no one has won.
             # It's a tie.
-            if game_time >= GAME_LENGTH:
+            if game_time >= self.config.game_length:
                 self.end_time = self.getTime()
                 self.winner(-1)
 
             # NOTE: used to use a format string, 
             #       but it noticably slowed down the simulation.
-            time_left_str = "Time Left: %.2f" % (500 - game_time)
+            time_left_str = "Time Left: %.2f" % (self.config.game_length - game_time)
 
+            profiler.phase('display')
             self.setDisplayText(time_left_str, -.2, -.9, 0)
+            profiler.phase('engine')
             breve.Control.iterate(self)
 
+        # The players iterate next and time themselves.
+        profiler.phase(None)
+
+    def postIterate(self):
+        """
+        Called after every object has iterated, before anything moves.
+        """
+        # With simultaneous ticks the players' iterates were put off
+        # until now. Tags and jail breaks may have moved things since
+        # the sensors were built, catch up first so deciding only reads.
+        if self.decisions is not None:
+            self.profiler.phase(None)
+            self.distances.refresh()
+            self.object_table.update(self)
+            self.decisions.decide()
+
+        # See SWEPT_CONTACTS. Where everybody is now is where this step's
+        # moves start from.
+        if self.config.swept_contacts:
+            state = self.world_state
+            state.view('swept_from')[:] = state.view('position')
+
+        if self.batched_movement:
+            self.profiler.phase('movement')
+            self.moveEveryone()
+            if self.watchdog is not None:
+                self.watchdog.moved()
+
+        # Whatever happens until the next tick is the engine.
+        self.profiler.phase('engine')
+
+def reportTournament(red_wins, blue_wins, ties):
+    """
+    Prints the results of a tournament to the console.
+    Returns the text to put on the screen.
+    Shared by the controller and the parallel tournament runner.
+    """
+    # Print the win count to the console.
+    print "The Blue team won %d games!" % (blue_wins)
+    print "The Red team won %d games!" % (red_wins)
+    print "There were %d tie games!" % (ties)
+
+    # Print the tournament winner to the console.
+    if blue_wins > red_wins:
+        print "The Blue team wins the tournament!"
+        return "Blue wins the Tournament!"
+    elif red_wins > blue_wins:
+        print "The Red team wins the tournament!"
+        return "Red wins the Tournament!"
+    else:
+        print "Red and Blue tied!"
+        return "The Tournament was a Tie!"
+
 class AgentShape(breve.CustomShape):
     """
     The pointy shape of an agent.
     """
+    __slots__ = ()
 
     def __init__(self):
         """
@@ -436,15 +982,70 @@ class AgentShape(breve.CustomShape):
         # finish the shape.
         self.finishShape(1.0)
 
+def makeJailShape():
+    """
+    Makes the cube jails are drawn with.
+    The world shares one, see Registry.getShared.
+    """
+    shape = breve.createInstances(breve.Cube, 1)
+    shape.initWith(breve.vector(*JAIL_SIZE))
+    return shape
+
+def makeFlagShape():
+    """
+    Makes the sphere flags are drawn with.
+    The world shares one, see Registry.getShared.
+    """
+    shape = breve.createInstances(breve.Sphere, 1)
+    shape.initWith(FLAG_RADIUS)
+    return shape
+
+def makeFlagImage():
+    """
+    Makes the star image flags are textured with.
+    The world shares one, see Registry.getShared.
+    """
+    image = breve.createInstances(breve.Image, 1)
+    image.load('images/star.png')
+    return image
+
+def makeZoneShape():
+    """
+    Makes the sphere no tag zones are drawn with.
+    The world shares one, see Registry.getShared.
+    """
+    shape = breve.createInstances(breve.Sphere, 1)
+    shape.initWith(NO_TAG_DISTANCE)
+    return shape
+
 class CTFMobile(breve.Mobile): 
     """
     The class of anything that can move and has a team in the sim.
     """
+    # Slots keep the thousands of these a long running process makes
+    # small. Bots' own subclasses still get a __dict__.
+    __slots__ = ('team',)
     def __init__(self):
         breve.Mobile.__init__(self)
+        # Claim a spot in the world state, if we keep one.
+        self.allocateState()
         # set the team to unknown
         self.team = -1
 
+    def allocateState(self):
+        """
+        Claims storage in the controller's world state.
+        Nothing to do for most mobiles.
+        """
+        pass
+
+    def move(self, location):
+        """
+        Moves the mobile and lets the controller's sensors know.
+        """
+        breve.Mobile.move(self, location)
+        self.controller.mobileMoved(self, location)
+
     def setTeam(self, team):
         """
         Sets the team to the specified team number.
@@ -473,10 +1074,7 @@ class Jail(CTFMobile):
     """
     Class for the CTF Jails.
     """
-    # Static variable used to count the number of instances
-    # Since this class is not a builtin breve class we must
-    # take care of the count on our own.
-    jails = []
+    __slots__ = ()
 
     def __init__(self):
         """
@@ -485,12 +1083,12 @@ class Jail(CTFMobile):
         """
         # Again, always call the parent's initalizer explicitly.
         CTFMobile.__init__(self)
-        shape = breve.createInstances(breve.Cube, 1)
-        shape.initWith(breve.vector(3, 1, 3))
-        self.setShape(shape)
+        self.setShape(self.controller.registry.getShared('jail', makeJailShape))
         self.setColor(breve.vector(0, 1, 0))
         self.setTransparency(.1)
-        Jail.jails.append(self)
+        # Since this class is not a builtin breve class we must
+        # keep track of the instances on our own.
+        self.controller.registry.jails.append(self)
 
     def jailBreak(self):
         """
@@ -498,21 +1096,21 @@ class Jail(CTFMobile):
         This method is executed when a collision is 
         detected between an agent and a jail.
         """
-        # Cheat and do a super free for all team 
-        # members. The team members see if they 
-        # need to be freed.
-        for item in CTFPlayer.players:
-            if (item.getTeam()) == self.team:
-                item.getFreed()
+        # Free everybody on our team that's locked up,
+        # the controller keeps track of who that is.
+        # Returns how many got out.
+        prisoners = self.controller.team_index.getJailed(self.team)
+        for item in prisoners:
+            item.getFreed()
+        return len(prisoners)
 
 class Flag(CTFMobile):
     """
     Flag class. Handles shape and non-tag zone
     and carry methods.
     """
-    # Again, we need to keep track of these since
-    # breve doesn't.
-    flags = []
+    __slots__ = ('carrier', 'image', 'start_position', 'my_no_tag_zone',
+                 'state_index')
 
     def __init__(self):
         """
@@ -530,8 +1128,15 @@ class Flag(CTFMobile):
 
         # Flag initalization
         self.init()
-        # Just ot keep track of the flags.
-        Flag.flags.append(self)
+        # Again, we need to keep track of these since
+        # breve doesn't.
+        self.controller.registry.flags.append(self)
+
+    def allocateState(self):
+        """
+        Registers with the world state so players can carry us.
+        """
+        self.state_index = self.controller.world_state.addFlag(self)
 
     def getCarrier(self):
         """
@@ -545,26 +1150,30 @@ class Flag(CTFMobile):
         Sets the carrier of the flag.
         """
         self.carrier = carrier
+        self.controller.object_table.stale = True
 
     def killNoTagZone(self):
         """
         Destroys the no tag zone around the flag.
         """
         if self.my_no_tag_zone:
-            # A call to the breve engine to delete the 
-            # no tag zone. del won't do it here...
-            breve.deleteInstances(self.my_no_tag_zone)
+            self.controller.logEvent('no_tag_zone', team=self.team,
+                                     location=self.getLocation())
+
+            # The controller keeps it for the next match rather
+            # than have breve delete it and make another.
+            self.controller.putAwayNoTagZone(self.my_no_tag_zone)
             self.my_no_tag_zone = None
 
     def hasMoved(self):
         """
-        Returns true if the flag has moved 5 or more units.
+        Returns true if the flag has moved NO_TAG_DISTANCE or more units.
         False otherwise. Used to tell if/when to kill the 
         no tag zone.
         """
         # Vectors have a length method!
         distance = (self.getLocation() - self.start_position).length()
-        if distance >= 5:
+        if distance >= NO_TAG_DISTANCE:
             return True
         else:
             return False
@@ -590,11 +1199,9 @@ class Flag(CTFMobile):
         self.start_position = self.getLocation()
         self.setCarrier(None)
 
-        # If there is a no tag zone, kill it and 
-        # make a fresh one.
-        if self.my_no_tag_zone:
-            self.killNoTagZone()
-        self.makeNoTagZone()
+        # If there's no no tag zone any more, get one.
+        if not self.my_no_tag_zone:
+            self.my_no_tag_zone = self.controller.getNoTagZone()
 
         # Move the sphere to the location of the flag.
         self.my_no_tag_zone.move(self.getLocation())
@@ -603,22 +1210,17 @@ class Flag(CTFMobile):
         """
         Makes the no tag zone.
         """
-        self.my_no_tag_zone = breve.createInstances(NoTagZone, 1)
+        self.my_no_tag_zone = self.controller.getNoTagZone()
         self.my_no_tag_zone.move(self.getLocation())
 
     def init(self):
         """
         Makes the flag and sets its shape and image.
         """
-        # make a shape and set the flag to that shape
-        shape = breve.createInstances(breve.Sphere, 1)
-        shape.initWith(1.5)
-        self.setShape(shape)
-
-        # set image
-        image = breve.createInstances(breve.Image, 1)
-        image.load('images/star.png')
-        self.setBitmapImage(image)
+        # set the flag to the shape and image all flags share
+        shared = self.controller.registry.getShared
+        self.setShape(shared('flag', makeFlagShape))
+        self.setBitmapImage(shared('star', makeFlagImage))
 
     def move(self, location):
         """
@@ -626,16 +1228,15 @@ class Flag(CTFMobile):
         Then calls the standard mobile move function.
         """
         # All checks for the edge of the world
-        # If we want to change the board size we need
-        # to change these accordingly.
-        if location.x > WORLD_SIZE / 2:
-            location.x = WORLD_SIZE / 2
-        if location.x < -WORLD_SIZE / 2:
-            location.x = -WORLD_SIZE / 2
-        if location.z > WORLD_SIZE / 2:
-            location.z = WORLD_SIZE / 2
-        if location.z < -WORLD_SIZE / 2:
-            location.z = -WORLD_SIZE / 2
+        edge = self.controller.config.world_size / 2
+        if location.x > edge:
+            location.x = edge
+        if location.x < -edge:
+            location.x = -edge
+        if location.z > edge:
+            location.z = edge
+        if location.z < -edge:
+            location.z = -edge
 
         # Call to parent class's move function
         CTFMobile.move(self, location)
@@ -645,8 +1246,7 @@ class NoTagZone(breve.Mobile):
     The no tag zone class.
     Used only for visualization.
     """
-    # Keep track of our instances
-    no_tag_zones = []
+    __slots__ = ()
 
     def __init__(self):
         """
@@ -654,19 +1254,37 @@ class NoTagZone(breve.Mobile):
         """
         # Parent constructor call, still needed.
         breve.Mobile.__init__(self)
-        shape = breve.createInstances(breve.Sphere, 1)
-        shape.initWith(5)
-        self.setShape(shape)
+        self.setShape(self.controller.registry.getShared('no tag zone',
+                                                         makeZoneShape))
         self.setTransparency(.2)
         self.setColor(breve.vector(0, 0, 0))
-        NoTagZone.no_tag_zones.append(self)
+        # Keep track of our instances
+        self.controller.registry.no_tag_zones.append(self)
+
+    def destroy(self):
+        """
+        Called when the zone is deleted.
+        """
+        self.controller.registry.no_tag_zones.remove(self)
 
 class CTFPlayer(CTFMobile):
     """
     CTFPlayer class. Has all of the agent callable methods.
     """
-    # Again, keep track
-    players = []
+    # The profiler, watchdog and simultaneous ticks wrap iterate and
+    # the sense methods per player, so players keep a __dict__ too.
+    # breve's own Mobile already has one, only headless.py's is slotted.
+    __slots__ = ('shape', 'turning_left', 'turning_right', 'team_home',
+                 'jailed_location', 'id_number', 'observation', 'world_state',
+                 'state_index')
+    if getattr(breve.Mobile, '__dictoffset__', 1) == 0:
+        __slots__ += ('__dict__',)
+
+    # Most player state lives in the controller's WorldState arrays.
+    # These look just like plain attributes.
+    velocity = stateProperty('speed', float, 'Speed, between 0 and 1.')
+    angle = stateProperty('angle', float, 'Turning angle in radians.')
+    at_edge = stateProperty('at_edge', bool, 'True when stopped at the edge.')
 
     def __init__(self):
         """
@@ -689,10 +1307,118 @@ class CTFPlayer(CTFMobile):
         self.in_jail = False
         self.jailed_location = breve.vector()
         self.id_number = 0
+        self.observation = None
 
         # Initalization and instance storage.
         self.init()
-        CTFPlayer.players.append(self)
+        self.controller.registry.players.append(self)
+
+    def allocateState(self):
+        """
+        Claims a slot in the controller's world state.
+        """
+        self.world_state = self.controller.world_state
+        self.state_index = self.world_state.addPlayer(self)
+        # Set by iterate below, so the watchdog can tell whether a bot
+        # that ran out of time already moved this tick.
+        self.moved_this_tick = False
+        self.controller.profiler.watch(self)
+        if self.controller.watchdog is not None:
+            self.controller.watchdog.watch(self)
+        if self.controller.decisions is not None:
+            self.controller.decisions.watch(self)
+
+    def getHeadingState(self):
+        """
+        Returns the direction the player faces, from the world state.
+        """
+        h = self.world_state.heading[self.state_index]
+        return breve.vector(h[0], h[1], h[2])
+
+    def setHeadingState(self, heading):
+        """
+        Stores the direction the player faces in the world state.
+        """
+        self.world_state.heading[self.state_index] = \
+                (heading.x, heading.y, heading.z)
+
+    heading = property(getHeadingState, setHeadingState,
+            doc='Direction the player is facing.')
+
+    def getCarryingState(self):
+        """
+        Returns the flag the player carries, or None, from the world state.
+        """
+        i = self.world_state.carrying[self.state_index]
+        if i < 0:
+            return None
+        return self.world_state.flags[i]
+
+    def setCarryingState(self, flag):
+        """
+        Stores the flag the player carries, or None, in the world state.
+        """
+        if flag is None:
+            self.world_state.carrying[self.state_index] = -1
+        else:
+            self.world_state.carrying[self.state_index] = flag.state_index
+        self.controller.object_table.stale = True
+
+    carrying = property(getCarryingState, setCarryingState,
+            doc='The flag being carried, or None.')
+
+    # Team and jail changes also go to the controller's team index.
+    def getTeamState(self):
+        """
+        Returns the player's team, from the world state.
+        """
+        return int(self.world_state.team[self.state_index])
+
+    def setTeamState(self, team):
+        """
+        Stores the player's team in the world state and the team index.
+        """
+        self.world_state.team[self.state_index] = team
+        self.controller.team_index.update(self, team, self.in_jail)
+        self.controller.object_table.stale = True
+
+    team = property(getTeamState, setTeamState,
+            doc='Team number, -1 if unknown.')
+
+    def getInJailState(self):
+        """
+        Returns true if the player is in jail, from the world state.
+        """
+        return bool(self.world_state.in_jail[self.state_index])
+
+    def setInJailState(self, in_jail):
+        """
+        Stores whether the player is in jail in the world state and index.
+        """
+        self.world_state.in_jail[self.state_index] = in_jail
+        self.controller.team_index.update(self, self.team, in_jail)
+        self.controller.object_table.stale = True
+
+    in_jail = property(getInJailState, setInJailState,
+            doc='True while in jail.')
+
+    def getLocation(self):
+        """
+        Returns the location of the player, from the world state.
+        """
+        p = self.world_state.position[self.state_index]
+        return breve.vector(p[0], p[1], p[2])
+
+    def move(self, location):
+        """
+        Moves the player, in the world state and in the engine.
+        """
+        self.world_state.position[self.state_index] = \
+                (location.x, location.y, location.z)
+        # Jumping somewhere isn't moving through everything in between.
+        self.world_state.swept_from[self.state_index] = \
+                (location.x, location.y, location.z)
+        CTFMobile.move(self, location)
 
     def init(self):
         """
@@ -704,26 +1430,17 @@ class CTFPlayer(CTFMobile):
         self.heading = breve.vector(1, 0, 0)
         self.id_number = self.controller.getNextIdNumber(self)
 
-        # create a shape and set the players shape to that shape.
-        shape = AgentShape()
-        self.setShape(shape)
+        # set the players shape to the one every player shares.
+        self.setShape(self.controller.registry.getShared('agent', AgentShape))
 
         # set up collision handlers
+        # Tagging other agents is handled by the controller,
+        # once a tick for everybody. See CTFController.resolveTags.
         self.handleCollisions('Flag', 'pickUp')
         self.handleCollisions('Jail', 'jailBreak')
 
-        # set up collision handling with other agents.
-        # we don't want to tag our own team do we?
-        for item in CTFPlayer.players:
-            item_type = item.getType()
-            self_type = self.getType()
-
-            if item_type != self_type:
-                item.handleCollisions(self_type, 'tagAgent')
-                self.handleCollisions(item_type, 'tagAgent')
-
         # Point ourselves in a random direction.
-        self.setAngle(breve.randomExpression(6.29))
+        self.setAngle(self.controller.randomExpression(6.29))
 
     def resetPlayer(self):
         """
@@ -764,20 +1481,22 @@ class CTFPlayer(CTFMobile):
         """
         Moves a player to a random location on its home side.
         """
+        world_size = self.controller.config.world_size
+
         # r = random
         # o = offset (offsets change depending on the side of the board)
-        r = breve.vector(WORLD_SIZE/4, 0, WORLD_SIZE)
+        r = breve.vector(world_size/4, 0, world_size)
         o = breve.vector()
 
         if self.team == 1:
-            o = breve.vector(WORLD_SIZE/4, 0, -WORLD_SIZE/2)
+            o = breve.vector(world_size/4, 0, -world_size/2)
             self.team_home = breve.vector(-1, 0, 0)
         else:
-            o = breve.vector(-WORLD_SIZE/4, 0, -WORLD_SIZE/2)
+            o = breve.vector(-world_size/4, 0, -world_size/2)
             self.team_home = breve.vector(-1, 0, 0)
 
         # Move the agent to random+offset location.
-        self.move(breve.randomExpression(r)+o)
+        self.move(self.controller.randomExpression(r)+o)
 
     def getMyHomeLocation(self):
         """
@@ -847,6 +1566,8 @@ class CTFPlayer(CTFMobile):
             # ok carry the flag, and let the flag know we're carrying it.
             self.carrying = flag
             flag.setCarrier(self)
+            self.controller.logEvent('pickup', self, self.team,
+                                     flag.getTeam())
 
     def drop(self):
         """
@@ -856,13 +1577,15 @@ class CTFPlayer(CTFMobile):
         if self.carrying != None:
             # Let the flag know we're dropping it.
             self.carrying.setCarrier(None)
+            self.controller.logEvent('drop', self, self.team,
+                                     self.carrying.getTeam())
 
         # drop the flag.
         self.carrying = None
 
     def tagAgent(self, agent):
         """
-        Collision handler with other players.
+        Called by the controller when we touch another player.
         Tags them and sends them to jail, or vice versa.
         """
         # cant tag friends
@@ -875,6 +1598,7 @@ class CTFPlayer(CTFMobile):
 
         # if we're offsides drop the flag and go to jail.
         if agent.checkIfOffsides():
+            self.controller.logEvent('tag', self, self.team, agent.state_index)
             agent.drop()
             agent.goToJail()
 
@@ -887,22 +1611,20 @@ class CTFPlayer(CTFMobile):
             return
 
         # set out in_jail flag to true
+        # This also counts us as captured in the controller's team index.
         self.in_jail = True
+        self.controller.logEvent('jail', self, self.team)
 
         # stick yourself in a random spot in red prison.
-        # Add one to the capture count
         if self.team == 1:
             self.jailed_location = self.controller.getRedJailLocation()
-            self.jailed_location += breve.randomExpression(breve.vector(1, 0, 1))
+            self.jailed_location += self.controller.randomExpression(breve.vector(1, 0, 1))
             self.jailed_location -= breve.vector(.5, -.5, .5)
-            self.controller.changePrisoners(RED_TEAM, 1)
-        # stick yourself in a random spot in red prison.
-        # Add one to the capture count
+        # stick yourself in a random spot in blue prison.
         else:
             self.jailed_location = self.controller.getBlueJailLocation()
-            self.jailed_location += breve.randomExpression(breve.vector(1, 0, 1))
+            self.jailed_location += self.controller.randomExpression(breve.vector(1, 0, 1))
             self.jailed_location -= breve.vector(.5, -.5, .5)
-            self.controller.changePrisoners(BLUE_TEAM, 1)
 
         # Move to that location
         self.move(self.jailed_location)
@@ -914,7 +1636,10 @@ class CTFPlayer(CTFMobile):
         """
         # If its the right jail and I'm not in jail, jailbreak
         if not self.in_jail and jail.getTeam() == self.team:
-            jail.jailBreak()
+            freed = jail.jailBreak()
+            if freed:
+                self.controller.logEvent('jailbreak', self, self.team,
+                                         value=freed)
 
     def inNoTagZone(self):
         """
@@ -922,8 +1647,8 @@ class CTFPlayer(CTFMobile):
         """
         myFlag = self.senseMyFlag()
         if myFlag != None:
-            distance = breve.length(self.getLocation() - myFlag.getLocation())
-            if distance <= 5 and not myFlag.hasMoved():
+            distance = self.controller.distances.between(self, myFlag)
+            if distance <= NO_TAG_DISTANCE and not myFlag.hasMoved():
                 return True
             else:
                 return False
@@ -937,15 +1662,10 @@ class CTFPlayer(CTFMobile):
             return
 
         # move home and toggle the in_jail flag
+        # (the controller's team index follows in_jail)
         self.moveToHomeside()
         self.in_jail = False
 
-        # Update the prisoner count
-        if self.team == 1:
-            self.controller.changePrisoners(RED_TEAM, -1)
-        else:
-            self.controller.changePrisoners(BLUE_TEAM, -1)
-
     def accelerate(self):
         """
         Accelerates the player by 0.1 velocity units.
@@ -983,21 +1703,23 @@ class CTFPlayer(CTFMobile):
         """
         Turns the player left.
         """
-        self.setAngle(self.angle - 0.03)
+        self.setAngle(self.angle - TURN_ANGLE * self.controller.time_scale)
 
     def turnRight(self):
         """
         Turns the player right.
         """
-        self.setAngle(self.angle + 0.03)
+        self.setAngle(self.angle + TURN_ANGLE * self.controller.time_scale)
 
     def senseMyJail(self):
         """
         Returns the players jail if within sensor range, none otherwise.
         """
-        for item in Jail.jails:
-            distance = breve.length(self.getLocation() - item.getLocation()) 
-            if item.getTeam() == self.team and distance < SENSOR_DISTANCE:
+        distances = self.controller.distances
+        sensor_distance = self.controller.config.sensor_distance
+        for item in self.controller.registry.jails:
+            distance = distances.between(self, item)
+            if item.getTeam() == self.team and distance < sensor_distance:
                 return item
         return None
 
@@ -1005,9 +1727,11 @@ class CTFPlayer(CTFMobile):
         """
         Returns the opponents jail if within sensor range, none otherwise.
         """
-        for item in Jail.jails:
-            distance = breve.length(self.getLocation() - item.getLocation()) 
-            if item.getTeam() != self.team and distance < SENSOR_DISTANCE:
+        distances = self.controller.distances
+        sensor_distance = self.controller.config.sensor_distance
+        for item in self.controller.registry.jails:
+            distance = distances.between(self, item)
+            if item.getTeam() != self.team and distance < sensor_distance:
                 return item
         return None
 
@@ -1015,9 +1739,11 @@ class CTFPlayer(CTFMobile):
         """
         Returns the players flag if within sensor range, none otherwise.
         """
-        for item in Flag.flags:
-            distance = breve.length(self.getLocation() - item.getLocation()) 
-            if item.getTeam() == self.team and distance < SENSOR_DISTANCE:
+        distances = self.controller.distances
+        sensor_distance = self.controller.config.sensor_distance
+        for item in self.controller.registry.flags:
+            distance = distances.between(self, item)
+            if item.getTeam() == self.team and distance < sensor_distance:
                 return item
         return None
 
@@ -1025,9 +1751,11 @@ class CTFPlayer(CTFMobile):
         """
         Returns the opponents flag if within sensor range, none otherwise.
         """
-        for item in Flag.flags:
-            distance = breve.length(self.getLocation() - item.getLocation()) 
-            if item.getTeam() != self.team and distance < SENSOR_DISTANCE:
+        distances = self.controller.distances
+        sensor_distance = self.controller.config.sensor_distance
+        for item in self.controller.registry.flags:
+            distance = distances.between(self, item)
+            if item.getTeam() != self.team and distance < sensor_distance:
                 return item
         return None
 
@@ -1036,10 +1764,13 @@ class CTFPlayer(CTFMobile):
         Returns all teammates within sensor range or an empty list.
         """
         result = []
-        for item in CTFPlayer.players:
-            distance = breve.length(self.getLocation() - item.getLocation()) 
+        sensor_distance = self.controller.config.sensor_distance
+        row = self.controller.distances.row(self)
+        index = self.controller.distances.index
+        for item in self.controller.player_grid.near(self.getLocation(), sensor_distance):
+            distance = row[index[item]]
             if item.getTeam() == self.team and not item.getInJail() \
-                    and distance < SENSOR_DISTANCE:
+                    and distance < sensor_distance:
                 result.append(item)
         return result 
 
@@ -1048,10 +1779,13 @@ class CTFPlayer(CTFMobile):
         Returns all opponents within sensor range or an empty list.
         """
         result = []
-        for item in CTFPlayer.players:
-            distance = breve.length(self.getLocation() - item.getLocation()) 
+        sensor_distance = self.controller.config.sensor_distance
+        row = self.controller.distances.row(self)
+        index = self.controller.distances.index
+        for item in self.controller.player_grid.near(self.getLocation(), sensor_distance):
+            distance = row[index[item]]
             if item.getTeam() != self.team and not item.getInJail() \
-                    and distance < SENSOR_DISTANCE:
+                    and distance < sensor_distance:
                 result.append(item)
         return result 
 
@@ -1061,9 +1795,10 @@ class CTFPlayer(CTFMobile):
         """
         best_distance = 200
         best = None
+        distances = self.controller.distances
 
         for item in self.senseOtherTeam():
-            distance_to_enemy = breve.length(self.getLocation() - item.getLocation()) 
+            distance_to_enemy = distances.between(self, item)
             if distance_to_enemy < best_distance:
                 best = item
                 best_distance = distance_to_enemy 
@@ -1086,16 +1821,32 @@ class CTFPlayer(CTFMobile):
         Vector angle crap. 
         Given a vector and a players own locational vector what is the angle
         to the given vector.
+        Worked out from the world state, no trips to the engine.
         """
-        toO = vect - self.getLocation()
-        a = breve.breveInternalFunctionFinder.angle(self, self.heading, toO)
+        state = self.world_state
+        i = self.state_index
+        return signedAngle(state.position[i].tolist(), state.heading[i].tolist(),
+                           self.angle, (vect.x, vect.y, vect.z))
 
-        transpose = breve.breveInternalFunctionFinder.transpose(self, self.getRotation())
-        transpose *= toO
-        if transpose.x < 0.0:
-            return -a
-        else:
-            return a
+    def getAngles(self, points):
+        """
+        getAngle for a lot of points at once. Takes a list of vectors
+        or an N by 3 array, returns an array of angles in the same order.
+        """
+        state = self.world_state
+        i = self.state_index
+        return signedAngles(state.position[i].tolist(), state.heading[i].tolist(),
+                            self.angle, points)
+
+    def observe(self):
+        """
+        Returns everything this player can sense as numpy arrays,
+        see observation.py. The arrays are reused, the next call
+        overwrites them.
+        """
+        if self.observation is None:
+            self.observation = Observation()
+        return self.observation.fill(self)
 
     def detectEdge(self):
         """
@@ -1108,15 +1859,40 @@ class CTFPlayer(CTFMobile):
         """
         Handles the agents iterate loop.
         """
+        # The watchdog's alarm mustn't go off halfway through moving,
+        # it would leave the sensors' indexes half updated.
+        watchdog = self.controller.watchdog
+        if watchdog is None:
+            return self.moveAlong()
+        watchdog.hold()
+        try:
+            return self.moveAlong()
+        finally:
+            watchdog.release()
+
+    def moveAlong(self):
+        """
+        Moves the agent along for the tick, see iterate.
+        """
+        self.moved_this_tick = True
+
         # if in jail stay in jail
+        # (simultaneous ticks leave that to the controller too)
         if self.in_jail:
-            self.move(self.jailed_location)
+            if self.controller.decisions is None:
+                self.move(self.jailed_location)
             return
 
         # if we are carrying the flag, move the flag with us
-        if self.carrying != None:
+        # (before anyone after us senses it, even with batched movement,
+        # simultaneous ticks leave it to the controller)
+        if self.carrying != None and self.controller.decisions is None:
             self.carrying.move(self.getLocation())
 
+        # the controller moves everybody at once, see moveEveryone.
+        if self.controller.batched_movement:
+            return CTFMobile.iterate(self)
+
         # if we are turning left, actually turn left.
         if self.turning_left:
             self.turnLeft()
@@ -1129,16 +1905,17 @@ class CTFPlayer(CTFMobile):
         myvel = self.getHeading()
 
         # check if we are at the edge of the world and stop if we are.
-        if myloc.x > (WORLD_SIZE / 2) and myvel.x > 0.0:
+        edge = self.controller.config.world_size / 2
+        if myloc.x > edge and myvel.x > 0.0:
             self.setSpeed(0)
             self.at_edge = True
-        elif myloc.z > (WORLD_SIZE / 2) and myvel.z > 0.0:
+        elif myloc.z > edge and myvel.z > 0.0:
             self.setSpeed(0)
             self.at_edge = True
-        elif myloc.x < -(WORLD_SIZE / 2) and myvel.x < 0.0:
+        elif myloc.x < -edge and myvel.x < 0.0:
             self.setSpeed(0)
             self.at_edge = True
-        elif myloc.z < -(WORLD_SIZE / 2) and myvel.z < 0.0:
+        elif myloc.z < -edge and myvel.z < 0.0:
             self.setSpeed(0)
             self.at_edge = True
         else:
@@ -1155,7 +1932,10 @@ class CTFPlayer(CTFMobile):
         # I don't remember why this works, but it does.
         # Looks like half the speed times the heading vector 
         # gives us our velocity vector
-        self.setVelocity(.5 * self.velocity * self.heading)
+        velocity = .5 * self.velocity * self.heading
+        self.setVelocity(velocity)
+        self.world_state.velocity[self.state_index] = \
+                (velocity.x, velocity.y, velocity.z)
 
         # always hover above the ground a bit
         myloc.y = 0.2
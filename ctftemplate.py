@@ -6,13 +6,13 @@ class MyCTFController(CTFController):
         CTFController.__init__(self)
 
         self.blue_team = []
-        for i in range(10):
+        for i in range(self.config.team_size):
             member = MyBluePlayer()
             member.setTeam(0)
             self.blue_team.append(member)
 
         self.red_team = []
-        for member in range(10):
+        for member in range(self.config.team_size):
             member = MyRedPlayer()
             member.setTeam(1)
             self.red_team.append(member)
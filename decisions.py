@@ -0,0 +1,109 @@
+"""
+Two phase ticks, where every player decides from the same snapshot.
+
+Normally players iterate one after another and each one sees whatever
+the ones before it did. With CTFConfig(simultaneous=True) a tick is
+split in two:
+
+1. Every player's iterate runs against the world as it was at the start
+   of the tick. Nothing moves while they decide, carried flags and
+   jailed players included, so the order they run in doesn't matter
+   and they can be spread over several threads
+   (CTFConfig(decision_threads=...)).
+2. The controller then moves everybody at once, like batched movement.
+
+Threads only help bots that spend their time outside the interpreter
+lock, in numpy or waiting on something. Bots are live objects tied to
+the engine, so they can't be farmed out to other processes.
+
+While a player decides, anything random it asks the controller for
+comes from a generator of its own, so games are repeatable no matter
+which thread gets to which player first. With more than one thread the
+profiler's sense call counts can come out a little low.
+"""
+import threading
+from multiprocessing.pool import ThreadPool
+
+class DecisionPool(object):
+    """
+    Runs a controller's player iterates all at once, when told to.
+    make_random builds a player's generator from a seed.
+    """
+
+    def __init__(self, controller, threads=1, make_random=None):
+        self.controller = controller
+        self.threads = threads
+        self.make_random = make_random
+
+        self.players = []
+        self.decide_calls = {}      # player -> its real iterate
+        self.randoms = {}           # player -> its random generator
+        self.current = threading.local()
+
+        self.pool = None
+        if threads > 1:
+            self.pool = ThreadPool(threads)
+
+    def watch(self, player):
+        """
+        Puts off player's iterate until decide is called.
+        """
+        self.players.append(player)
+        self.decide_calls[player] = player.iterate
+        if self.make_random is not None:
+            # Unseeded games draw each player's seed from the controller.
+            seed = self.controller.seed
+            if seed is None:
+                seed = self.controller.random.getrandbits(64)
+            self.randoms[player] = self.make_random(
+                    (seed, player.state_index))
+
+        def deferredIterate():
+            pass
+        player.iterate = deferredIterate
+
+    def deciding(self):
+        """
+        Returns the player deciding on this thread, or None.
+        """
+        return getattr(self.current, 'player', None)
+
+    def getRandom(self):
+        """
+        Returns the generator of the player deciding on this thread,
+        or None outside of a decision.
+        """
+        player = self.deciding()
+        if player is None:
+            return None
+        return self.randoms.get(player)
+
+    def decideOne(self, player):
+        """
+        Runs player's real iterate, with its random generator the one
+        getRandom returns on this thread.
+        """
+        self.current.player = player
+        try:
+            self.decide_calls[player]()
+        finally:
+            self.current.player = None
+
+    def close(self):
+        """
+        Stops the threads, once the world is done with.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def decide(self):
+        """
+        Runs every player's iterate. Returns once they are all done.
+        """
+        if self.pool is None:
+            for player in self.players:
+                self.decideOne(player)
+        else:
+            self.pool.map(self.decideOne, self.players)
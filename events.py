@@ -0,0 +1,288 @@
+"""
+A log of everything that happens in a game, for statistics.
+
+Give a controller an EventLog and it writes a row for every flag pickup
+and drop, tag, jailing, jail break, no tag zone removal and match end:
+
+    controller.events = EventLog('events/')
+
+or use --events DIR on headless.py and tournament.py. Rows are buffered
+and handed to a background thread a shard at a time, which writes each
+shard to its own file, CSV by default or NPZ. Shards are written under a
+temporary name and renamed when complete, and never touched again, so
+other programs can read a directory while games are still adding to it.
+
+Every row has the columns in COLUMNS:
+
+    game      the game's seed, -1 if it wasn't seeded
+    match     match number in the game's tournament, from 1
+    tick      controller iterations into the match
+    time      simulation time
+    event     one of EVENTS
+    team      team of the player or flag, the winner for 'end' (-1 tie)
+    player    the player's slot in the world, -1 if none
+    bot       the player's class name
+    other     the other player for 'tag', the flag's team for 'pickup'
+              and 'drop', -1 otherwise
+    x, z      where it happened
+    value     players freed for 'jailbreak', match length for 'end',
+              ticks the team held the other flag for 'possession'
+
+Load a directory of shards with loadEvents, or summarise one with
+
+    python events.py events/
+"""
+import csv
+import glob
+import itertools
+import os
+import threading
+import Queue
+
+import numpy
+
+COLUMNS = ('game', 'match', 'tick', 'time', 'event', 'team', 'player', 'bot',
+           'other', 'x', 'z', 'value')
+
+# numpy types of the columns, for NPZ shards and loading.
+TYPES = ('i8', 'i4', 'i4', 'f8', 'S16', 'i1', 'i4', 'S64', 'i4', 'f4', 'f4', 'f8')
+
+EVENTS = ('pickup', 'drop', 'tag', 'jail', 'jailbreak', 'no_tag_zone',
+          'end', 'possession')
+
+FORMATS = ('csv', 'npz')
+
+# Rows in a shard.
+SHARD_SIZE = 50000
+
+# Shards that may wait for the writer before logging blocks.
+MAX_PENDING = 4
+
+# Numbers the logs this process names, so none of them share a name.
+logNumbers = itertools.count(1)
+
+class EventLog(object):
+    """
+    Buffers events and writes them out as shards in directory, named
+    name-00000.csv and so on. By default name is made from the game's
+    seed, the process id and a count of logs in the process, so games
+    can share a directory, even ones with the same seed. Call close()
+    when done.
+    """
+
+    def __init__(self, directory, name=None, shard_size=SHARD_SIZE,
+            format='csv'):
+        if format not in FORMATS:
+            raise ValueError('unknown event log format %r, expected one of %s' %
+                             (format, ', '.join(FORMATS)))
+        self.directory = directory
+        self.name = name
+        self.shard_size = shard_size
+        self.format = format
+
+        self.rows = []
+        self.shards = 0
+        self.queue = Queue.Queue(MAX_PENDING)
+        self.writer = None
+        self.error = None
+
+    def start(self, controller):
+        """
+        Picks a name and starts the writer. Called on the first event.
+        """
+        if self.name is None:
+            if controller.seed is None:
+                self.name = 'events-%d-%d' % (os.getpid(), logNumbers.next())
+            else:
+                self.name = 'game-%d-%d-%d' % (controller.seed, os.getpid(),
+                                               logNumbers.next())
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.writer = threading.Thread(target=self.writeShards)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def log(self, controller, event, player=None, team=-1, other=-1,
+            value=0.0, location=None):
+        """
+        Adds a row. location defaults to the player's.
+        """
+        if self.writer is None:
+            self.start(controller)
+
+        game = controller.seed
+        if game is None:
+            game = -1
+        match = controller.red_wins + controller.blue_wins + controller.ties + 1
+
+        index = -1
+        bot = ''
+        if player is not None:
+            index = player.state_index
+            bot = player.__class__.__name__
+            if location is None:
+                location = player.getLocation()
+        x = z = 0.0
+        if location is not None:
+            x = location.x
+            z = location.z
+
+        self.rows.append((game, match, controller.iterations,
+                controller.getTime(), event, team, index, bot, other,
+                x, z, value))
+        if len(self.rows) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Hands the buffered rows to the writer as a shard.
+        """
+        if self.error is not None:
+            raise self.error
+        if not self.rows:
+            return
+        self.queue.put((self.shards, self.rows))
+        self.shards += 1
+        self.rows = []
+
+    def sync(self):
+        """
+        Hands over the buffered rows and waits until every shard so far
+        is on disk.
+        """
+        self.flush()
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Writes whatever is left and waits for the writer to finish.
+        """
+        if self.writer is None:
+            return
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+        self.writer = None
+        if self.error is not None:
+            raise self.error
+
+    def shardPath(self, number):
+        return os.path.join(self.directory, '%s-%05d.%s' %
+                            (self.name, number, self.format))
+
+    def writeShards(self):
+        """
+        The writer thread. Writes shards until it's handed None.
+        """
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self.writeShard(*item)
+            finally:
+                self.queue.task_done()
+
+    def writeShard(self, number, rows):
+        path = self.shardPath(number)
+        try:
+            writeShard(path + '.tmp', rows, self.format)
+            os.rename(path + '.tmp', path)
+        except Exception, error:
+            # Raised in the simulation's thread on the next flush.
+            self.error = error
+
+def writeShard(path, rows, format):
+    """
+    Writes rows to a shard file.
+    """
+    if format == 'csv':
+        output = open(path, 'wb')
+        writer = csv.writer(output)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+        output.close()
+        return
+
+    columns = zip(*rows)
+    arrays = {}
+    for name, kind, values in zip(COLUMNS, TYPES, columns):
+        arrays[name] = numpy.array(values, kind)
+    output = open(path, 'wb')
+    numpy.savez(output, **arrays)
+    output.close()
+
+def readShard(path):
+    """
+    Returns a dictionary of column arrays from one shard.
+    """
+    if path.endswith('.npz'):
+        data = numpy.load(path)
+        return dict([(name, data[name]) for name in COLUMNS])
+
+    reader = csv.reader(open(path, 'rb'))
+    header = reader.next()
+    columns = zip(*reader)
+    if not columns:
+        columns = [()] * len(header)
+    arrays = {}
+    for name, kind, values in zip(COLUMNS, TYPES, columns):
+        arrays[name] = numpy.array(values).astype(kind)
+    return arrays
+
+def loadEvents(directory, pattern='*'):
+    """
+    Loads every finished shard in directory whose name matches pattern
+    into one dictionary of column arrays.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern + '.csv')) +
+                   glob.glob(os.path.join(directory, pattern + '.npz')))
+    shards = [readShard(path) for path in paths]
+
+    events = {}
+    for name, kind in zip(COLUMNS, TYPES):
+        if shards:
+            events[name] = numpy.concatenate([shard[name] for shard in shards])
+        else:
+            events[name] = numpy.zeros(0, kind)
+    return events
+
+def summarise(events, out):
+    """
+    Prints event counts by bot and the match results.
+    """
+    ends = events['event'] == 'end'
+    games = len(set(zip(events['game'][ends], events['match'][ends])))
+    out.write('%d events from %d matches\n' % (len(events['event']), games))
+
+    for team, name in [(0, 'Blue'), (1, 'Red'), (-1, 'Tied')]:
+        out.write('  %s %d' % (name, numpy.sum(events['team'][ends] == team)))
+    out.write('\n')
+
+    kinds = [kind for kind in EVENTS if kind not in ('end', 'possession', 'no_tag_zone')]
+    bots = sorted(set(events['bot']) - set(['']))
+    out.write('%-24s' % ('bot') + ''.join(['%11s' % kind for kind in kinds]) + '\n')
+    for bot in bots:
+        mine = events['bot'] == bot
+        out.write('%-24s' % (bot))
+        for kind in kinds:
+            out.write('%11d' % numpy.sum(mine & (events['event'] == kind)))
+        out.write('\n')
+
+if __name__ == '__main__':
+    import optparse
+    import sys
+
+    parser = optparse.OptionParser(usage='%prog [options] DIRECTORY')
+    parser.add_option('--pattern', default='*',
+            help='only shards whose names match this')
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('expected one directory')
+
+    summarise(loadEvents(args[0], options.pattern), sys.stdout)
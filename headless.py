@@ -0,0 +1,867 @@
+"""
+A headless stand in for the parts of breve that ctf.py uses.
+
+breve is only needed to look at a game. This module implements just
+enough of the breve python API (vectors, matrices, Control, Mobile,
+shapes and collision callbacks) to run the simulation with no
+rendering, as fast as the CPU allows.
+
+Run a bot file the same way breve would:
+
+    python headless.py ctftemplate.py
+
+Or from python:
+
+    import headless
+    controller = headless.run('ctftemplate.py')
+
+install() registers this module as 'breve' so ctf.py and unmodified
+bots import it instead of the real thing.
+"""
+import math
+import os
+import random
+import sys
+
+# The world currently being built. Objects attach themselves to it
+# when they are created, the same way breve objects do.
+_world = None
+
+# Used by randomExpression. Call seed() for repeatable runs.
+_random = random.Random()
+
+# How far apart two objects with no shape are allowed to be and still touch.
+# Only used as a fallback, everything in ctf.py has a shape.
+_DEFAULT_RADIUS = 0.0
+
+###############################################################################
+# Math
+###############################################################################
+
+class vector(object):
+    """
+    A breve style 3d vector. Mutable, just like breve's.
+    """
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def __add__(self, other):
+        return vector(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return vector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, scalar):
+        return vector(self.x * scalar, self.y * scalar, self.z * scalar)
+
+    __rmul__ = __mul__
+
+    def __div__(self, scalar):
+        return vector(self.x / scalar, self.y / scalar, self.z / scalar)
+
+    __truediv__ = __div__
+
+    def __neg__(self):
+        return vector(-self.x, -self.y, -self.z)
+
+    def __eq__(self, other):
+        if not isinstance(other, vector):
+            return False
+        return self.x == other.x and self.y == other.y and self.z == other.z
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'vector(%f, %f, %f)' % (self.x, self.y, self.z)
+
+    def length(self):
+        """
+        Returns the length of the vector.
+        """
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def dot(self, other):
+        """
+        Returns the dot product with another vector.
+        """
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
+class matrix(object):
+    """
+    A breve style 3x3 matrix, stored row major.
+    Matrices are never changed in place so they can be shared.
+    """
+    __slots__ = ('m',)
+
+    def __init__(self, *values):
+        if not values:
+            values = (1, 0, 0, 0, 1, 0, 0, 0, 1)
+        self.m = tuple([float(v) for v in values])
+
+    def __mul__(self, other):
+        m = self.m
+        if isinstance(other, vector):
+            return vector(m[0] * other.x + m[1] * other.y + m[2] * other.z,
+                          m[3] * other.x + m[4] * other.y + m[5] * other.z,
+                          m[6] * other.x + m[7] * other.y + m[8] * other.z)
+        if isinstance(other, matrix):
+            o = other.m
+            result = []
+            for row in range(3):
+                for col in range(3):
+                    result.append(m[row * 3] * o[col] +
+                                  m[row * 3 + 1] * o[3 + col] +
+                                  m[row * 3 + 2] * o[6 + col])
+            return matrix(*result)
+        return matrix(*[v * other for v in m])
+
+    def __repr__(self):
+        return 'matrix(%s)' % ', '.join(['%f' % v for v in self.m])
+
+    def transpose(self):
+        """
+        Returns the transpose of this matrix.
+        """
+        m = self.m
+        return matrix(m[0], m[3], m[6], m[1], m[4], m[7], m[2], m[5], m[8])
+
+def rotationMatrix(axis, angle):
+    """
+    Returns the matrix that rotates angle radians around axis.
+    """
+    length = axis.length()
+    if length == 0.0:
+        return matrix()
+
+    x, y, z = axis.x / length, axis.y / length, axis.z / length
+    c = math.cos(angle)
+    s = math.sin(angle)
+    t = 1.0 - c
+
+    return matrix(t * x * x + c,     t * x * y - s * z, t * x * z + s * y,
+                  t * x * y + s * z, t * y * y + c,     t * y * z - s * x,
+                  t * x * z - s * y, t * y * z + s * x, t * z * z + c)
+
+def length(v):
+    """
+    Returns the length of a vector.
+    """
+    return v.length()
+
+def seed(n):
+    """
+    Seeds the generator behind randomExpression.
+    """
+    _random.seed(n)
+
+def randomExpression(value):
+    """
+    Returns a random value between 0 and value, inclusive.
+    Works on ints, floats and vectors just like breve's.
+    """
+    if isinstance(value, vector):
+        return vector(_random.uniform(0, value.x),
+                      _random.uniform(0, value.y),
+                      _random.uniform(0, value.z))
+    if isinstance(value, int):
+        return _random.randint(0, value)
+    return _random.uniform(0, value)
+
+class _InternalFunctionFinder(object):
+    """
+    The handful of breve internal functions ctf.py calls directly.
+    """
+
+    def angle(self, caller, a, b):
+        """
+        Returns the angle between two vectors in radians.
+        """
+        lengths = a.length() * b.length()
+        if lengths == 0.0:
+            return 0.0
+
+        cosine = a.dot(b) / lengths
+        cosine = max(-1.0, min(1.0, cosine))
+        return math.acos(cosine)
+
+    def transpose(self, caller, m):
+        """
+        Returns the transpose of a matrix.
+        """
+        return m.transpose()
+
+breveInternalFunctionFinder = _InternalFunctionFinder()
+
+###############################################################################
+# The world
+###############################################################################
+
+class World(object):
+    """
+    Everything that exists in one simulation.
+    Stepping the world iterates every object, post iterates them,
+    moves the mobiles and then fires collision callbacks, in that
+    order, like breve.
+    """
+
+    def __init__(self):
+        self.controller = None
+        self.objects = []
+        self.iterators = []
+        self.post_iterators = []
+        self.mobiles = []
+        self.by_type = {}
+        self.time = 0.0
+        self.step_size = 0.05
+
+    def add(self, obj):
+        """
+        Registers a newly created object.
+        """
+        self.objects.append(obj)
+
+        # Only bother calling iterate on objects that override it.
+        if _overrides(obj, 'iterate'):
+            self.iterators.append(obj)
+        if _overrides(obj, 'postIterate'):
+            self.post_iterators.append(obj)
+
+        if isinstance(obj, Mobile):
+            self.mobiles.append(obj)
+
+        # Index the object under every class name it can be matched as
+        # by handleCollisions, just like breve does for subclasses.
+        for cls in type(obj).__mro__:
+            self.by_type.setdefault(cls.__name__, []).append(obj)
+
+    def remove(self, obj):
+        """
+        Removes a deleted object from the world.
+        """
+        for group in [self.objects, self.iterators, self.post_iterators,
+                self.mobiles]:
+            if obj in group:
+                group.remove(obj)
+
+        for cls in type(obj).__mro__:
+            group = self.by_type.get(cls.__name__)
+            if group and obj in group:
+                group.remove(obj)
+
+    def step(self):
+        """
+        Runs the world one integration step.
+        """
+        # Copy the lists, iterate may create or delete objects.
+        for obj in list(self.iterators):
+            if obj._alive:
+                obj.iterate()
+
+        for obj in list(self.post_iterators):
+            if obj._alive:
+                obj.postIterate()
+
+        dt = self.step_size
+        for obj in self.mobiles:
+            v = obj._velocity
+            if v.x or v.y or v.z:
+                loc = obj._location
+                loc.x += v.x * dt
+                loc.y += v.y * dt
+                loc.z += v.z * dt
+
+        self.time += dt
+        self.collide()
+
+    def destroy(self):
+        """
+        Deletes everything in the world, the controller last.
+        """
+        controller = self.controller
+        objects = [obj for obj in self.objects if obj is not controller]
+        if controller is not None:
+            objects.append(controller)
+        for obj in objects:
+            if obj._alive:
+                obj.destroy()
+                obj._alive = False
+
+        self.objects = []
+        self.iterators = []
+        self.post_iterators = []
+        self.mobiles = []
+        self.by_type = {}
+
+    def collide(self):
+        """
+        Fires the collision callbacks of every pair of touching objects.
+        """
+        for obj in list(self.mobiles):
+            if not obj._handlers or not obj._alive:
+                continue
+
+            for type_name, method in obj._handlers:
+                for other in list(self.by_type.get(type_name, ())):
+                    if other is obj or not other._alive or not obj._alive:
+                        continue
+                    if _touching(obj, other):
+                        getattr(obj, method)(other)
+
+def _overrides(obj, name):
+    """
+    Returns true if the objects class replaces the base Object method.
+    """
+    method = getattr(type(obj), name)
+    return getattr(method, '__func__', method) is not \
+            getattr(Object.__dict__[name], '__func__', Object.__dict__[name])
+
+def _touching(a, b):
+    """
+    Returns true if the shapes of a and b overlap.
+    Boxes are axis aligned, everything else is treated as a sphere.
+    """
+    a_shape = a._shape
+    b_shape = b._shape
+
+    if isinstance(b_shape, Cube):
+        a, b = b, a
+        a_shape, b_shape = b_shape, a_shape
+
+    if b_shape is None:
+        radius = _DEFAULT_RADIUS
+    else:
+        radius = b_shape._radius
+
+    center = b._location
+    loc = a._location
+
+    if isinstance(a_shape, Cube):
+        # Closest point on the box to the sphere center.
+        half = a_shape._half
+        dx = max(abs(center.x - loc.x) - half.x, 0.0)
+        dy = max(abs(center.y - loc.y) - half.y, 0.0)
+        dz = max(abs(center.z - loc.z) - half.z, 0.0)
+        return dx * dx + dy * dy + dz * dz <= radius * radius
+
+    if a_shape is None:
+        reach = radius + _DEFAULT_RADIUS
+    else:
+        reach = radius + a_shape._radius
+
+    dx = center.x - loc.x
+    dy = center.y - loc.y
+    dz = center.z - loc.z
+    return dx * dx + dy * dy + dz * dz <= reach * reach
+
+def getWorld():
+    """
+    Returns the world currently being built or run.
+    """
+    return _world
+
+###############################################################################
+# breve classes
+###############################################################################
+
+class Object(object):
+    """
+    Base class of everything in a world.
+    Slotted all the way down, like vector, so worlds full of objects
+    stay small. Subclasses without __slots__ get a __dict__ as usual.
+    """
+    __slots__ = ('_alive', '_world', 'controller')
+
+    def __init__(self):
+        self._alive = True
+        self._world = _world
+        if _world is not None:
+            self.controller = _world.controller
+            _world.add(self)
+        else:
+            self.controller = None
+
+    def getType(self):
+        """
+        Returns the class name of the object.
+        """
+        return type(self).__name__
+
+    def iterate(self):
+        """
+        Called once per step. Does nothing by default.
+        """
+        pass
+
+    def postIterate(self):
+        """
+        Called once per step, after every object has iterated.
+        Does nothing by default.
+        """
+        pass
+
+    def destroy(self):
+        """
+        Called when the object is deleted.
+        """
+        pass
+
+class Abstract(Object):
+    __slots__ = ()
+
+class Control(Object):
+    """
+    The controller of a world. Creating one starts a new world.
+    """
+
+    def __init__(self):
+        global _world
+        _world = World()
+        _world.controller = self
+        self._display_text = {}
+        Object.__init__(self)
+
+    def setIntegrationStep(self, step):
+        """
+        Sets the amount of simulation time one step takes.
+        """
+        self._world.step_size = float(step)
+
+    def getTime(self):
+        """
+        Returns the current simulation time.
+        """
+        return self._world.time
+
+    def setDisplayText(self, text, x=0.0, y=0.0, number=0):
+        """
+        Remembers the text breve would have drawn.
+        """
+        self._display_text[number] = text
+
+    # Rendering only, nothing to do without a screen.
+    def setDisplayTextScale(self, scale):
+        pass
+
+    def disableReflections(self):
+        pass
+
+    def enableLighting(self):
+        pass
+
+    def disableShadows(self):
+        pass
+
+    def moveLight(self, location):
+        pass
+
+    def pointCamera(self, target, offset=None):
+        pass
+
+    def watch(self, obj):
+        pass
+
+class Shape(Abstract):
+    """
+    Base class of collision shapes.
+    radius is the radius of a sphere that contains the whole shape.
+    """
+    __slots__ = ('_radius',)
+
+    def __init__(self):
+        Abstract.__init__(self)
+        self._radius = 0.0
+
+class Sphere(Shape):
+    __slots__ = ()
+
+    def initWith(self, radius):
+        self._radius = float(radius)
+        return self
+
+class Cube(Shape):
+    __slots__ = ('_half',)
+
+    def __init__(self):
+        Shape.__init__(self)
+        self._half = vector()
+
+    def initWith(self, size):
+        self._half = size * 0.5
+        self._radius = self._half.length()
+        return self
+
+class CustomShape(Shape):
+    __slots__ = ('_points',)
+
+    def __init__(self):
+        Shape.__init__(self)
+        self._points = []
+
+    def addFace(self, points):
+        self._points.extend(points)
+
+    def finishShape(self, density):
+        # Bounding sphere around the center of the points.
+        if not self._points:
+            return self
+        n = float(len(self._points))
+        center = vector()
+        for p in self._points:
+            center = center + p
+        center = center / n
+        self._radius = max([(p - center).length() for p in self._points])
+        return self
+
+class Image(Abstract):
+    __slots__ = ('_name',)
+
+    def load(self, name):
+        self._name = name
+        return self
+
+class Real(Object):
+    """
+    Anything that physically exists in the world.
+    """
+    __slots__ = ('_shape', '_location', '_rotation')
+
+    def __init__(self):
+        Object.__init__(self)
+        self._shape = None
+        self._location = vector()
+        self._rotation = matrix()
+
+    def getLocation(self):
+        """
+        Returns a copy of the current location.
+        """
+        loc = self._location
+        return vector(loc.x, loc.y, loc.z)
+
+    def getRotation(self):
+        """
+        Returns the rotation matrix.
+        """
+        return self._rotation
+
+    def setShape(self, shape):
+        self._shape = shape
+
+    def getShape(self):
+        return self._shape
+
+    # Rendering only, nothing to do without a screen.
+    def setColor(self, color):
+        pass
+
+    def setTransparency(self, alpha):
+        pass
+
+    def setBitmapImage(self, image):
+        pass
+
+class Stationary(Real):
+    __slots__ = ()
+
+    def register(self, shape, location):
+        self._shape = shape
+        self._location = vector(location.x, location.y, location.z)
+        return self
+
+class Mobile(Real):
+    """
+    Something that moves around the world.
+    """
+    __slots__ = ('_velocity', '_handlers')
+
+    def __init__(self):
+        Real.__init__(self)
+        self._velocity = vector()
+        self._handlers = []
+
+    def move(self, location):
+        """
+        Teleports the mobile to a location.
+        """
+        self._location = vector(location.x, location.y, location.z)
+
+    def setVelocity(self, velocity):
+        self._velocity = vector(velocity.x, velocity.y, velocity.z)
+
+    def getVelocity(self):
+        v = self._velocity
+        return vector(v.x, v.y, v.z)
+
+    def setRotation(self, axis, angle):
+        """
+        Sets the rotation to angle radians around axis.
+        """
+        self._rotation = rotationMatrix(axis, angle)
+
+    def relativeRotate(self, axis, angle):
+        """
+        Rotates angle radians around axis, on top of the current rotation.
+        """
+        self._rotation = rotationMatrix(axis, angle) * self._rotation
+
+    def handleCollisions(self, type_name, method):
+        """
+        Calls method with the other object whenever this mobile
+        touches an instance of type_name.
+        """
+        handler = (type_name, method)
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+###############################################################################
+# Instance management
+###############################################################################
+
+def createInstances(cls, count):
+    """
+    Creates count instances of cls.
+    Returns the instance itself when count is 1, like breve.
+    """
+    if count == 1:
+        return cls()
+    return [cls() for i in range(count)]
+
+def deleteInstances(instances):
+    """
+    Removes instances from the world.
+    """
+    if not isinstance(instances, (list, tuple)):
+        instances = [instances]
+
+    for obj in instances:
+        if obj is None or not obj._alive:
+            continue
+        obj.destroy()
+        obj._alive = False
+        if obj._world is not None:
+            obj._world.remove(obj)
+
+def allInstances(type_name):
+    """
+    Returns every live instance of a class name.
+    """
+    if _world is None:
+        return []
+    return list(_world.by_type.get(type_name, ()))
+
+###############################################################################
+# Running
+###############################################################################
+
+def install():
+    """
+    Makes 'import breve' return this module.
+    """
+    module = sys.modules[__name__]
+    sys.modules['breve'] = module
+    return module
+
+def load(path):
+    """
+    Runs a simulation file (a bot) and returns the controller it made.
+    path can also be a function that makes the controller.
+    """
+    global _world
+    install()
+    _world = None
+
+    if callable(path):
+        path()
+    else:
+        execFile(path, '__main__')
+
+    if _world is None or _world.controller is None:
+        raise RuntimeError('%s did not create a controller' % path)
+    return _world.controller
+
+def unload():
+    """
+    Tears down the current world, so nothing of it is left over when
+    the next one is built in the same process. The controller can still
+    be asked for its results afterwards.
+    """
+    global _world
+    world = _world
+    _world = None
+    if world is not None:
+        world.destroy()
+
+def execFile(path, name):
+    """
+    Runs a python file that uses breve and ctf.py as module name.
+    Returns its namespace.
+    """
+    install()
+
+    # Bots import ctf.py, which lives next to this file.
+    here = os.path.dirname(os.path.abspath(__file__))
+    for directory in [os.path.dirname(os.path.abspath(path)), here]:
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+
+    # Not runpy, it clears the module globals out from under the bot
+    # classes once the file has finished running.
+    namespace = {'__name__': name, '__file__': path}
+    source = open(path).read()
+    exec compile(source, path, 'exec') in namespace
+    return namespace
+
+def run(path, until=None, max_time=None, record=None, seed=None,
+        config=None, events=None, checkpoint=None, checkpoint_every=None):
+    """
+    Loads a simulation file (or calls a function that makes a
+    controller, see load) and steps it until until(controller) is
+    true or max_time simulation units have passed. By default it runs
+    until the controller's tournament is over.
+    If record is a file name the game is saved there as a replay.
+    If events is a directory the game's events are logged there.
+    seed seeds both this module's and the game's random numbers.
+    config is a ctf.CTFConfig for the game's controller.
+    If checkpoint is a file name the game is saved there every
+    checkpoint_every ticks, and picks up from it if it's already there.
+    See checkpoint.py.
+    Returns the controller.
+    """
+    if seed is not None:
+        _random.seed(seed)
+
+    if seed is not None or config is not None:
+        install()
+        import ctf
+        if config is None:
+            config = ctf.CTFConfig()
+        if seed is not None:
+            config.seed = seed
+        ctf.CONFIG = config
+
+    controller = load(path)
+    world = controller._world
+
+    if until is None:
+        until = lambda controller: controller.tournamentOver()
+
+    if record is not None:
+        from replay import ReplayRecorder
+        controller.recorder = ReplayRecorder(record)
+
+    if events is not None:
+        from events import EventLog
+        controller.events = EventLog(events)
+
+    checkpoints = None
+    if checkpoint is not None:
+        from checkpoint import Checkpointer
+        checkpoints = Checkpointer(checkpoint, checkpoint_every)
+        # A replay can't be picked up halfway, recorded games start over.
+        if record is None and checkpoints.resume(controller):
+            print "Resumed from %s at time %.2f" % (checkpoint, world.time)
+
+    try:
+        while not until(controller):
+            if max_time is not None and world.time >= max_time:
+                break
+            world.step()
+            if checkpoints is not None:
+                checkpoints.tick(controller)
+
+        # Done, or stopped to be carried on later.
+        if checkpoints is not None:
+            if until(controller):
+                checkpoints.remove()
+            else:
+                checkpoints.save(controller)
+    finally:
+        if record is not None:
+            controller.recorder.close()
+        if events is not None:
+            controller.events.close()
+
+    return controller
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [options] BOT_FILE')
+    parser.add_option('--seed', type='int', default=None,
+            help='seed for the random number generator')
+    parser.add_option('--max-time', type='float', default=None,
+            help='stop after this much simulation time')
+    parser.add_option('--record', default=None,
+            help='save a replay of the game to this file')
+    parser.add_option('--events', default=None,
+            help='log flag pickups, tags and so on to this directory')
+    parser.add_option('--checkpoint', default=None,
+            help='save the game to this file as it goes, resume from it if it exists')
+    parser.add_option('--checkpoint-every', type='int', default=None,
+            help='ticks between checkpoints')
+    parser.add_option('--early-stop', action='store_true', default=False,
+            help='end the tournament as soon as the winner is decided')
+    parser.add_option('--batched', action='store_true', default=False,
+            help='move every player in one vectorized pass')
+    parser.add_option('--step', type='float', default=None,
+            help='simulation time per step, see --swept for big ones')
+    parser.add_option('--swept', action='store_true', default=False,
+            help='catch contacts all along each step, for big steps')
+    parser.add_option('--profile', action='store_true', default=False,
+            help='report where the CPU time goes')
+    parser.add_option('--budget', type='float', default=None,
+            help="seconds each player's iterate may take a tick")
+    parser.add_option('--team-budget', type='float', default=None,
+            help='seconds each team may take a tick')
+    parser.add_option('--overrun-policy', default=None,
+            choices=['keep', 'skip', 'forfeit'],
+            help='what happens to players over budget: keep, skip or forfeit')
+    parser.add_option('--simultaneous', action='store_true', default=False,
+            help='every player decides from the same snapshot, then all move')
+    parser.add_option('--threads', type='int', default=1,
+            help='threads deciding with --simultaneous')
+    parser.add_option('--team-size', type='int', default=None,
+            help='players per team')
+    parser.add_option('--world-size', type='int', default=None,
+            help='width of the field')
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('expected one bot file')
+
+    install()
+    import ctf
+    config = ctf.CTFConfig()
+    if options.batched:
+        config.batched_movement = True
+    if options.step is not None:
+        config.integration_step = options.step
+    if options.swept:
+        config.swept_contacts = True
+    if options.early_stop:
+        config.early_stop = True
+    if options.profile:
+        config.profile = True
+    if options.budget is not None:
+        config.iterate_budget = options.budget
+    if options.team_budget is not None:
+        config.team_budget = options.team_budget
+    if options.overrun_policy is not None:
+        config.overrun_policy = options.overrun_policy
+    if options.simultaneous:
+        config.simultaneous = True
+        config.decision_threads = options.threads
+    if options.team_size is not None:
+        config.team_size = options.team_size
+    if options.world_size is not None:
+        config.world_size = options.world_size
+
+    run(args[0], max_time=options.max_time, record=options.record,
+            seed=options.seed, config=config, events=options.events,
+            checkpoint=options.checkpoint,
+            checkpoint_every=options.checkpoint_every)
@@ -0,0 +1,369 @@
+"""
+Plays every bot in a directory against every other one.
+
+A league bot is a python file in bots/ that defines one CTFPlayer
+subclass (or names the one to use with PLAYER = ...) and doesn't make
+a controller. Every pair of bots plays with each of them on blue in
+turn, once per seed, over a pool of processes like tournament.py.
+
+Results are cached by the source of both bots, the seed, the rules
+version (ctf.RULES_VERSION) and the game settings, so running a league
+again only plays matches that are new, or whose bots or rules changed.
+The cache is saved every CACHE_EVERY matches and when the league stops.
+With --checkpoint DIR matches also save themselves as they go (see
+checkpoint.py), so a match that was cut off picks up where it was.
+
+With --sequential the league goes a seed at a time and stops playing a
+pair of bots once it's clear which is better (see rating.py), so
+--games becomes the most a pair plays. Standings are ranked by Elo.
+
+    python league.py
+    python league.py --games 4 --seed 7 --bots mybots/
+    python league.py --games 50 --sequential
+"""
+import glob
+import itertools
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+from StringIO import StringIO
+
+import headless
+headless.install()
+
+import ctf
+from rating import Elo, decided
+from tournament import gamePlayed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BOTS = os.path.join(HERE, 'bots')
+CACHE_NAME = 'league-cache.json'
+
+CACHE_VERSION = 1
+
+# Matches played between saves of the cache.
+CACHE_EVERY = 16
+
+def botName(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def findBots(directory=BOTS):
+    """
+    Returns the bot files in directory, sorted by name.
+    """
+    paths = glob.glob(os.path.join(directory, '*.py'))
+    return sorted([path for path in paths
+                   if not os.path.basename(path).startswith('_')])
+
+def sourceHash(path):
+    """
+    Returns the hash of a bot file's source.
+    """
+    return hashlib.sha1(open(path, 'rb').read()).hexdigest()
+
+def loadPlayer(path):
+    """
+    Runs a bot file and returns its player class.
+    """
+    namespace = headless.execFile(path, 'ctfbot_' + botName(path))
+    if 'PLAYER' in namespace:
+        return namespace['PLAYER']
+
+    players = [value for name, value in sorted(namespace.items())
+               if isinstance(value, type) and issubclass(value, ctf.CTFPlayer)
+               and value.__module__ == namespace['__name__']]
+    if len(players) != 1:
+        raise ValueError('%s defines %d player classes, set PLAYER to '
+                         'the one to use' % (path, len(players)))
+    return players[0]
+
+class LeagueController(ctf.CTFController):
+    """
+    Plays one bot's players on blue against another's on red.
+    """
+    def __init__(self, blue, red):
+        ctf.CTFController.__init__(self)
+
+        self.teams = [[], []]
+        for team, kind in [(ctf.BLUE_TEAM, blue), (ctf.RED_TEAM, red)]:
+            for i in range(self.config.team_size):
+                member = kind()
+                member.setTeam(team)
+                self.teams[team].append(member)
+
+def matchKey(blue_hash, red_hash, seed, config):
+    """
+    Returns the cache key of a match. Changing either bot, the seed,
+    the rules version or the settings gives a different key.
+    """
+    settings = dict([(name, getattr(config, name))
+                     for name in ctf.CTFConfig.SETTINGS if name != 'seed'])
+    text = json.dumps([blue_hash, red_hash, seed, ctf.RULES_VERSION,
+                       settings], sort_keys=True)
+    return hashlib.sha1(text).hexdigest()
+
+def playMatch(job):
+    """
+    Plays one match in a fresh world.
+    job is a (blue bot file, red bot file, seed, config, checkpoint
+    file or None) tuple.
+    Returns 'blue', 'red' or 'tie'.
+    """
+    blue_path, red_path, seed, config, checkpoint = job
+
+    def makeController():
+        LeagueController(loadPlayer(blue_path), loadPlayer(red_path))
+
+    # Nobody needs the match reports.
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        controller = headless.run(makeController, until=gamePlayed,
+                                  seed=seed, config=config,
+                                  checkpoint=checkpoint)
+    finally:
+        sys.stdout = stdout
+
+    result = 'tie'
+    if controller.getBlueWins():
+        result = 'blue'
+    elif controller.getRedWins():
+        result = 'red'
+    headless.unload()
+    return result
+
+def schedule(bots, seeds):
+    """
+    Returns the (blue bot file, red bot file, seed) of every match:
+    each pair of bots both ways round, for every seed.
+    """
+    matches = []
+    for seed in seeds:
+        for blue in bots:
+            for red in bots:
+                if blue != red:
+                    matches.append((blue, red, seed))
+    return matches
+
+def loadCache(path):
+    """
+    Returns the cached results in path, keyed by match key.
+    """
+    if not os.path.exists(path):
+        return {}
+    data = json.load(open(path))
+    if data.get('version') != CACHE_VERSION:
+        return {}
+    return data['results']
+
+def saveCache(path, results):
+    """
+    Writes the cache, under a temporary name first so an interrupted
+    league never leaves half a file.
+    """
+    output = open(path + '.tmp', 'w')
+    json.dump({'version': CACHE_VERSION, 'results': results}, output,
+              indent=1, sort_keys=True)
+    output.close()
+    os.rename(path + '.tmp', path)
+
+def pairOf(blue, red):
+    """
+    Returns the pairing a match belongs to, whichever side is blue.
+    """
+    return tuple(sorted((blue, red)))
+
+def pairScore(played, pair):
+    """
+    Returns the (wins, losses) of the first bot of pair against the
+    second in the (blue, red, seed, result) matches played.
+    """
+    first, second = pair
+    wins = losses = 0
+    for blue, red, seed, result in played:
+        if pairOf(blue, red) != pair or result == 'tie':
+            continue
+        winner = blue
+        if result == 'red':
+            winner = red
+        if winner == first:
+            wins += 1
+        else:
+            losses += 1
+    return wins, losses
+
+def runLeague(bots, seeds, config=None, processes=None, cache=None,
+        sequential=False, checkpoint=None, out=sys.stdout):
+    """
+    Plays every match of the league not already in the cache file.
+    cache is None to play everything and save nothing.
+    If checkpoint is a directory matches save themselves there as they
+    go, and unfinished ones carry on from there.
+    With sequential, plays a seed at a time and drops pairs of bots
+    once their matchup is decided.
+    Returns a list of (blue name, red name, seed, result).
+    """
+    if config is None:
+        config = ctf.CTFConfig()
+
+    results = {}
+    if cache is not None:
+        results = loadCache(cache)
+
+    hashes = dict([(path, sourceHash(path)) for path in bots])
+    if checkpoint is not None and not os.path.isdir(checkpoint):
+        os.makedirs(checkpoint)
+    if sequential:
+        rounds = [[seed] for seed in seeds]
+    else:
+        rounds = [seeds]
+
+    played = []
+    settled = set()
+    total = cached = unsaved = 0
+    pool = None
+    try:
+        for number, round_seeds in enumerate(rounds):
+            matches = []
+            wanted = []
+            for blue, red, seed in schedule(bots, round_seeds):
+                if pairOf(blue, red) in settled:
+                    continue
+                key = matchKey(hashes[blue], hashes[red], seed, config)
+                matches.append((blue, red, seed, key))
+                if key not in results:
+                    wanted.append((blue, red, seed, key))
+            if not matches:
+                break
+            total += len(matches)
+            cached += len(matches) - len(wanted)
+
+            if wanted and pool is None:
+                pool = multiprocessing.Pool(processes)
+            if wanted:
+                jobs = []
+                for blue, red, seed, key in wanted:
+                    saved = None
+                    if checkpoint is not None:
+                        saved = os.path.join(checkpoint, key + '.ckpt')
+                    jobs.append((blue, red, seed, config, saved))
+                for (blue, red, seed, key), result in \
+                        itertools.izip(wanted, pool.imap(playMatch, jobs)):
+                    results[key] = {'blue': botName(blue), 'red': botName(red),
+                                    'seed': seed, 'result': result}
+                    # Save as we go, an interrupted league keeps most of
+                    # what it played.
+                    unsaved += 1
+                    if cache is not None and unsaved >= CACHE_EVERY:
+                        saveCache(cache, results)
+                        unsaved = 0
+
+            played.extend([(botName(blue), botName(red), seed,
+                            results[key]['result'])
+                           for blue, red, seed, key in matches])
+
+            if sequential:
+                # Both ways round for every seed left.
+                remaining = 2 * (len(rounds) - number - 1)
+                for blue, red, seed, key in matches:
+                    pair = pairOf(blue, red)
+                    wins, losses = pairScore(played, pairOf(botName(blue),
+                                                            botName(red)))
+                    if remaining and decided(wins, losses, remaining):
+                        settled.add(pair)
+    finally:
+        if cache is not None and unsaved:
+            saveCache(cache, results)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    out.write('%d matches played, %d of them from the cache\n' %
+              (total, cached))
+    if sequential:
+        out.write('%d of %d pairs decided early\n' %
+                  (len(settled), len(bots) * (len(bots) - 1) / 2))
+    return played
+
+def standings(played):
+    """
+    Returns (name, wins, losses, ties, Elo rating) for every bot, best
+    first. Pairs that stopped early played fewer matches, so bots are
+    ranked by rating rather than wins. Matches are rated in seed order.
+    """
+    table = {}
+    elo = Elo()
+    scores = {'blue': 1.0, 'red': 0.0, 'tie': 0.5}
+    for blue, red, seed, result in sorted(played, key=lambda match: match[2]):
+        for name in (blue, red):
+            table.setdefault(name, [0, 0, 0])
+        elo.update(blue, red, scores[result])
+        if result == 'tie':
+            table[blue][2] += 1
+            table[red][2] += 1
+        else:
+            winner, loser = blue, red
+            if result == 'red':
+                winner, loser = red, blue
+            table[winner][0] += 1
+            table[loser][1] += 1
+
+    rows = [(name, wins, losses, ties, elo.getRating(name))
+            for name, (wins, losses, ties) in table.items()]
+    return sorted(rows, key=lambda row: (-row[4], row[0]))
+
+def reportStandings(rows, out=sys.stdout):
+    out.write('%-24s %6s %6s %6s %7s\n' % ('bot', 'won', 'lost', 'tied', 'elo'))
+    for name, wins, losses, ties, rating in rows:
+        out.write('%-24s %6d %6d %6d %7.0f\n' % (name, wins, losses, ties, rating))
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--bots', default=BOTS,
+            help='directory of bot files')
+    parser.add_option('--games', type='int', default=1,
+            help='matches per pairing and side')
+    parser.add_option('--seed', type='int', default=1,
+            help='seed of the first match of every pairing')
+    parser.add_option('--processes', type='int', default=None,
+            help='number of worker processes, defaults to one per CPU')
+    parser.add_option('--cache', default=None,
+            help='result cache, defaults to %s in the bot directory' %
+                 (CACHE_NAME))
+    parser.add_option('--sequential', action='store_true', default=False,
+            help='stop playing a pair once it is decided, --games at most')
+    parser.add_option('--checkpoint', default=None,
+            help='save matches here as they go, to resume cut off ones')
+    parser.add_option('--no-cache', action='store_true', default=False,
+            help='play every match and save nothing')
+    parser.add_option('--team-size', type='int', default=None,
+            help='players per team')
+    parser.add_option('--world-size', type='int', default=None,
+            help='width of the field')
+    options, args = parser.parse_args()
+
+    if args:
+        parser.error('no arguments expected')
+
+    bots = findBots(options.bots)
+    if len(bots) < 2:
+        parser.error('need at least two bots in %s' % (options.bots))
+
+    cache = options.cache or os.path.join(options.bots, CACHE_NAME)
+    if options.no_cache:
+        cache = None
+
+    config = ctf.CTFConfig()
+    if options.team_size is not None:
+        config.team_size = options.team_size
+    if options.world_size is not None:
+        config.world_size = options.world_size
+
+    seeds = range(options.seed, options.seed + options.games)
+    played = runLeague(bots, seeds, config, options.processes, cache,
+                       options.sequential, options.checkpoint)
+    reportStandings(standings(played))
@@ -0,0 +1,237 @@
+"""
+Everything a player can sense, as numpy arrays, in one call.
+
+The sense methods hand back lists of players, flags and jails, and
+then a bot calls getLocation and getAngle on each one. CTFPlayer.observe
+returns an Observation instead, with a row for every other player and
+flag within sensor range and for both jails, whose locations everybody
+knows anyway:
+
+    seen = self.observe()
+    enemies = (seen.kind == PLAYER) & (seen.team != self.team) & ~seen.in_jail
+    if enemies.any():
+        closest = numpy.argmin(numpy.where(enemies, seen.distance, numpy.inf))
+        if seen.bearing[closest] > 0:
+            self.turnRight()
+
+Rows come in the same order as the sense methods return things: players
+in the order they were made, then the flags, then the jails. Distances
+and bearings come out exactly as distances.between and getAngle would
+give them.
+
+Each player's observation fills the same arrays every time, so nothing
+is allocated from tick to tick. Copy anything that has to outlive the
+next call to observe.
+"""
+import math
+
+import numpy
+
+# Kinds of row.
+PLAYER = 0
+FLAG = 1
+JAIL = 2
+
+class ObjectTable(object):
+    """
+    What every observation needs to know about each player, flag and
+    jail, in distance matrix column order: kind, index (the player's or
+    flag's state_index, or the jail's place in the registry), team, in
+    jail and carrying (a flag, or for flags, being carried).
+    Rebuilt at most once a tick, and only when somebody observes.
+    """
+
+    FIELDS = (
+        ('kind', numpy.int8),
+        ('index', numpy.int32),
+        ('team', numpy.int8),
+        ('in_jail', numpy.bool_),
+        ('carrying', numpy.bool_),
+    )
+
+    def __init__(self):
+        self.stale = True
+        self.items = []
+        self.players = 0
+        self.flags = 0
+        for name, kind in self.FIELDS:
+            setattr(self, name, numpy.zeros(0, kind))
+
+    def update(self, controller):
+        """
+        Brings the table up to date with controller's world, if it's stale.
+        """
+        distances = controller.distances
+        count = len(distances.index)
+        if not self.stale and count == len(self.items):
+            return self
+
+        state = controller.world_state
+        flags, jails = distances.others
+        players = len(distances.players)
+        self.players = players
+        self.flags = len(flags)
+        self.items = list(distances.players) + list(flags) + list(jails)
+
+        if len(self.kind) < count:
+            for name, kind in self.FIELDS:
+                setattr(self, name, numpy.zeros(2 * count, kind))
+
+        self.kind[:players] = PLAYER
+        self.index[:players] = numpy.arange(players)
+        self.team[:players] = state.view('team')
+        self.in_jail[:players] = state.view('in_jail')
+        self.carrying[:players] = state.view('carrying') >= 0
+
+        for i, item in enumerate(self.items[players:], players):
+            if i < players + self.flags:
+                self.kind[i] = FLAG
+                self.index[i] = item.state_index
+                self.carrying[i] = item.getCarrier() is not None
+            else:
+                self.kind[i] = JAIL
+                self.index[i] = i - players - self.flags
+                self.carrying[i] = False
+            self.team[i] = item.getTeam()
+            self.in_jail[i] = False
+
+        self.stale = False
+        return self
+
+class Observation(object):
+    """
+    One player's view of the world. After observe() the attributes
+    below are arrays with a row for each thing seen:
+
+        kind      PLAYER, FLAG or JAIL
+        index     which one, see ObjectTable
+        offset    where it is relative to the player, N by 3
+        distance  how far away it is
+        bearing   its angle from the player's heading, like getAngle
+        team      its team
+        in_jail   true for players in jail
+        carrying  true for players carrying a flag and flags being carried
+
+    count is the number of rows.
+    """
+
+    FIELDS = (
+        ('kind', numpy.int8, ()),
+        ('index', numpy.int32, ()),
+        ('offset', numpy.float64, (3,)),
+        ('distance', numpy.float64, ()),
+        ('bearing', numpy.float64, ()),
+        ('team', numpy.int8, ()),
+        ('in_jail', numpy.bool_, ()),
+        ('carrying', numpy.bool_, ()),
+    )
+
+    def __init__(self, capacity=32):
+        self.count = 0
+        self.table = None
+        self.buffers = {}
+        self.allocate(capacity)
+        for name, kind, shape in self.FIELDS:
+            setattr(self, name, self.buffers[name][:0])
+        self.column = self.column_buffer[:0]
+
+    def allocate(self, capacity):
+        """
+        Makes room for capacity rows. Only happens when the world grows.
+        """
+        for name, kind, shape in self.FIELDS:
+            self.buffers[name] = numpy.zeros((capacity,) + shape, kind)
+        self.column_buffer = numpy.zeros(capacity, numpy.intp)
+        self.numbers = numpy.arange(capacity)
+        self.seen = numpy.zeros(capacity, numpy.bool_)
+        self.scratch = numpy.zeros(capacity)
+        self.scratch2 = numpy.zeros(capacity)
+        self.flip = numpy.zeros(capacity, numpy.bool_)
+        self.capacity = capacity
+
+    def getObject(self, row):
+        """
+        Returns the player, flag or jail in a row.
+        """
+        return self.table.items[self.column[row]]
+
+    def fill(self, player):
+        """
+        Observes the world from where player is. Returns self.
+        """
+        controller = player.controller
+        distances = controller.distances
+        distance_row = distances.row(player)
+        table = controller.object_table.update(controller)
+        self.table = table
+
+        columns = len(distance_row)
+        if columns > self.capacity:
+            self.allocate(2 * columns)
+
+        # Other players and flags in range, and the jails.
+        seen = self.seen[:columns]
+        numpy.less(distance_row, controller.config.sensor_distance, out=seen)
+        seen[table.players + table.flags:] = True
+        me = distances.index[player]
+        seen[me] = False
+
+        count = int(numpy.count_nonzero(seen))
+        self.count = count
+        buffers = self.buffers
+        for name in ('kind', 'index', 'team', 'in_jail', 'carrying'):
+            numpy.compress(seen, getattr(table, name)[:columns],
+                           out=buffers[name][:count])
+        self.column = self.column_buffer[:count]
+        numpy.compress(seen, self.numbers[:columns], out=self.column)
+
+        offset = buffers['offset'][:count]
+        numpy.compress(seen, distances.positions, axis=0, out=offset)
+        offset -= distances.positions[me]
+        distance = buffers['distance'][:count]
+        numpy.compress(seen, distance_row, out=distance)
+
+        self.bearings(player, offset, distance, buffers['bearing'][:count])
+
+        for name, kind, shape in self.FIELDS:
+            setattr(self, name, buffers[name][:count])
+        return self
+
+    def bearings(self, player, offset, distance, out):
+        """
+        Fills out with the angle from player's heading to each offset,
+        the same sums as state.signedAngles in the same order, so they
+        round the same.
+        """
+        count = len(out)
+        state = player.world_state
+        hx, hy, hz = state.heading[player.state_index].tolist()
+        angle = player.angle
+        x = offset[:, 0]
+        y = offset[:, 1]
+        z = offset[:, 2]
+        scratch = self.scratch[:count]
+        flip = self.flip[:count]
+
+        # Cosine of the angle between heading and offset.
+        numpy.multiply(x, hx, out=out)
+        numpy.multiply(y, hy, out=scratch)
+        out += scratch
+        numpy.multiply(z, hz, out=scratch)
+        out += scratch
+        numpy.multiply(distance, math.sqrt(hx * hx + hy * hy + hz * hz),
+                       out=scratch)
+        numpy.equal(scratch, 0.0, out=flip)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            out /= scratch
+        numpy.clip(out, -1.0, 1.0, out=out)
+        numpy.arccos(out, out=out)
+        out[flip] = 0.0
+
+        # Negative to the left.
+        scratch2 = self.scratch2[:count]
+        numpy.multiply(x, math.cos(angle), out=scratch)
+        numpy.multiply(z, math.sin(angle), out=scratch2)
+        scratch += scratch2
+        numpy.less(scratch, 0.0, out=flip)
+        numpy.negative(out, out=out, where=flip)
@@ -0,0 +1,266 @@
+"""
+CPU time accounting for players and the controller.
+
+Turn it on with CTFConfig(profile=True) (or --profile on headless.py and
+tournament.py). Every player's iterate and sense methods get wrapped
+with a timer, and the controller times its own phases: updating the
+sensors, tags, rules checks, display text, moving players and the
+engine's step. Match and tournament reports then include who used the
+time.
+
+When profiling is off the controller gets a NullProfiler and nothing is
+wrapped, so it costs a handful of empty calls a tick.
+"""
+import sys
+import time
+
+import numpy
+
+# The sense methods to count.
+SENSE_METHODS = ('senseMyJail', 'senseOtherJail', 'senseMyFlag',
+                 'senseOtherFlag', 'senseMyTeam', 'senseOtherTeam', 'observe')
+
+# How many of the busiest players reports list.
+PLAYERS_SHOWN = 10
+
+TEAM_NAMES = {0: 'Blue', 1: 'Red'}
+
+def teamName(team):
+    return TEAM_NAMES.get(team, 'Team %d' % (team))
+
+def playerLabel(player):
+    """
+    Returns a name for player that makes sense outside this process.
+    """
+    return '%s %s %d' % (teamName(player.getTeam()),
+                         player.__class__.__name__, player.getIdNumber())
+
+class ProfileStats(object):
+    """
+    Totals for some stretch of play, a match or a whole tournament.
+    Everything is keyed by name so stats from different processes
+    can be added together.
+    """
+
+    def __init__(self):
+        self.player_time = {}       # label -> seconds in iterate
+        self.player_calls = {}      # label -> iterate calls
+        self.team_time = {}         # team name -> seconds in iterate
+        self.phase_time = {}        # controller phase -> seconds
+        self.sense_time = {}        # sense method -> seconds
+        self.sense_calls = {}       # sense method -> calls
+        self.tick_times = []        # wall time of every tick
+
+    def merge(self, other):
+        """
+        Adds other's totals to these.
+        """
+        for name in ['player_time', 'player_calls', 'team_time',
+                     'phase_time', 'sense_time', 'sense_calls']:
+            mine = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                mine[key] = mine.get(key, 0) + value
+        self.tick_times.extend(other.tick_times)
+
+    def tickPercentiles(self):
+        """
+        Returns the (50th, 99th) percentile tick time in seconds.
+        """
+        if not self.tick_times:
+            return 0.0, 0.0
+        p50, p99 = numpy.percentile(self.tick_times, [50, 99])
+        return float(p50), float(p99)
+
+    def report(self, out=None):
+        """
+        Prints a summary, to stdout by default.
+        """
+        if out is None:
+            out = sys.stdout
+        p50, p99 = self.tickPercentiles()
+        out.write("Time per tick: p50 %.2f ms, p99 %.2f ms over %d ticks\n" %
+                  (p50 * 1000, p99 * 1000, len(self.tick_times)))
+
+        out.write("Player iterate time by team:")
+        for team, seconds in sorted(self.team_time.items()):
+            out.write("  %s %.3fs" % (team, seconds))
+        out.write("\n")
+
+        out.write("Controller time:")
+        for phase, seconds in sorted(self.phase_time.items()):
+            out.write("  %s %.3fs" % (phase, seconds))
+        out.write("\n")
+
+        out.write("Sense calls (time, included in iterate):")
+        for name in SENSE_METHODS:
+            if name in self.sense_calls:
+                out.write("  %s %d (%.3fs)" %
+                          (name, self.sense_calls[name], self.sense_time[name]))
+        out.write("\n")
+
+        busiest = sorted(self.player_time.items(), key=lambda item: -item[1])
+        out.write("Busiest players:\n")
+        for label, seconds in busiest[:PLAYERS_SHOWN]:
+            calls = self.player_calls[label]
+            out.write("  %-32s %.3fs in %d calls, %.1f us each\n" %
+                      (label, seconds, calls, seconds / max(calls, 1) * 1e6))
+        if len(busiest) > PLAYERS_SHOWN:
+            out.write("  ... and %d more\n" % (len(busiest) - PLAYERS_SHOWN))
+
+class Profiler(object):
+    """
+    Collects timings while a controller runs.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.match = ProfileStats()
+        self.total = ProfileStats()
+
+        # Raw per player totals for the current match,
+        # turned into labels when the match ends.
+        self.iterate_time = {}
+        self.iterate_calls = {}
+        self.players = []
+
+        self.current_phase = None
+        self.phase_start = 0.0
+        self.tick_start = None
+
+    def __nonzero__(self):
+        return True
+
+    def watch(self, player):
+        """
+        Wraps player's iterate and sense methods with timers.
+        """
+        self.players.append(player)
+        self.iterate_time[player] = 0.0
+        self.iterate_calls[player] = 0
+
+        clock = self.clock
+        iterate_time = self.iterate_time
+        iterate_calls = self.iterate_calls
+        iterate = player.iterate
+
+        def timedIterate():
+            start = clock()
+            try:
+                return iterate()
+            finally:
+                iterate_time[player] += clock() - start
+                iterate_calls[player] += 1
+        player.iterate = timedIterate
+
+        for name in SENSE_METHODS:
+            setattr(player, name, self.countSense(name, getattr(player, name)))
+
+    def countSense(self, name, method):
+        """
+        Returns method wrapped so its calls and time are counted.
+        """
+        clock = self.clock
+        calls = self.match.sense_calls
+        times = self.match.sense_time
+        calls.setdefault(name, 0)
+        times.setdefault(name, 0.0)
+
+        def countedSense():
+            start = clock()
+            result = method()
+            times[name] += clock() - start
+            calls[name] += 1
+            return result
+        return countedSense
+
+    def tick(self):
+        """
+        Marks the start of a tick. Closes out the last one.
+        """
+        now = self.clock()
+        self.phase(None, now)
+        if self.tick_start is not None:
+            self.match.tick_times.append(now - self.tick_start)
+        self.tick_start = now
+
+    def phase(self, name, now=None):
+        """
+        Ends the controller phase being timed, if any, and starts name.
+        None just ends it.
+        """
+        if now is None:
+            now = self.clock()
+        if self.current_phase is not None:
+            times = self.match.phase_time
+            times[self.current_phase] = times.get(self.current_phase, 0.0) + \
+                    now - self.phase_start
+        self.current_phase = name
+        self.phase_start = now
+
+    def collect(self):
+        """
+        Moves the raw per player totals into the match stats.
+        """
+        match = self.match
+        for player in self.players:
+            label = playerLabel(player)
+            team = teamName(player.getTeam())
+            seconds = self.iterate_time[player]
+            match.player_time[label] = match.player_time.get(label, 0.0) + seconds
+            match.player_calls[label] = match.player_calls.get(label, 0) + \
+                    self.iterate_calls[player]
+            match.team_time[team] = match.team_time.get(team, 0.0) + seconds
+            self.iterate_time[player] = 0.0
+            self.iterate_calls[player] = 0
+
+    def endMatch(self, out=None):
+        """
+        Reports the match that just finished and adds it to the total.
+        """
+        if out is None:
+            out = sys.stdout
+        self.collect()
+        self.match.report(out)
+        self.total.merge(self.match)
+
+        # Start over, the sense counters hang on to the old dictionaries.
+        sense_calls = self.match.sense_calls
+        sense_time = self.match.sense_time
+        self.match = ProfileStats()
+        self.match.sense_calls = sense_calls
+        self.match.sense_time = sense_time
+        for name in sense_calls:
+            sense_calls[name] = 0
+            sense_time[name] = 0.0
+
+    def endTournament(self, out=None):
+        """
+        Reports the whole tournament.
+        """
+        if out is None:
+            out = sys.stdout
+        out.write("Profile for the whole tournament:\n")
+        self.total.report(out)
+
+class NullProfiler(object):
+    """
+    Stands in for a Profiler when profiling is off. Does nothing.
+    """
+
+    def __nonzero__(self):
+        return False
+
+    def watch(self, player):
+        pass
+
+    def tick(self):
+        pass
+
+    def phase(self, name, now=None):
+        pass
+
+    def endMatch(self, out=None):
+        pass
+
+    def endTournament(self, out=None):
+        pass
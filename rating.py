@@ -0,0 +1,102 @@
+"""
+Ratings for bots, and telling when a matchup has been decided.
+
+Elo keeps a rating for every bot, updated after each match.
+
+A matchup between two sides is decided once either
+- the side ahead on wins can't be caught in the matches left to play
+  (clinched), or
+- a sequential probability ratio test on the matches that weren't ties
+  says one side is the better one (sequentialDecision).
+
+Tournaments and leagues run with early stopping (EARLY_STOP in ctf.py,
+--sequential on tournament.py and league.py) stop playing a matchup as
+soon as it is decided, which usually takes a lot fewer matches.
+"""
+import math
+
+# New bots start here.
+START_RATING = 1500.0
+
+# How far one match moves a rating.
+K_FACTOR = 32.0
+
+# The sequential test tells apart a side that wins 50% + MARGIN of the
+# matches that aren't ties from one that wins 50% - MARGIN. It picks
+# the worse one with probability at most ALPHA (or BETA the other way).
+MARGIN = 0.05
+ALPHA = 0.05
+BETA = 0.05
+
+def expectedScore(rating, other):
+    """
+    Returns the score (1 a win, 0 a loss) a bot rated rating
+    can expect against one rated other.
+    """
+    return 1.0 / (1.0 + 10.0 ** ((other - rating) / 400.0))
+
+class Elo(object):
+    """
+    Elo ratings for any number of bots.
+    """
+
+    def __init__(self, k=K_FACTOR, start=START_RATING):
+        self.k = k
+        self.start = start
+        self.ratings = {}
+        self.games = {}
+
+    def getRating(self, name):
+        return self.ratings.get(name, self.start)
+
+    def update(self, name, other, score):
+        """
+        Records a match between name and other. score is name's,
+        1 for a win, 0.5 for a tie and 0 for a loss.
+        """
+        rating = self.getRating(name)
+        other_rating = self.getRating(other)
+        change = self.k * (score - expectedScore(rating, other_rating))
+        self.ratings[name] = rating + change
+        self.ratings[other] = other_rating - change
+        self.games[name] = self.games.get(name, 0) + 1
+        self.games[other] = self.games.get(other, 0) + 1
+
+    def ranking(self):
+        """
+        Returns (name, rating, matches played) for every bot, best first.
+        """
+        return sorted([(name, rating, self.games[name])
+                       for name, rating in self.ratings.items()],
+                      key=lambda row: (-row[1], row[0]))
+
+def clinched(wins, other_wins, remaining):
+    """
+    Returns true if the side with more wins stays ahead (or the sides
+    stay level) whatever happens in the remaining matches.
+    """
+    return abs(wins - other_wins) > remaining or remaining <= 0
+
+def sequentialDecision(wins, losses, margin=MARGIN, alpha=ALPHA, beta=BETA):
+    """
+    Wald's sequential probability ratio test on a side's wins and losses
+    so far, ties left out. Returns 1 if the side is the better one, -1
+    if its opponent is and 0 if it can't tell yet.
+    """
+    # Both hypotheses are margin either side of even, so every win and
+    # every loss moves the log likelihood ratio by the same step.
+    step = math.log((0.5 + margin) / (0.5 - margin))
+    ratio = step * (wins - losses)
+    if ratio >= math.log((1.0 - beta) / alpha):
+        return 1
+    if ratio <= math.log(beta / (1.0 - alpha)):
+        return -1
+    return 0
+
+def decided(wins, losses, remaining):
+    """
+    Returns true if a matchup needn't be played any further: it has
+    been clinched or the sequential test has made up its mind.
+    """
+    return clinched(wins, losses, remaining) or \
+            sequentialDecision(wins, losses) != 0
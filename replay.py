@@ -0,0 +1,354 @@
+"""
+Records games to a compact binary file and plays them back.
+
+The file is a small header (counts, teams and the jail positions,
+which never change during a game) followed by one record per tick
+(time, scoreboard, jailed counts, player positions and headings, who
+is in jail, flag positions and carriers, which flags have a no tag
+zone). Every tick record holds everything needed to show that tick and
+is the same size, so the offset of any tick can be worked out directly
+and the player can jump straight to it.
+
+Record a game:
+
+    python headless.py --record game.ctfr ctftemplate.py
+
+Dump it without simulating anything:
+
+    python replay.py game.ctfr
+    python replay.py --start 1000 --stop 1010 game.ctfr
+
+Watch it in breve with a simulation file like:
+
+    from replay import ReplayController
+    ReplayController('game.ctfr')
+"""
+import mmap
+import struct
+import sys
+
+import numpy
+
+try:
+    import breve
+except ImportError:
+    # Dumping a replay doesn't need the real thing.
+    import headless
+    breve = headless.install()
+
+from ctf import AgentShape, BLUE_TEAM, makeFlagShape, makeJailShape
+
+MAGIC = 'CTFR'
+VERSION = 4
+
+# magic, version, players, flags, jails
+# Followed by each player's team and each jail's position.
+HEADER = struct.Struct('<4sHHHH')
+
+# Ticks buffered between writes.
+BUFFER_TICKS = 256
+
+def tickType(players, flags):
+    """
+    Returns the numpy record type of one tick.
+    """
+    return numpy.dtype([
+        ('time', '<f8'),
+        ('red_wins', '<u2'),
+        ('blue_wins', '<u2'),
+        ('ties', '<u2'),
+        ('jailed', '<u2', (2,)),            # blue, red
+        ('players', '<f4', (players, 4)),   # x, y, z, angle
+        ('in_jail', 'u1', (players,)),
+        ('flags', '<f4', (flags, 3)),
+        ('carriers', '<i2', (flags,)),      # player index or -1
+        ('no_tag_zones', 'u1', (flags,)),
+    ])
+
+class ReplayRecorder(object):
+    """
+    Writes one record per tick. Give it to a controller:
+
+        controller.recorder = ReplayRecorder('game.ctfr')
+
+    The players, flags and jails are fixed on the first tick.
+    Ticks are buffered a few hundred at a time, call close() when done.
+    """
+
+    def __init__(self, path, buffered=BUFFER_TICKS):
+        self.path = path
+        self.buffered = buffered
+        self.file = None
+        self.players = []
+        self.flags = []
+        self.jails = []
+        self.index = {}
+        self.ticks = 0
+        self.buffer = None
+        self.filled = 0
+
+    def start(self, controller):
+        """
+        Writes the header. Called on the first tick.
+        """
+        registry = controller.registry
+        self.players = list(registry.players)
+        self.flags = list(registry.flags)
+        self.jails = list(registry.jails)
+        self.index = dict([(p, i) for i, p in enumerate(self.players)])
+
+        self.buffer = numpy.zeros(self.buffered,
+                tickType(len(self.players), len(self.flags)))
+
+        self.file = open(self.path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(self.players),
+                len(self.flags), len(self.jails)))
+        teams = numpy.array([p.getTeam() for p in self.players], dtype='i1')
+        self.file.write(teams.tostring())
+        jails = numpy.zeros((len(self.jails), 3), '<f4')
+        for i, jail in enumerate(self.jails):
+            location = jail.getLocation()
+            jails[i] = (location.x, location.y, location.z)
+        self.file.write(jails.tostring())
+
+    def record(self, controller):
+        """
+        Records the current state of the world.
+        """
+        if self.file is None:
+            self.start(controller)
+
+        tick = self.buffer[self.filled]
+        tick['time'] = controller.getTime()
+        tick['red_wins'] = controller.getRedWins()
+        tick['blue_wins'] = controller.getBlueWins()
+        tick['ties'] = controller.getTies()
+        tick['jailed'] = (controller.getJailedBlueCount(),
+                controller.getJailedRedCount())
+
+        players = tick['players']
+        in_jail = tick['in_jail']
+        for i, player in enumerate(self.players):
+            location = player.getLocation()
+            players[i] = (location.x, location.y, location.z, player.angle)
+            in_jail[i] = player.getInJail()
+
+        flags = tick['flags']
+        carriers = tick['carriers']
+        for i, flag in enumerate(self.flags):
+            location = flag.getLocation()
+            flags[i] = (location.x, location.y, location.z)
+            carriers[i] = self.index.get(flag.getCarrier(), -1)
+            tick['no_tag_zones'][i] = flag.my_no_tag_zone is not None
+
+        self.filled += 1
+        self.ticks += 1
+        if self.filled == self.buffered:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes out the buffered ticks.
+        """
+        if self.filled == 0:
+            return
+        self.file.write(self.buffer[:self.filled].tostring())
+        self.file.flush()
+        self.filled = 0
+
+    def close(self):
+        """
+        Writes anything left over and closes the file.
+        """
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+class Replay(object):
+    """
+    A recorded game, memory mapped for reading.
+    Any tick can be looked up without reading the ones before it.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, players, flags, jails = \
+                HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a replay file' % path)
+        if version != VERSION:
+            raise ValueError('%s is replay version %d, expected %d' %
+                    (path, version, VERSION))
+
+        self.player_count = players
+        self.flag_count = flags
+        self.jail_count = jails
+        self.teams = numpy.frombuffer(self.data, 'i1', players, HEADER.size)
+        self.jails = numpy.frombuffer(self.data, '<f4', jails * 3,
+                HEADER.size + players).reshape(jails, 3)
+        self.tick_type = tickType(players, flags)
+
+        self.start = HEADER.size + players + self.jails.nbytes
+
+        # Work out how many ticks made it to disk.
+        self.ticks = (len(self.data) - self.start) // self.tick_type.itemsize
+
+    def __len__(self):
+        return self.ticks
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def offset(self, n):
+        """
+        Returns the byte offset of tick n.
+        """
+        return self.start + n * self.tick_type.itemsize
+
+    def tick(self, n):
+        """
+        Returns the record of tick n.
+        """
+        if n < 0:
+            n += self.ticks
+        if not 0 <= n < self.ticks:
+            raise IndexError('tick %d out of range' % n)
+        return numpy.frombuffer(self.data, self.tick_type, 1,
+                self.offset(n))[0]
+
+    def dump(self, out=sys.stdout, start=0, stop=None):
+        """
+        Writes ticks start to stop as text, one line per mobile.
+        """
+        if stop is None or stop > self.ticks:
+            stop = self.ticks
+
+        for n in range(start, stop):
+            tick = self.tick(n)
+            out.write('tick %d time %.2f score red %d blue %d ties %d '
+                      'jailed blue %d red %d\n' %
+                    (n, tick['time'], tick['red_wins'], tick['blue_wins'],
+                     tick['ties'], tick['jailed'][0], tick['jailed'][1]))
+
+            for i, (x, y, z, angle) in enumerate(tick['players']):
+                out.write('  player %d team %d at %.3f %.3f %.3f '
+                          'angle %.3f%s\n' %
+                        (i, self.teams[i], x, y, z, angle,
+                         tick['in_jail'][i] and ' jailed' or ''))
+
+            for i, (x, y, z) in enumerate(tick['flags']):
+                carrier = tick['carriers'][i]
+                out.write('  flag %d at %.3f %.3f %.3f%s\n' %
+                        (i, x, y, z,
+                         carrier >= 0 and ' carried by %d' % carrier or ''))
+
+class ReplayMobile(breve.Mobile):
+    """
+    Stands in for a player, flag or jail during playback.
+    """
+
+    def __init__(self):
+        breve.Mobile.__init__(self)
+
+class ReplayController(breve.Control):
+    """
+    Plays a replay file back in breve, one recorded tick per iteration.
+    """
+
+    def __init__(self, path):
+        breve.Control.__init__(self)
+        self.replay = Replay(path)
+        self.players = []
+        self.flags = []
+        self.jails = []
+        self.current = 0
+        self.init()
+
+    def init(self):
+        """
+        Makes a mobile for everything in the recording.
+        """
+        self.disableReflections()
+        self.enableLighting()
+        self.moveLight(breve.vector(0, 10, 0))
+        self.disableShadows()
+        self.pointCamera(breve.vector(0, 0, 0), breve.vector(0, 60, 60))
+
+        shape = AgentShape()
+        for team in self.replay.teams:
+            player = ReplayMobile()
+            player.setShape(shape)
+            if team == BLUE_TEAM:
+                player.setColor(breve.vector(0, 0, 1))
+            else:
+                player.setColor(breve.vector(1, 0, 0))
+            self.players.append(player)
+
+        flag_shape = makeFlagShape()
+        for i in range(self.replay.flag_count):
+            flag = ReplayMobile()
+            flag.setShape(flag_shape)
+            self.flags.append(flag)
+
+        jail_shape = makeJailShape()
+        for x, y, z in self.replay.jails:
+            jail = ReplayMobile()
+            jail.setShape(jail_shape)
+            jail.setColor(breve.vector(0, 1, 0))
+            jail.setTransparency(.1)
+            jail.move(breve.vector(x, y, z))
+            self.jails.append(jail)
+
+    def seek(self, n):
+        """
+        Jumps to tick n.
+        """
+        self.current = n
+        self.show(n)
+
+    def show(self, n):
+        """
+        Moves everything to where it was at tick n.
+        """
+        tick = self.replay.tick(n)
+
+        for player, (x, y, z, angle) in zip(self.players, tick['players']):
+            player.move(breve.vector(x, y, z))
+            player.setRotation(breve.vector(-1, 0, 0), 1.57)
+            player.relativeRotate(breve.vector(0, -1, 0), angle)
+
+        for flag, (x, y, z) in zip(self.flags, tick['flags']):
+            flag.move(breve.vector(x, y, z))
+
+        self.setDisplayText('Red: %d  Blue: %d   Ties: %d' %
+                (tick['red_wins'], tick['blue_wins'], tick['ties']),
+                -.3, .8, 3)
+        self.setDisplayText('Tick %d' % n, -.2, -.9, 0)
+
+    def iterate(self):
+        if self.current < len(self.replay):
+            self.show(self.current)
+            self.current += 1
+        breve.Control.iterate(self)
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [options] REPLAY_FILE')
+    parser.add_option('--start', type='int', default=0,
+            help='first tick to dump')
+    parser.add_option('--stop', type='int', default=None,
+            help='tick to stop before')
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('expected one replay file')
+
+    replay = Replay(args[0])
+    print '%d ticks' % (len(replay))
+    replay.dump(sys.stdout, options.start, options.stop)
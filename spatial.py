@@ -0,0 +1,392 @@
+"""
+Spatial indexes used by the CTF sensors.
+
+Sensing used to scan every player for every player, every tick.
+SpatialHash buckets objects into square cells on the ground plane so a
+sensor only has to look at the cells within its range, and
+DistanceMatrix works out every distance a sensor could ask for in one
+numpy call instead of one breve.length call at a time.
+"""
+import math
+
+import numpy
+
+class SpatialHash(object):
+    """
+    A uniform grid over the x/z plane.
+
+    Every object remembers the order it was inserted in, and queries
+    return objects in that order. Rebuilding from a list therefore keeps
+    results identical to a linear scan over that list.
+    """
+
+    def __init__(self, cell_size):
+        """
+        Makes an empty grid with square cells cell_size wide.
+        """
+        self.cell_size = float(cell_size)
+        self.cells = {}
+        self.members = {}
+        self.count = 0
+
+    def cellOf(self, location):
+        """
+        Returns the (x, z) key of the cell a location falls in.
+        """
+        return (int(math.floor(location.x / self.cell_size)),
+                int(math.floor(location.z / self.cell_size)))
+
+    def clear(self):
+        """
+        Empties the grid.
+        """
+        self.cells = {}
+        self.members = {}
+        self.count = 0
+
+    def insert(self, obj, location):
+        """
+        Adds obj to the grid, or moves it if it is already there.
+        """
+        cell = self.cellOf(location)
+        entry = self.members.get(obj)
+
+        if entry is None:
+            order = self.count
+            self.count += 1
+        else:
+            old_cell, order = entry
+            if old_cell == cell:
+                return
+            self.cells[old_cell].remove((order, obj))
+
+        self.cells.setdefault(cell, []).append((order, obj))
+        self.members[obj] = (cell, order)
+
+    def remove(self, obj):
+        """
+        Takes obj out of the grid for good.
+        """
+        entry = self.members.pop(obj, None)
+        if entry is not None:
+            self.cells[entry[0]].remove((entry[1], obj))
+
+    def rebuild(self, objects, positions=None):
+        """
+        Rebins everything at once, in the order of objects.
+        Cheaper than moving objects one at a time when most of them
+        have moved. positions, if given, is an array of their locations.
+        """
+        self.clear()
+        if positions is None:
+            for obj in objects:
+                self.insert(obj, obj.getLocation())
+            return
+
+        cells = numpy.floor(positions[:, 0::2] / self.cell_size).astype(int)
+        for order, (obj, cell) in enumerate(zip(objects, cells.tolist())):
+            cell = tuple(cell)
+            self.cells.setdefault(cell, []).append((order, obj))
+            self.members[obj] = (cell, order)
+        self.count = len(self.members)
+
+    def near(self, location, distance):
+        """
+        Returns every object in a cell within distance of location,
+        in insertion order. This is a superset of the objects that are
+        actually within distance, callers still check the real distance.
+        """
+        size = self.cell_size
+        low_x = int(math.floor((location.x - distance) / size))
+        high_x = int(math.floor((location.x + distance) / size))
+        low_z = int(math.floor((location.z - distance) / size))
+        high_z = int(math.floor((location.z + distance) / size))
+
+        found = []
+        cells = self.cells
+        for x in range(low_x, high_x + 1):
+            for z in range(low_z, high_z + 1):
+                cell = cells.get((x, z))
+                if cell:
+                    found.extend(cell)
+
+        found.sort()
+        return [obj for order, obj in found]
+
+class DistanceMatrix(object):
+    """
+    Distances from every player to every player, flag and jail,
+    computed in one batch per tick with numpy.
+
+    Columns are the players followed by everything else, rows are just
+    the players. Anything moved during the tick is marked dirty and its
+    row and column are redone, again in one batch, before the next read.
+    """
+
+    def __init__(self):
+        """
+        Makes an empty matrix. Call rebuild to fill it.
+        """
+        self.players = []
+        self.others = ()
+        self.index = {}
+        self.rows = 0
+        self.positions = numpy.zeros((0, 3))
+        self.distances = numpy.zeros((0, 0))
+        self.dirty = set()
+        self.stale = True
+
+    def rebuild(self, players, others=(), positions=None):
+        """
+        Recomputes every distance.
+        players are the rows, the other lists (flags, jails) only get
+        columns. The lists are kept so the matrix can rebuild itself
+        when something new shows up. positions, if given, is an array
+        of the players' locations.
+        """
+        self.players = players
+        self.others = others
+        items = list(players)
+        for group in others:
+            items.extend(group)
+
+        self.rows = len(players)
+        self.index = dict([(item, i) for i, item in enumerate(items)])
+
+        self.positions = numpy.zeros((len(items), 3))
+        start = 0
+        if positions is not None:
+            self.positions[:self.rows] = positions
+            start = self.rows
+
+        for i in range(start, len(items)):
+            location = items[i].getLocation()
+            self.positions[i] = (location.x, location.y, location.z)
+        positions = self.positions
+
+        self.distances = pairDistances(positions[:self.rows], positions)
+        self.dirty.clear()
+        self.stale = False
+
+    def moved(self, obj, location):
+        """
+        Records that obj was moved to location since the last rebuild.
+        """
+        i = self.index.get(obj)
+        if i is None:
+            # Something new, start over on the next read.
+            self.stale = True
+            return
+
+        self.positions[i] = (location.x, location.y, location.z)
+        self.dirty.add(i)
+
+    def refresh(self):
+        """
+        Brings the matrix up to date before a read.
+        """
+        if self.stale:
+            self.rebuild(self.players, self.others)
+            return
+
+        if not self.dirty:
+            return
+
+        positions = self.positions
+        distances = self.distances
+        rows = self.rows
+
+        # Usually only one or two things moved, so redo them one at a
+        # time. Distances are symmetric, one pass covers row and column.
+        for i in sorted(self.dirty):
+            d = pointDistances(positions, positions[i])
+            if i < rows:
+                distances[i, :] = d
+            distances[:, i] = d[:rows]
+        self.dirty.clear()
+
+    def row(self, player):
+        """
+        Returns the distances from player to everything,
+        indexed by the index dictionary.
+        """
+        self.refresh()
+        if player not in self.index:
+            self.rebuild(self.players, self.others)
+        return self.distances[self.index[player]]
+
+    def between(self, player, item):
+        """
+        Returns the distance from player to item.
+        """
+        return self.row(player)[self.index[item]]
+
+def pairDistances(a, b):
+    """
+    Returns the distance from every point in a to every point in b.
+    Written out longhand so the rounding matches breve.length exactly.
+    """
+    dx = a[:, 0][:, numpy.newaxis] - b[:, 0][numpy.newaxis, :]
+    dy = a[:, 1][:, numpy.newaxis] - b[:, 1][numpy.newaxis, :]
+    dz = a[:, 2][:, numpy.newaxis] - b[:, 2][numpy.newaxis, :]
+    return numpy.sqrt(dx * dx + dy * dy + dz * dz)
+
+def pointDistances(points, point):
+    """
+    Returns the distance from every point in points to point.
+    """
+    dx = points[:, 0] - point[0]
+    dy = points[:, 1] - point[1]
+    dz = points[:, 2] - point[2]
+    return numpy.sqrt(dx * dx + dy * dy + dz * dz)
+
+def touchingPairs(positions, teams, active, reach):
+    """
+    Returns every (i, j) pair, i < j, of active points on different teams
+    that are no more than reach apart, sorted.
+
+    Sort and sweep: the points are sorted along x, and each point is only
+    compared with the points after it that are within reach along x.
+    """
+    count = len(positions)
+    if count < 2:
+        return []
+
+    xs = positions[:, 0]
+    first, second = opponents(overlapping(xs, xs, reach), teams, active)
+
+    delta = positions[first] - positions[second]
+    keep = (delta * delta).sum(axis=1) <= reach * reach
+    return sortedPairs(first[keep], second[keep])
+
+def sweptPairs(start, end, teams, active, reach):
+    """
+    touchingPairs for points moving in straight lines from start to end
+    over a step: the pairs touching at the end, and the pairs that came
+    within reach of each other on the way and moved apart again. Pairs
+    that were touching at the start were already found last step.
+    Both move at a steady speed, so the gap between them does too and
+    the closest they came is a closest point on a line.
+    """
+    count = len(start)
+    if count < 2:
+        return []
+
+    low = numpy.minimum(start[:, 0], end[:, 0])
+    high = numpy.maximum(start[:, 0], end[:, 0])
+    first, second = opponents(overlapping(low, high, reach), teams, active)
+
+    gap = start[first] - start[second]
+    end_gap = end[first] - end[second]
+    change = end_gap - gap
+    closest = gap + closestTimes(gap, change)[:, numpy.newaxis] * change
+    reach = reach * reach
+    passed = ((closest * closest).sum(axis=1) <= reach) & \
+             ((gap * gap).sum(axis=1) > reach)
+    keep = passed | ((end_gap * end_gap).sum(axis=1) <= reach)
+    return sortedPairs(first[keep], second[keep])
+
+def overlapping(low, high, reach):
+    """
+    Returns the (first, second) index arrays of every pair of ranges
+    low to high along x that are no more than reach apart.
+
+    Sort and sweep: the ranges are sorted by where they start, and each
+    is only compared with the ranges after it that start before it ends.
+    """
+    count = len(low)
+    order = numpy.argsort(low, kind='mergesort')
+    lows = low[order]
+
+    # For each range, the sorted ranges after it that are close along x.
+    ends = numpy.searchsorted(lows, high[order] + reach, 'right')
+    counts = ends - numpy.arange(1, count + 1)
+    total = counts.sum()
+    if total == 0:
+        nothing = numpy.zeros(0, numpy.intp)
+        return nothing, nothing
+
+    # Expand those ranges into flat lists of candidate pairs.
+    first = numpy.repeat(numpy.arange(count), counts)
+    starts = numpy.cumsum(counts) - counts
+    second = numpy.arange(total) - numpy.repeat(starts, counts) + first + 1
+    return order[first], order[second]
+
+def opponents(pairs, teams, active):
+    """
+    Keeps the pairs of active points on different teams.
+    """
+    first, second = pairs
+    teams = numpy.asarray(teams)
+    active = numpy.asarray(active, dtype=bool)
+    keep = (teams[first] != teams[second]) & active[first] & active[second]
+    return first[keep], second[keep]
+
+def sortedPairs(first, second):
+    """
+    Returns the pairs as sorted (i, j) tuples, i < j, so the same pairs
+    come out in the same order no matter how the sort came out.
+    """
+    low = numpy.minimum(first, second)
+    high = numpy.maximum(first, second)
+    pairs = numpy.lexsort((high, low))
+    return zip(low[pairs].tolist(), high[pairs].tolist())
+
+def closestTimes(start, change):
+    """
+    Returns when, between 0 and 1, each point start + t * change comes
+    closest to the origin.
+    """
+    speed = (change * change).sum(axis=1)
+    toward = -(start * change).sum(axis=1)
+    # Points that don't move are as close as they get straight away.
+    moving = speed > 0.0
+    times = numpy.zeros(len(start))
+    times[moving] = toward[moving] / speed[moving]
+    return numpy.clip(times, 0.0, 1.0)
+
+def sweptDistances(start, end, point):
+    """
+    Returns how close each point moving in a straight line from start
+    to end came to point.
+    """
+    offset = start - point
+    change = end - start
+    closest = offset + closestTimes(offset, change)[:, numpy.newaxis] * change
+    return numpy.sqrt((closest * closest).sum(axis=1))
+
+def boxDistances(points, center, half):
+    """
+    Returns the distance from each point to the axis aligned box
+    around center, half its size each way. 0 inside.
+    """
+    gap = numpy.maximum(numpy.abs(points - center) - half, 0.0)
+    return numpy.sqrt((gap * gap).sum(axis=-1))
+
+def sweptBoxDistances(start, end, center, half, iterations=40):
+    """
+    Returns how close each point moving in a straight line from start
+    to end came to the axis aligned box around center.
+    The distance to a box only has the one low point along a line, so
+    a ternary search finds it, for every point at once.
+    """
+    change = end - start
+    low = numpy.zeros(len(start))
+    high = numpy.ones(len(start))
+    for i in range(iterations):
+        third = (high - low) / 3.0
+        early = low + third
+        late = high - third
+        nearer = boxDistances(start + early[:, numpy.newaxis] * change,
+                              center, half) <= \
+                 boxDistances(start + late[:, numpy.newaxis] * change,
+                              center, half)
+        high = numpy.where(nearer, late, high)
+        low = numpy.where(nearer, low, early)
+
+    # The search only closes in on the low point, check the ends too.
+    middle = (low + high) / 2.0
+    return numpy.minimum(
+            boxDistances(start + middle[:, numpy.newaxis] * change, center, half),
+            numpy.minimum(boxDistances(start, center, half),
+                          boxDistances(end, center, half)))
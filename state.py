@@ -0,0 +1,314 @@
+"""
+Structure of arrays storage for the players in a world.
+
+Every player used to keep its own velocity, angle, heading and so on
+as attributes, with its position held by the engine. WorldState keeps
+one numpy array per field instead, indexed by the player's slot, so
+whole-team rules checks, sensing and movement can work on arrays.
+CTFPlayer reads and writes its fields through properties over these
+arrays, so the player API is unchanged.
+"""
+import math
+
+import numpy
+
+import breve
+
+# Height players hover at above the ground.
+HOVER_HEIGHT = 0.2
+
+# setAngle tips the agent shape over by this much before turning it.
+TILT = 1.57
+SIN_TILT = math.sin(TILT)
+COS_TILT = math.cos(TILT)
+
+class WorldState(object):
+    """
+    The authoritative state of every player in one world.
+    Arrays grow as players are added; only the first count rows are used.
+    """
+
+    # Per player arrays: name, numpy type, shape of one entry, empty value.
+    FIELDS = (
+        ('position', numpy.float64, (3,), 0.0),
+        ('heading', numpy.float64, (3,), 0.0),
+        ('velocity', numpy.float64, (3,), 0.0),  # as last given to the engine
+        ('angle', numpy.float64, (), 0.0),
+        ('speed', numpy.float64, (), 0.0),
+        ('team', numpy.int8, (), -1),
+        ('in_jail', numpy.bool_, (), False),
+        ('at_edge', numpy.bool_, (), False),
+        ('carrying', numpy.int16, (), -1),     # index into flags or -1
+        ('swept_from', numpy.float64, (3,), 0.0),  # see ctf.SWEPT_CONTACTS
+    )
+
+    def __init__(self, capacity=32):
+        """
+        Makes empty state with room for capacity players.
+        """
+        self.count = 0
+        self.players = []
+        self.flags = []
+        for name, kind, shape, empty in self.FIELDS:
+            setattr(self, name, numpy.empty((capacity,) + shape, kind))
+
+    def grow(self):
+        """
+        Doubles the room for players.
+        """
+        for name, kind, shape, empty in self.FIELDS:
+            old = getattr(self, name)
+            new = numpy.empty((2 * len(old),) + shape, kind)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def addPlayer(self, player):
+        """
+        Gives a new player a slot and returns its index.
+        """
+        if self.count == len(self.speed):
+            self.grow()
+
+        i = self.count
+        for name, kind, shape, empty in self.FIELDS:
+            getattr(self, name)[i] = empty
+
+        self.count += 1
+        self.players.append(player)
+        return i
+
+    def addFlag(self, flag):
+        """
+        Registers a flag so players can refer to it by index.
+        Returns its index.
+        """
+        self.flags.append(flag)
+        return len(self.flags) - 1
+
+    def pullPositions(self):
+        """
+        Reads every player's position back from the engine.
+        The engine moves players between ticks, so this is done once
+        at the start of each tick. Everything else reads the array.
+        """
+        position = self.position
+        for i, player in enumerate(self.players):
+            location = breve.Mobile.getLocation(player)
+            position[i] = (location.x, location.y, location.z)
+
+    def view(self, name):
+        """
+        Returns the used part of the named array.
+        """
+        return getattr(self, name)[:self.count]
+
+class TeamIndex(object):
+    """
+    The players of each team, split into those in jail and those free.
+    Kept up to date as players change team or go in and out of jail,
+    so nobody has to scan every player to find prisoners or count them.
+    """
+
+    def __init__(self):
+        self.jailed = {}
+        self.active = {}
+        self.places = {}
+
+    def update(self, player, team, in_jail):
+        """
+        Files player under team, in jail or not, wherever it was before.
+        """
+        self.remove(player)
+        if in_jail:
+            group = self.jailed
+        else:
+            group = self.active
+        group.setdefault(team, set()).add(player)
+        self.places[player] = (team, in_jail)
+
+    def remove(self, player):
+        """
+        Forgets about player.
+        """
+        place = self.places.pop(player, None)
+        if place is None:
+            return
+        team, in_jail = place
+        if in_jail:
+            self.jailed[team].discard(player)
+        else:
+            self.active[team].discard(player)
+
+    def getJailed(self, team):
+        """
+        Returns the players of team in jail, in the order they were made.
+        """
+        return sorted(self.jailed.get(team, ()), key=playerOrder)
+
+    def getActive(self, team):
+        """
+        Returns the players of team out of jail, in the order they were made.
+        """
+        return sorted(self.active.get(team, ()), key=playerOrder)
+
+    def countJailed(self, team):
+        """
+        Returns how many players of team are in jail.
+        """
+        return len(self.jailed.get(team, ()))
+
+    def countActive(self, team):
+        """
+        Returns how many players of team are out of jail.
+        """
+        return len(self.active.get(team, ()))
+
+class Registry(object):
+    """
+    Every player, flag, jail and no tag zone in one world, in the order
+    they were made. Each controller has its own, so worlds built one
+    after another in the same process never see each other's things,
+    and they all go when the controller does.
+    spare_zones are the no tag zones put away for reuse, and shared
+    the shapes and images everything of a kind shares, by name.
+    """
+    __slots__ = ('players', 'flags', 'jails', 'no_tag_zones', 'spare_zones',
+                 'shared')
+
+    def __init__(self):
+        self.players = []
+        self.flags = []
+        self.jails = []
+        self.no_tag_zones = []
+        self.spare_zones = []
+        self.shared = {}
+
+    def getShared(self, name, make):
+        """
+        Returns the shape or image shared under name, calling make to
+        make it the first time. Shapes and images never change once
+        made, so one of each does for the whole world.
+        """
+        if name not in self.shared:
+            self.shared[name] = make()
+        return self.shared[name]
+
+def playerOrder(player):
+    """
+    Sort key putting players in the order they were made.
+    """
+    return player.state_index
+
+def stateProperty(name, convert, doc):
+    """
+    Makes a property that reads and writes a player's entry in the
+    named WorldState array. convert turns array values back into
+    plain python values.
+    """
+    def get(self):
+        return convert(getattr(self.world_state, name)[self.state_index])
+
+    def set(self, value):
+        getattr(self.world_state, name)[self.state_index] = value
+
+    return property(get, set, doc=doc)
+
+def headings(angle):
+    """
+    Returns the heading of players turned to each angle.
+    This is the rotation setAngle gives the agent shape applied to
+    (0, 1, 0), worked out longhand so it rounds the same way.
+    """
+    c = numpy.cos(angle)
+    s = numpy.sin(angle)
+    return numpy.concatenate([
+        (s * SIN_TILT)[..., numpy.newaxis],
+        (((1.0 - c) + c) * COS_TILT)[..., numpy.newaxis],
+        (-(c * SIN_TILT))[..., numpy.newaxis]], axis=-1)
+
+def signedAngle(position, heading, angle, point):
+    """
+    Returns the angle from a player's heading to point, negative when
+    point is to its left. position, heading and point are (x, y, z)
+    tuples, angle is the player's turning angle.
+
+    This is what getAngle used to ask the engine for (the angle between
+    heading and the offset, signed by the offset in the player's own
+    frame), worked out longhand so it rounds the same way. The x axis
+    of the rotation setAngle gives a player is (cos, 0, sin) of its
+    angle, the tilt drops out.
+    """
+    x = point[0] - position[0]
+    y = point[1] - position[1]
+    z = point[2] - position[2]
+    hx, hy, hz = heading
+
+    lengths = math.sqrt(hx * hx + hy * hy + hz * hz) * \
+            math.sqrt(x * x + y * y + z * z)
+    if lengths == 0.0:
+        a = 0.0
+    else:
+        cosine = (hx * x + hy * y + hz * z) / lengths
+        a = math.acos(max(-1.0, min(1.0, cosine)))
+
+    if math.cos(angle) * x + math.sin(angle) * z < 0.0:
+        return -a
+    return a
+
+def signedAngles(position, heading, angle, points):
+    """
+    signedAngle for many points at once, an N by 3 array or a list of
+    vectors. Returns an array of N angles.
+    """
+    if not isinstance(points, numpy.ndarray):
+        points = numpy.array([(p.x, p.y, p.z) for p in points], numpy.float64)
+    points = points.reshape(-1, 3)
+
+    x = points[:, 0] - position[0]
+    y = points[:, 1] - position[1]
+    z = points[:, 2] - position[2]
+    hx, hy, hz = heading
+
+    lengths = math.sqrt(hx * hx + hy * hy + hz * hz) * \
+            numpy.sqrt(x * x + y * y + z * z)
+    zero = lengths == 0.0
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        cosine = (hx * x + hy * y + hz * z) / lengths
+    a = numpy.arccos(numpy.clip(cosine, -1.0, 1.0))
+    a[zero] = 0.0
+
+    left = math.cos(angle) * x + math.sin(angle) * z < 0.0
+    a[left] = -a[left]
+    return a
+
+def integrate(position, heading, velocity, angle, speed, at_edge, active,
+        dt, edge):
+    """
+    Moves every player one step, in place. The same steps
+    CTFPlayer.iterate takes one player at a time:
+
+    - players past the edge of the world (+-edge) heading further out
+      stop, going by the heading from the last step,
+    - active players get a new heading from their angle,
+    - and a velocity of half their speed along it,
+    - active players hover at HOVER_HEIGHT,
+    - everybody moves by their velocity. Inactive (jailed) players keep
+      the velocity they had, just like the engine would.
+
+    Works on arrays with any number of leading dimensions.
+    """
+    x = position[..., 0]
+    z = position[..., 2]
+    hx = heading[..., 0]
+    hz = heading[..., 2]
+
+    stop = ((x > edge) & (hx > 0.0)) | ((z > edge) & (hz > 0.0)) | \
+           ((x < -edge) & (hx < 0.0)) | ((z < -edge) & (hz < 0.0))
+    stop &= active
+    speed[stop] = 0.0
+    at_edge[active] = stop[active]
+
+    heading[active] = headings(angle[active])
+    velocity[active] = (0.5 * speed[active])[..., numpy.newaxis] * heading[active]
+    position[..., 1][active] = HOVER_HEIGHT
+    position += velocity * dt
@@ -0,0 +1,242 @@
+"""
+Plays a tournament with its matches spread over a pool of processes.
+
+CTFController plays its matches one after another in a single world.
+This runs each match as a separate headless world in a multiprocessing
+pool, gives every match its own seed, and adds up the results the same
+way reportTournamentWinner does. Each worker builds and tears down one
+world after another, every world keeps its things in its own registry
+so they never see each other.
+
+    python tournament.py --games 32 --seed 7 ctftemplate.py
+
+With --checkpoint DIR every match saves itself to DIR as it goes (see
+checkpoint.py) and its result once it's over. Running the same
+tournament again with the same DIR and base seed skips the matches that
+finished and picks the others up from their last checkpoint.
+"""
+import cPickle
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+from StringIO import StringIO
+
+import headless
+headless.install()
+
+import ctf
+from profiler import ProfileStats
+from rating import decided
+from watchdog import reportOverruns
+
+def gameSeeds(games, seed=None):
+    """
+    Returns one seed per game. The same base seed always gives
+    the same seeds, so a tournament can be replayed.
+    """
+    if seed is None:
+        seed = random.randint(0, sys.maxint)
+    return [seed + game for game in range(games)]
+
+def playGame(job):
+    """
+    Plays a single match in a fresh world.
+    job is a (bot file, seed, replay file or None, config or None,
+    event log directory or None, checkpoint directory or None,
+    ticks between checkpoints or None) tuple.
+    Returns (red wins, blue wins, ties, console output, profile, overruns).
+    profile is the game's ProfileStats, or None if it wasn't profiled.
+    overruns maps players to iterate overruns, None without a budget.
+    """
+    path, seed, record, config, events, checkpoints, interval = job
+
+    # Finished last time round.
+    checkpoint = result_path = None
+    if checkpoints is not None:
+        checkpoint = os.path.join(checkpoints, 'game-%d.ckpt' % seed)
+        result_path = os.path.join(checkpoints, 'game-%d.result' % seed)
+        if os.path.exists(result_path):
+            return cPickle.load(open(result_path, 'rb'))
+
+    # Keep the game's report so it can be printed in order later.
+    output = StringIO()
+    stdout = sys.stdout
+    sys.stdout = output
+    try:
+        controller = headless.run(path, until=gamePlayed, record=record,
+                seed=seed, config=config, events=events,
+                checkpoint=checkpoint, checkpoint_every=interval)
+    finally:
+        sys.stdout = stdout
+
+    profile = None
+    if controller.profiler:
+        profile = controller.profiler.total
+
+    overruns = None
+    if controller.watchdog is not None:
+        overruns = controller.watchdog.total_overruns
+
+    result = (controller.getRedWins(), controller.getBlueWins(),
+              controller.getTies(), output.getvalue(), profile, overruns)
+    # The worker plays another match next.
+    headless.unload()
+    if result_path is not None:
+        saved = open(result_path + '.tmp', 'wb')
+        cPickle.dump(result, saved, 2)
+        saved.close()
+        os.rename(result_path + '.tmp', result_path)
+    return result
+
+def gamePlayed(controller):
+    """
+    Returns true once the controller has finished one match.
+    """
+    return controller.getRedWins() + controller.getBlueWins() + \
+            controller.getTies() >= 1
+
+def runTournament(path, games=ctf.TOURNAMENT_LENGTH, processes=None,
+        seed=None, quiet=False, record=None, config=None, events=None,
+        sequential=False, checkpoint=None, checkpoint_every=None):
+    """
+    Plays games matches of the bot file at path over a pool of processes.
+    If record is a directory every match is saved there as a replay.
+    If events is a directory every match logs its events there.
+    If checkpoint is a directory matches save themselves there every
+    checkpoint_every ticks, and finished ones aren't played again.
+    config is a ctf.CTFConfig used for every match.
+    With sequential, stops as soon as the winner is decided (see
+    rating.py). Matches count in seed order, so the same seed always
+    stops at the same match.
+    Returns (red wins, blue wins, ties).
+    """
+    jobs = []
+    for game_seed in gameSeeds(games, seed):
+        replay = None
+        if record is not None:
+            replay = os.path.join(record, 'game-%d.ctfr' % game_seed)
+        jobs.append((path, game_seed, replay, config, events, checkpoint,
+                     checkpoint_every))
+
+    if checkpoint is not None and not os.path.isdir(checkpoint):
+        os.makedirs(checkpoint)
+    if record is not None and not os.path.isdir(record):
+        os.makedirs(record)
+
+    pool = multiprocessing.Pool(processes)
+    results = pool.imap(playGame, jobs, chunksize=1)
+
+    red_wins = blue_wins = ties = 0
+    played = 0
+    profile = None
+    overruns = None
+    try:
+        for (path, game_seed, replay, config, events, checkpoint,
+                checkpoint_every), \
+                (red, blue, tie, output, stats, overran) in \
+                itertools.izip(jobs, results):
+            played += 1
+            red_wins += red
+            blue_wins += blue
+            ties += tie
+            if stats is not None:
+                if profile is None:
+                    profile = ProfileStats()
+                profile.merge(stats)
+            if overran is not None:
+                if overruns is None:
+                    overruns = {}
+                for label, count in overran.items():
+                    overruns[label] = overruns.get(label, 0) + count
+
+            if not quiet:
+                print "Game seed: %d" % (game_seed)
+                sys.stdout.write(output)
+
+            if sequential and decided(blue_wins, red_wins, games - played):
+                break
+    finally:
+        # Matches still going after an early stop don't count.
+        pool.terminate()
+        pool.join()
+
+    ctf.reportTournament(red_wins, blue_wins, ties)
+    if played < games:
+        print "Decided after %d of %d matches." % (played, games)
+    if profile is not None:
+        print "Profile for the whole tournament:"
+        profile.report()
+    if overruns is not None:
+        print "Over the whole tournament:"
+        reportOverruns(overruns.items(), sys.stdout)
+    return red_wins, blue_wins, ties
+
+if __name__ == '__main__':
+    import optparse
+
+    parser = optparse.OptionParser(usage='%prog [options] BOT_FILE')
+    parser.add_option('--games', type='int', default=ctf.TOURNAMENT_LENGTH,
+            help='number of matches to play')
+    parser.add_option('--processes', type='int', default=None,
+            help='number of worker processes, defaults to one per CPU')
+    parser.add_option('--seed', type='int', default=None,
+            help='base seed, match n uses seed + n')
+    parser.add_option('--quiet', action='store_true', default=False,
+            help='only print the tournament summary')
+    parser.add_option('--record', default=None,
+            help='save a replay of every match in this directory')
+    parser.add_option('--sequential', action='store_true', default=False,
+            help='stop as soon as the winner is decided, --games at most')
+    parser.add_option('--events', default=None,
+            help="log every match's flag pickups, tags and so on here")
+    parser.add_option('--checkpoint', default=None,
+            help='save matches here as they go, to resume the tournament')
+    parser.add_option('--checkpoint-every', type='int', default=None,
+            help='ticks between checkpoints')
+    parser.add_option('--step', type='float', default=None,
+            help='simulation time per step, see --swept for big ones')
+    parser.add_option('--swept', action='store_true', default=False,
+            help='catch contacts all along each step, for big steps')
+    parser.add_option('--profile', action='store_true', default=False,
+            help='report where the CPU time goes')
+    parser.add_option('--budget', type='float', default=None,
+            help="seconds each player's iterate may take a tick")
+    parser.add_option('--team-budget', type='float', default=None,
+            help='seconds each team may take a tick')
+    parser.add_option('--overrun-policy', default=ctf.OVERRUN_POLICY,
+            choices=['keep', 'skip', 'forfeit'],
+            help='what happens to players over budget: keep, skip or forfeit')
+    parser.add_option('--simultaneous', action='store_true', default=False,
+            help='every player decides from the same snapshot, then all move')
+    parser.add_option('--threads', type='int', default=1,
+            help='threads deciding with --simultaneous')
+    parser.add_option('--team-size', type='int', default=None,
+            help='players per team')
+    parser.add_option('--world-size', type='int', default=None,
+            help='width of the field')
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('expected one bot file')
+
+    config = ctf.CTFConfig(profile=options.profile,
+                           iterate_budget=options.budget,
+                           team_budget=options.team_budget,
+                           overrun_policy=options.overrun_policy,
+                           simultaneous=options.simultaneous,
+                           decision_threads=options.threads)
+    if options.step is not None:
+        config.integration_step = options.step
+    if options.swept:
+        config.swept_contacts = True
+    if options.team_size is not None:
+        config.team_size = options.team_size
+    if options.world_size is not None:
+        config.world_size = options.world_size
+
+    runTournament(args[0], options.games, options.processes,
+            options.seed, options.quiet, options.record, config,
+            options.events, options.sequential, options.checkpoint,
+            options.checkpoint_every)
@@ -0,0 +1,450 @@
+"""
+Many capture the flag arenas stepped at once, for training bots.
+
+CTFController runs one arena at a time and calls into python for every
+player. VecCTFEnv keeps K arenas in arrays with the arena as the first
+dimension and plays the same rules on all of them with numpy, so a step
+costs about the same for 64 arenas as for one:
+
+    env = VecCTFEnv(arenas=64, config=ctf.CTFConfig(team_size=10), seed=1)
+    observations = env.reset()
+    while training:
+        actions = policy(observations)          # arenas x players x 2
+        observations, rewards, done, info = env.step(actions)
+
+Every player in every arena takes an action each step: a speed between
+0 and 1 (setSpeed) and a turn between -1 and 1, in units of the 0.03
+radians turnLeft and turnRight turn by (negative is left). To train one
+side against a fixed policy, fill in the other side's actions yourself.
+env.team says which team each player is on.
+
+Observations are a dictionary of arrays, filled in place every step:
+
+    'self'     arenas x players x SELF_FEATURES, see SELF_FEATURES
+    'objects'  arenas x players x (players + 4) x OBJECT_FEATURES, a row
+               for every player, then the blue and red flags, then the
+               blue and red jails, like CTFPlayer.observe. Rows for
+               things out of sensor range (and the player itself) are
+               all zeros.
+
+Rewards are 1 for every player on the winning team of a match and -1
+for the losers, on the step the match ends, 0 otherwise. An arena whose
+match ended is reset straight away, like resetWorld, and done says which
+ones were. info['winner'] has the winning team of those (-1 for a tie).
+
+The rules are ctf.py's, with a few differences that come from doing
+everything to all arenas at once:
+
+- tags are resolved all at once from where everybody was, rather than
+  one touching pair at a time,
+- there's no pause between matches,
+- random numbers come from numpy, so arenas don't play out like a
+  seeded CTFController game.
+
+    python vecenv.py --arenas 64 --steps 500
+"""
+import numpy
+
+import headless
+headless.install()
+
+import ctf
+from state import headings, integrate
+
+# Radians turnLeft and turnRight turn by.
+TURN = ctf.TURN_ANGLE
+
+# Collision radii, as headless.py works them out: the bounding sphere of
+# AgentShape, the flag's sphere, and half the size of a jail.
+AGENT_RADIUS = ctf.AGENT_RADIUS
+FLAG_RADIUS = ctf.FLAG_RADIUS
+JAIL_HALF = numpy.array(ctf.JAIL_SIZE) / 2.0
+
+# How close to its own unmoved flag a player can't tag.
+NO_TAG_DISTANCE = ctf.NO_TAG_DISTANCE
+
+SELF_FEATURES = ('x', 'z', 'cos_angle', 'sin_angle', 'speed', 'in_jail',
+                 'carrying', 'offsides', 'team')
+
+OBJECT_FEATURES = ('visible', 'dx', 'dz', 'distance', 'bearing', 'same_team',
+                   'in_jail', 'carrying')
+
+# winner values.
+NO_WINNER = -2
+TIE = -1
+
+class VecCTFEnv(object):
+    """
+    arenas capture the flag games played in lockstep.
+    config is a ctf.CTFConfig for the field, teams and timings.
+    """
+
+    def __init__(self, arenas=16, config=None, seed=None):
+        if config is None:
+            config = ctf.CTFConfig()
+        self.config = config
+        self.arenas = arenas
+        self.random = numpy.random.RandomState(seed)
+
+        size = config.team_size
+        players = 2 * size
+        self.players = players
+        self.team = numpy.array([ctf.BLUE_TEAM] * size + [ctf.RED_TEAM] * size,
+                                numpy.int8)
+        self.edge = config.world_size / 2.0
+
+        # Players.
+        shape = (arenas, players)
+        self.position = numpy.zeros(shape + (3,))
+        self.heading = numpy.zeros(shape + (3,))
+        self.velocity = numpy.zeros(shape + (3,))
+        self.angle = numpy.zeros(shape)
+        self.speed = numpy.zeros(shape)
+        self.at_edge = numpy.zeros(shape, bool)
+        self.in_jail = numpy.zeros(shape, bool)
+        self.carrying = numpy.zeros(shape, numpy.int8)      # flag or -1
+
+        # Flags, blue then red, and the jails, which never move.
+        self.flag_team = numpy.array([ctf.BLUE_TEAM, ctf.RED_TEAM], numpy.int8)
+        self.flag_position = numpy.zeros((arenas, 2, 3))
+        self.flag_start = numpy.zeros((arenas, 2, 3))
+        self.carrier = numpy.zeros((arenas, 2), numpy.intp)   # player or -1
+        world_size = config.world_size
+        self.jail_position = numpy.array([
+                (world_size / 2 - 5, 0, world_size / 2 - 5),
+                (-world_size / 2 + 5, 0, -world_size / 2 + 5)], numpy.float64)
+
+        self.ticks = numpy.zeros(arenas, numpy.intp)
+        self.game_ticks = int(round(config.game_length / config.integration_step))
+
+        # What each row of the objects observation is.
+        objects = players + 4
+        self.object_team = numpy.concatenate([self.team, self.flag_team,
+                                              self.flag_team])
+        self.same_team = (self.object_team[numpy.newaxis, :] ==
+                          self.team[:, numpy.newaxis])
+        self.not_me = numpy.ones((players, objects), bool)
+        self.not_me[numpy.arange(players), numpy.arange(players)] = False
+
+        self.observations = {
+            'self': numpy.zeros(shape + (len(SELF_FEATURES),), numpy.float32),
+            'objects': numpy.zeros(shape + (objects, len(OBJECT_FEATURES)),
+                                   numpy.float32),
+        }
+        self.object_position = numpy.zeros((arenas, objects, 3))
+        self.object_position[:, players + 2:] = self.jail_position
+        self.rewards = numpy.zeros(shape, numpy.float32)
+
+    def reset(self):
+        """
+        Starts a new match in every arena. Returns the observations.
+        """
+        everywhere = numpy.ones(self.arenas, bool)
+        self.angle[:] = self.random.uniform(0, 6.29, self.angle.shape)
+        self.heading[:] = headings(self.angle)
+        self.speed[:] = 0.0
+        self.velocity[:] = 0.0
+        self.resetArenas(everywhere)
+        return self.observe()
+
+    def resetArenas(self, arenas):
+        """
+        Starts new matches in the arenas where arenas is true, like
+        resetWorld: the flags go back to random spots on their ends of
+        the field and everybody goes home, free and empty handed.
+        """
+        count = int(arenas.sum())
+        if not count:
+            return
+        world_size = self.config.world_size
+
+        z = self.random.uniform(0, world_size / 2, count) - world_size / 4
+        flags = numpy.zeros((count, 2, 3))
+        flags[:, 0, 0] = -world_size / 2 + 5
+        flags[:, 1, 0] = world_size / 2 - 5
+        flags[:, :, 1] = 1.0
+        flags[:, :, 2] = z[:, numpy.newaxis]
+        self.flag_position[arenas] = flags
+        self.flag_start[arenas] = flags
+        self.carrier[arenas] = -1
+
+        self.carrying[arenas] = -1
+        self.in_jail[arenas] = False
+        everybody = numpy.zeros(self.in_jail.shape, bool)
+        everybody[arenas] = True
+        self.sendHome(everybody)
+        self.ticks[arenas] = 0
+
+    def sendHome(self, players):
+        """
+        Moves players (a mask) to random spots on their home sides,
+        like moveToHomeside.
+        """
+        count = int(players.sum())
+        if not count:
+            return
+        world_size = self.config.world_size
+        team = numpy.broadcast_to(self.team, players.shape)[players]
+        x = self.random.uniform(0, world_size / 4, count)
+        x += numpy.where(team == ctf.RED_TEAM, world_size / 4, -world_size / 4)
+        z = self.random.uniform(0, world_size, count) - world_size / 2
+        self.position[players] = numpy.column_stack([x, numpy.zeros(count), z])
+
+    def sendToJail(self, players):
+        """
+        Drops whatever players (a mask) carry and locks them up in their
+        team's jail, like goToJail.
+        """
+        count = int(players.sum())
+        if not count:
+            return
+        self.drop(players)
+        team = numpy.broadcast_to(self.team, players.shape)[players]
+        spot = self.jail_position[team].copy()
+        spot[:, 0] += self.random.uniform(0, 1, count) - 0.5
+        spot[:, 1] += 0.5
+        spot[:, 2] += self.random.uniform(0, 1, count) - 0.5
+        self.position[players] = spot
+        self.velocity[players] = 0.0
+        self.in_jail[players] = True
+
+    def drop(self, players):
+        """
+        Makes players (a mask) drop the flags they carry.
+        """
+        arena, player = numpy.nonzero(players & (self.carrying >= 0))
+        self.carrier[arena, self.carrying[arena, player]] = -1
+        self.carrying[arena, player] = -1
+
+    def offsides(self, x, team):
+        """
+        Returns true where a player of team at x is on the other side,
+        like CTFMobile.checkIfOffsides.
+        """
+        return numpy.where(team == ctf.RED_TEAM, x < 0.0, x > 0.0)
+
+    def step(self, actions):
+        """
+        Plays one tick in every arena. actions is arenas x players x 2,
+        speed and turn. Returns (observations, rewards, done, info).
+        """
+        actions = numpy.asarray(actions, numpy.float64)
+        active = ~self.in_jail
+
+        # What the players' iterates would have done.
+        speed = numpy.clip(actions[..., 0], 0.0, 1.0)
+        self.speed[active] = speed[active]
+        turn = numpy.clip(actions[..., 1], -1.0, 1.0) * TURN
+        self.angle[active] += turn[active]
+
+        # Carried flags follow their carriers, a step behind.
+        arena, flag = numpy.nonzero(self.carrier >= 0)
+        carried = self.position[arena, self.carrier[arena, flag]]
+        self.flag_position[arena, flag] = carried
+        self.flag_position[..., 0::2] = numpy.clip(
+                self.flag_position[..., 0::2], -self.edge, self.edge)
+
+        integrate(self.position, self.heading, self.velocity, self.angle,
+                  self.speed, self.at_edge, active,
+                  self.config.integration_step, self.edge)
+        self.ticks += 1
+
+        # Collisions, then the controller's tags and rules.
+        self.pickUpFlags()
+        self.breakJails()
+        self.resolveTags()
+        winner = self.findWinners()
+
+        done = winner != NO_WINNER
+        rewards = self.rewards
+        rewards[:] = 0.0
+        if done.any():
+            won = self.team[numpy.newaxis, :] == winner[:, numpy.newaxis]
+            rewards[done] = numpy.where(won, 1.0, -1.0)[done]
+            rewards[winner == TIE] = 0.0
+            self.resetArenas(done)
+
+        return self.observe(), rewards, done, {'winner': winner}
+
+    def pickUpFlags(self):
+        """
+        Free, empty handed players touching the other team's flag pick
+        it up, if nobody has it. The first player in order gets it.
+        """
+        offset = self.position[:, :, numpy.newaxis] - \
+                self.flag_position[:, numpy.newaxis]
+        reach = AGENT_RADIUS + FLAG_RADIUS
+        touching = (offset * offset).sum(axis=-1) <= reach * reach
+        touching &= (self.team[:, numpy.newaxis] !=
+                     self.flag_team[numpy.newaxis, :])[numpy.newaxis]
+        touching &= (~self.in_jail & (self.carrying < 0))[:, :, numpy.newaxis]
+        touching &= (self.carrier < 0)[:, numpy.newaxis, :]
+
+        arena, flag = numpy.nonzero(touching.any(axis=1))
+        player = touching[arena, :, flag].argmax(axis=1)
+        self.carrier[arena, flag] = player
+        self.carrying[arena, player] = flag
+
+    def breakJails(self):
+        """
+        A free player touching its own team's jail frees its teammates.
+        """
+        offset = numpy.abs(self.position[:, :, numpy.newaxis] -
+                           self.jail_position[numpy.newaxis, numpy.newaxis])
+        gap = numpy.maximum(offset - JAIL_HALF, 0.0)
+        touching = (gap * gap).sum(axis=-1) <= AGENT_RADIUS * AGENT_RADIUS
+        own = self.team[:, numpy.newaxis] == self.flag_team[numpy.newaxis, :]
+        breaking = (touching & own[numpy.newaxis] &
+                    ~self.in_jail[:, :, numpy.newaxis]).any(axis=1)
+
+        freed = self.in_jail & breaking[:, self.team]
+        if freed.any():
+            self.sendHome(freed)
+            self.in_jail[freed] = False
+
+    def resolveTags(self):
+        """
+        Opponents within tag distance of each other try to tag each
+        other. A player outside the no tag zone around its own unmoved
+        flag sends an offsides opponent it touches to jail.
+        """
+        active = ~self.in_jail
+        position = self.position
+        offset = position[:, :, numpy.newaxis] - position[:, numpy.newaxis]
+        reach = self.config.tag_distance
+        touching = (offset * offset).sum(axis=-1) <= reach * reach
+        touching &= (self.team[:, numpy.newaxis] !=
+                     self.team[numpy.newaxis, :])[numpy.newaxis]
+        touching &= active[:, :, numpy.newaxis] & active[:, numpy.newaxis]
+
+        # Own flag for each player, and whether it's left its spot.
+        flag = self.flag_position[:, self.team]
+        start = self.flag_start[:, self.team]
+        moved = ((flag - start) ** 2).sum(axis=-1) >= NO_TAG_DISTANCE ** 2
+        near = ((flag - position) ** 2).sum(axis=-1) <= NO_TAG_DISTANCE ** 2
+        safe = near & ~moved
+
+        tagged = (touching & ~safe[:, :, numpy.newaxis]).any(axis=1)
+        tagged &= self.offsides(position[..., 0], self.team)
+        self.sendToJail(tagged)
+
+    def findWinners(self):
+        """
+        Returns the winning team of every arena whose match just ended,
+        TIE if time ran out, or NO_WINNER. Checked in the same order as
+        CTFController.iterate, the first one that applies counts.
+        """
+        winner = numpy.empty(self.arenas, numpy.int8)
+        winner[:] = NO_WINNER
+        blue = self.team == ctf.BLUE_TEAM
+        red = ~blue
+
+        flag_x = self.flag_position[:, :, 0]
+        checks = [
+            (self.in_jail[:, red].all(axis=1), ctf.BLUE_TEAM),
+            (self.in_jail[:, blue].all(axis=1), ctf.RED_TEAM),
+            (flag_x[:, ctf.BLUE_TEAM] > 0.0, ctf.RED_TEAM),
+            (flag_x[:, ctf.RED_TEAM] < 0.0, ctf.BLUE_TEAM),
+            (self.ticks >= self.game_ticks, TIE),
+        ]
+        for happened, team in checks:
+            winner[(winner == NO_WINNER) & happened] = team
+        return winner
+
+    def observe(self):
+        """
+        Fills in and returns the observations.
+        """
+        players = self.players
+        position = self.position
+        heading = self.heading
+
+        objects = self.object_position
+        objects[:, :players] = position
+        objects[:, players:players + 2] = self.flag_position
+
+        # Offsets, distances and bearings, the sums signedAngle does.
+        offset = objects[:, numpy.newaxis] - position[:, :, numpy.newaxis]
+        x = offset[..., 0]
+        y = offset[..., 1]
+        z = offset[..., 2]
+        distance = numpy.sqrt(x * x + y * y + z * z)
+        hx = heading[..., 0][..., numpy.newaxis]
+        hy = heading[..., 1][..., numpy.newaxis]
+        hz = heading[..., 2][..., numpy.newaxis]
+        lengths = numpy.sqrt(hx * hx + hy * hy + hz * hz) * distance
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            cosine = (hx * x + hy * y + hz * z) / lengths
+        bearing = numpy.arccos(numpy.clip(cosine, -1.0, 1.0))
+        bearing[lengths == 0.0] = 0.0
+        angle = self.angle[..., numpy.newaxis]
+        left = numpy.cos(angle) * x + numpy.sin(angle) * z < 0.0
+        bearing[left] = -bearing[left]
+
+        visible = distance < self.config.sensor_distance
+        visible[:, :, players + 2:] = True
+        visible &= self.not_me
+
+        in_jail = numpy.zeros(visible.shape, bool)
+        in_jail[:, :, :players] = self.in_jail[:, numpy.newaxis]
+        carrying = numpy.zeros(visible.shape, bool)
+        carrying[:, :, :players] = (self.carrying >= 0)[:, numpy.newaxis]
+        carrying[:, :, players:players + 2] = (self.carrier >= 0)[:, numpy.newaxis]
+
+        seen = self.observations['objects']
+        for i, value in enumerate([visible, x, z, distance, bearing,
+                                   self.same_team, in_jail, carrying]):
+            seen[..., i] = value
+        seen *= visible[..., numpy.newaxis]
+
+        me = self.observations['self']
+        me[..., 0] = position[..., 0] / self.edge
+        me[..., 1] = position[..., 2] / self.edge
+        me[..., 2] = numpy.cos(self.angle)
+        me[..., 3] = numpy.sin(self.angle)
+        me[..., 4] = self.speed
+        me[..., 5] = self.in_jail
+        me[..., 6] = self.carrying >= 0
+        me[..., 7] = self.offsides(position[..., 0], self.team)
+        me[..., 8] = self.team
+        return self.observations
+
+    def close(self):
+        pass
+
+if __name__ == '__main__':
+    import optparse
+    import time
+
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--arenas', type='int', default=64,
+            help='arenas to step at once')
+    parser.add_option('--steps', type='int', default=500,
+            help='steps to time')
+    parser.add_option('--seed', type='int', default=1,
+            help='seed for the arenas and the random actions')
+    parser.add_option('--team-size', type='int', default=None,
+            help='players per team')
+    options, args = parser.parse_args()
+
+    config = ctf.CTFConfig()
+    if options.team_size is not None:
+        config.team_size = options.team_size
+    env = VecCTFEnv(options.arenas, config, options.seed)
+    env.reset()
+
+    # Full speed ahead with random turns.
+    random = numpy.random.RandomState(options.seed)
+    actions = numpy.ones((env.arenas, env.players, 2))
+    matches = 0
+    start = time.time()
+    for step in range(options.steps):
+        actions[..., 1] = random.uniform(-1, 1, (env.arenas, env.players))
+        observations, rewards, done, info = env.step(actions)
+        matches += int(done.sum())
+    elapsed = time.time() - start
+
+    print '%d arenas of %d players, %d steps in %.2fs' % (env.arenas,
+            env.players, options.steps, elapsed)
+    print '%.0f agent steps per second, %d matches finished' % (
+            options.steps * env.arenas * env.players / elapsed, matches)
@@ -0,0 +1,261 @@
+"""
+Time budgets for player iterate calls.
+
+Every player iterates on the same thread, so one slow bot holds up the
+whole world. With a budget set (CTFConfig(iterate_budget=...) and/or
+team_budget=...) every player's iterate is cut off once it runs over,
+and the overrun policy decides what happens to that player this tick:
+
+    'keep'     it carries on with the speed and angle it had before,
+    'skip'     it sits the tick out and stops where it is for the tick,
+               then carries on at its old speed,
+    'forfeit'  its team forfeits the match.
+
+The team budget is shared by everybody on a team each tick. Once it is
+used up the rest of the team doesn't get to iterate at all that tick,
+which counts as an overrun for each of them.
+
+Iterate calls are cut off with SIGALRM, so that only works on the main
+thread of a unix process. Anywhere else overruns are noticed once the
+call returns and the policy is applied then. A player that had already
+moved by then keeps the move, it isn't moved a second time. The alarm
+is held off while CTFPlayer.iterate does the world's bookkeeping, and
+goes off once it's done.
+"""
+import signal
+import sys
+import threading
+import time
+
+POLICIES = ('keep', 'skip', 'forfeit')
+
+class IterateTimeout(BaseException):
+    """
+    Raised inside a player's iterate when it runs out of time.
+    Not an Exception, so bots that catch Exception don't swallow it.
+    """
+    pass
+
+class Watchdog(object):
+    """
+    Enforces the iterate budgets of one controller's players.
+    Budgets are in seconds, None for no limit.
+    """
+
+    def __init__(self, controller, budget=None, team_budget=None,
+            policy='keep', clock=time.time):
+        if policy not in POLICIES:
+            raise ValueError('unknown overrun policy %r, expected one of %s' %
+                             (policy, ', '.join(POLICIES)))
+        self.controller = controller
+        self.budget = budget
+        self.team_budget = team_budget
+        self.policy = policy
+        self.clock = clock
+
+        self.overruns = {}          # player -> overruns this match
+        self.total_overruns = {}    # label -> overruns in every match so far
+        self.team_used = {}         # team -> seconds used this tick
+        self.stopped = []           # (player, speed) skipping this tick
+        self.armed = False
+        self.holding = 0            # hold() calls not released yet
+        self.late = False           # the alarm went off while held
+
+        # Only the main thread can take signals. Pool workers forked
+        # off a helper thread count as main in their own process.
+        self.interrupt = False
+        self.thread = threading.current_thread()
+        if hasattr(signal, 'setitimer'):
+            try:
+                signal.signal(signal.SIGALRM, self.timeUp)
+                self.interrupt = True
+            except ValueError:
+                pass
+
+    def timeUp(self, signum, frame):
+        if self.armed:
+            self.armed = False
+            if self.holding:
+                self.late = True
+            else:
+                raise IterateTimeout()
+
+    def hold(self):
+        """
+        Holds off the alarm until release(), while the world's own
+        bookkeeping runs in a player's time. Only the thread that takes
+        the alarm holds it off.
+        """
+        if threading.current_thread() is self.thread:
+            self.holding += 1
+
+    def release(self):
+        """
+        Lets the alarm go off again, straight away if it was due.
+        """
+        if threading.current_thread() is not self.thread:
+            return
+        self.holding -= 1
+        if not self.holding and self.late:
+            self.late = False
+            raise IterateTimeout()
+
+    def watch(self, player):
+        """
+        Wraps player's iterate so it sticks to the budget.
+        """
+        self.overruns[player] = 0
+        iterate = player.iterate
+
+        def guardedIterate():
+            return self.run(player, iterate)
+        player.iterate = guardedIterate
+
+    def tick(self):
+        """
+        Starts a new tick, everybody gets their full budget back.
+        """
+        self.team_used.clear()
+
+    def allowance(self, team):
+        """
+        Returns the time a player on team may use now, or None if
+        there is no limit.
+        """
+        allowed = self.budget
+        if self.team_budget is not None:
+            left = self.team_budget - self.team_used.get(team, 0.0)
+            if allowed is None or left < allowed:
+                allowed = left
+        return allowed
+
+    def run(self, player, iterate):
+        """
+        Calls iterate within player's allowance.
+        """
+        team = player.getTeam()
+        allowed = self.allowance(team)
+        if allowed is None:
+            return iterate()
+
+        player.moved_this_tick = False
+        if allowed <= 0.0:
+            # The team has used up this tick already.
+            self.overrun(player, player.velocity, player.angle)
+            return
+
+        speed = player.velocity
+        angle = player.angle
+        timed_out = False
+
+        # The alarm goes to the thread that set up the handler,
+        # players deciding on other threads are only checked after.
+        interrupt = self.interrupt and threading.current_thread() is self.thread
+
+        start = self.clock()
+        try:
+            # The alarm can go off before iterate even starts, or on the
+            # way out of it, so it's armed and disarmed inside the try.
+            try:
+                if interrupt:
+                    self.armed = True
+                    signal.setitimer(signal.ITIMER_REAL, allowed)
+                iterate()
+            finally:
+                if interrupt:
+                    self.armed = False
+                    self.late = False
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        except IterateTimeout:
+            timed_out = True
+
+        used = self.clock() - start
+        self.team_used[team] = self.team_used.get(team, 0.0) + used
+
+        if timed_out or used > allowed:
+            self.overrun(player, speed, angle)
+
+    def overrun(self, player, speed, angle):
+        """
+        Applies the overrun policy to player. speed and angle are its
+        controls from before this tick's iterate.
+        """
+        self.overruns[player] = self.overruns.get(player, 0) + 1
+
+        if self.policy == 'forfeit':
+            self.controller.forfeit(player.getTeam())
+            return
+
+        # Undo whatever the bot got done.
+        player.setSpeed(speed)
+        if player.angle != angle:
+            player.setAngle(angle)
+
+        # Then move like it didn't iterate, unless the bot got as far as
+        # moving before it was found out. Moving again would turn it and
+        # carry its flag twice. Batched moves only happen once everybody
+        # has iterated, so those can still be stopped.
+        batched = self.controller.batched_movement
+        stopping = self.policy == 'skip' and \
+                   (batched or not player.moved_this_tick)
+        if stopping:
+            player.setSpeed(0)
+        if not player.moved_this_tick:
+            from ctf import CTFPlayer
+            CTFPlayer.iterate(player)
+
+        # Stopping is only for this tick's move. Batched moves happen
+        # after everybody iterates, the controller calls moved() then.
+        if stopping:
+            if batched:
+                self.stopped.append((player, speed))
+            else:
+                player.setSpeed(speed)
+
+    def moved(self):
+        """
+        Called once everybody has moved this tick. Players that skipped
+        the tick get their speed back.
+        """
+        for player, speed in self.stopped:
+            player.setSpeed(speed)
+        del self.stopped[:]
+
+    def endMatch(self, out=None):
+        """
+        Reports the overruns of the match that just finished.
+        """
+        if out is None:
+            out = sys.stdout
+
+        from profiler import playerLabel
+        over = []
+        for player, count in self.overruns.items():
+            if count:
+                label = playerLabel(player)
+                over.append((label, count))
+                self.total_overruns[label] = self.total_overruns.get(label, 0) + count
+            self.overruns[player] = 0
+
+        reportOverruns(over, out)
+
+    def endTournament(self, out=None):
+        """
+        Reports the overruns of every match.
+        """
+        if out is None:
+            out = sys.stdout
+        out.write("Over the whole tournament:\n")
+        reportOverruns(self.total_overruns.items(), out)
+
+def reportOverruns(overruns, out):
+    """
+    Prints (label, count) overruns, worst first.
+    """
+    if not overruns:
+        out.write("No iterate overruns.\n")
+        return
+
+    out.write("Iterate overruns:\n")
+    for label, count in sorted(overruns, key=lambda item: (-item[1], item[0])):
+        out.write("  %-32s %d\n" % (label, count))